@@ -1,4 +1,5 @@
 import os
+import secrets
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,8 +14,79 @@ class AppConfig:
         self.model_temperature = float(os.getenv("MODEL_TEMPERATURE", "0.7"))
         self.model_max_tokens = int(os.getenv("MODEL_MAX_TOKENS", "1024"))
         self.model_top_p = float(os.getenv("MODEL_TOP_P", "1.0"))
+        self.model_context_tokens = int(os.getenv("MODEL_CONTEXT_TOKENS", "8192"))
+        self.agent_max_concurrency = int(os.getenv("AGENT_MAX_CONCURRENCY", "64"))
+        self.turn_deadline_seconds = float(os.getenv("TURN_DEADLINE_SECONDS", "60"))
+        self.tenants_file = os.getenv("TENANTS_FILE", "")
+        self.agent_cache_size = int(os.getenv("AGENT_CACHE_SIZE", "32"))
+        self.upstreams = os.getenv("UPSTREAMS", "")
+        self.upstream_hedge_after_ms = int(os.getenv("UPSTREAM_HEDGE_AFTER_MS", "0"))
+        self.upstream_ewma_alpha = float(os.getenv("UPSTREAM_EWMA_ALPHA", "0.2"))
+        self.upstream_eject_after_failures = int(os.getenv("UPSTREAM_EJECT_AFTER_FAILURES", "3"))
+        self.upstream_eject_seconds = float(os.getenv("UPSTREAM_EJECT_SECONDS", "30"))
+        self.upstream_half_open_probes = int(os.getenv("UPSTREAM_HALF_OPEN_PROBES", "1"))
+        self.upstream_stream_usage = os.getenv("UPSTREAM_STREAM_USAGE", "true").lower() == "true"
+        self.upstream_max_connections = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", str(self.agent_max_concurrency)))
+        self.upstream_max_keepalive = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", str(self.agent_max_concurrency)))
+        self.upstream_keepalive_expiry_seconds = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY_SECONDS", "60"))
+        self.upstream_connect_timeout_seconds = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT_SECONDS", "5"))
+        self.upstream_read_timeout_seconds = float(os.getenv("UPSTREAM_READ_TIMEOUT_SECONDS", "60"))
+        self.upstream_pool_timeout_seconds = float(os.getenv("UPSTREAM_POOL_TIMEOUT_SECONDS", "10"))
+        self.upstream_http2 = os.getenv("UPSTREAM_HTTP2", "false").lower() == "true"
+        self.upstream_max_retries = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+        self.upstream_retry_budget_ratio = float(os.getenv("UPSTREAM_RETRY_BUDGET_RATIO", "0.2"))
+        self.upstream_retry_min_per_second = float(os.getenv("UPSTREAM_RETRY_MIN_PER_SECOND", "1"))
+        self.upstream_retry_backoff_ms = int(os.getenv("UPSTREAM_RETRY_BACKOFF_MS", "100"))
+        self.upstream_retry_backoff_max_ms = int(os.getenv("UPSTREAM_RETRY_BACKOFF_MAX_MS", "2000"))
+        self.upstream_warmup = os.getenv("UPSTREAM_WARMUP", "true").lower() == "true"
+        self.upstream_warmup_connections = int(os.getenv("UPSTREAM_WARMUP_CONNECTIONS", "2"))
+        self.admission_max_in_flight = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", str(self.agent_max_concurrency)))
+        self.admission_max_queue = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))
+        self.admission_queue_timeout_seconds = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "30"))
+        self.client_rate_per_second = float(os.getenv("CLIENT_RATE_PER_SECOND", "0.5"))
+        self.client_rate_burst = int(os.getenv("CLIENT_RATE_BURST", "5"))
+        self.tool_timeout_seconds = float(os.getenv("TOOL_TIMEOUT_SECONDS", "10"))
+        self.tool_parallel_calls = int(os.getenv("TOOL_PARALLEL_CALLS", "4"))
+        self.tool_max_workers = int(os.getenv("TOOL_MAX_WORKERS", "16"))
+        self.tool_cache_max_entries = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1024"))
+        self.chat_batch_max_size = int(os.getenv("CHAT_BATCH_MAX_SIZE", "100"))
+        self.chat_batch_concurrency = int(os.getenv("CHAT_BATCH_CONCURRENCY", "8"))
+        self.streaming_enabled = os.getenv("STREAMING_ENABLED", "true").lower() == "true"
+        self.stream_flush_interval_ms = int(os.getenv("STREAM_FLUSH_INTERVAL_MS", "50"))
+        self.stream_flush_chars = int(os.getenv("STREAM_FLUSH_CHARS", "48"))
+        self.single_flight_enabled = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+        self.response_cache_enabled = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+        self.response_cache_max_entries = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+        self.response_cache_ttl_seconds = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "300"))
+        self.conversation_store = os.getenv("CONVERSATION_STORE", "memory")
+        self.conversation_db_path = os.getenv("CONVERSATION_DB_PATH", "conversations.db")
+        self.conversation_max_sessions = int(os.getenv("CONVERSATION_MAX_SESSIONS", "10000"))
+        self.conversation_max_messages = int(os.getenv("CONVERSATION_MAX_MESSAGES", "50"))
+        self.conversation_flush_interval_ms = int(os.getenv("CONVERSATION_FLUSH_INTERVAL_MS", "500"))
+        self.conversation_flush_batch_size = int(os.getenv("CONVERSATION_FLUSH_BATCH_SIZE", "256"))
+        # Signs conversation ids; the random default is shared by preforked workers but not across restarts
+        self.session_secret = os.getenv("SESSION_SECRET") or secrets.token_urlsafe(32)
+        self.outbound_queue_size = int(os.getenv("OUTBOUND_QUEUE_SIZE", "256"))
+        self.outbound_overflow_policy = os.getenv("OUTBOUND_OVERFLOW_POLICY", "drop_typing,coalesce_deltas")
+        self.outbound_send_timeout_seconds = float(os.getenv("OUTBOUND_SEND_TIMEOUT_SECONDS", "10"))
+        self.ws_default_protocol = os.getenv("WS_DEFAULT_PROTOCOL", "json")
+        self.ws_per_message_deflate = os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() == "true"
+        self.ws_ping_interval_seconds = float(os.getenv("WS_PING_INTERVAL_SECONDS", "20"))
+        self.ws_ping_timeout_seconds = float(os.getenv("WS_PING_TIMEOUT_SECONDS", "20"))
+        self.ws_idle_timeout_seconds = float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", "900"))
+        self.shutdown_drain_seconds = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "20"))
+        self.shutdown_reconnect_spread_seconds = float(os.getenv("SHUTDOWN_RECONNECT_SPREAD_SECONDS", "10"))
+        self.message_bus = os.getenv("MESSAGE_BUS", "local")
+        self.message_bus_url = os.getenv("MESSAGE_BUS_URL", "unix:///tmp/chat-assistant-bus.sock")
+        self.message_bus_embed_broker = os.getenv("MESSAGE_BUS_EMBED_BROKER", "true").lower() == "true"
+        self.message_bus_token = os.getenv("MESSAGE_BUS_TOKEN", "")
+        self.message_bus_stats_interval_seconds = float(os.getenv("MESSAGE_BUS_STATS_INTERVAL_SECONDS", "5"))
+        self.admin_token = os.getenv("ADMIN_TOKEN", "")
+        self.loop_lag_interval_ms = int(os.getenv("LOOP_LAG_INTERVAL_MS", "100"))
+        self.metrics_enabled = os.getenv("METRICS_ENABLED", "true").lower() == "true"
         self.host = os.getenv("HOST", "0.0.0.0")
         self.port = int(os.getenv("PORT", "8000"))
+        self.workers = int(os.getenv("WORKERS", "1"))
         self.cors_origins = os.getenv(
             "CORS_ORIGINS", "http://localhost:3000,http://localhost:5173"
         ).split(",")
@@ -31,8 +103,77 @@ class AppConfig:
             "model_temperature": self.model_temperature,
             "model_max_tokens": self.model_max_tokens,
             "model_top_p": self.model_top_p,
+            "model_context_tokens": self.model_context_tokens,
+            "agent_max_concurrency": self.agent_max_concurrency,
+            "turn_deadline_seconds": self.turn_deadline_seconds,
+            "tenants_file": self.tenants_file,
+            "agent_cache_size": self.agent_cache_size,
+            "upstreams": self.upstreams,
+            "upstream_hedge_after_ms": self.upstream_hedge_after_ms,
+            "upstream_ewma_alpha": self.upstream_ewma_alpha,
+            "upstream_eject_after_failures": self.upstream_eject_after_failures,
+            "upstream_eject_seconds": self.upstream_eject_seconds,
+            "upstream_half_open_probes": self.upstream_half_open_probes,
+            "upstream_stream_usage": self.upstream_stream_usage,
+            "upstream_max_connections": self.upstream_max_connections,
+            "upstream_max_keepalive": self.upstream_max_keepalive,
+            "upstream_keepalive_expiry_seconds": self.upstream_keepalive_expiry_seconds,
+            "upstream_connect_timeout_seconds": self.upstream_connect_timeout_seconds,
+            "upstream_read_timeout_seconds": self.upstream_read_timeout_seconds,
+            "upstream_pool_timeout_seconds": self.upstream_pool_timeout_seconds,
+            "upstream_http2": self.upstream_http2,
+            "upstream_max_retries": self.upstream_max_retries,
+            "upstream_retry_budget_ratio": self.upstream_retry_budget_ratio,
+            "upstream_retry_min_per_second": self.upstream_retry_min_per_second,
+            "upstream_retry_backoff_ms": self.upstream_retry_backoff_ms,
+            "upstream_retry_backoff_max_ms": self.upstream_retry_backoff_max_ms,
+            "upstream_warmup": self.upstream_warmup,
+            "upstream_warmup_connections": self.upstream_warmup_connections,
+            "admission_max_in_flight": self.admission_max_in_flight,
+            "admission_max_queue": self.admission_max_queue,
+            "admission_queue_timeout_seconds": self.admission_queue_timeout_seconds,
+            "client_rate_per_second": self.client_rate_per_second,
+            "client_rate_burst": self.client_rate_burst,
+            "tool_timeout_seconds": self.tool_timeout_seconds,
+            "tool_parallel_calls": self.tool_parallel_calls,
+            "tool_max_workers": self.tool_max_workers,
+            "tool_cache_max_entries": self.tool_cache_max_entries,
+            "chat_batch_max_size": self.chat_batch_max_size,
+            "chat_batch_concurrency": self.chat_batch_concurrency,
+            "streaming_enabled": self.streaming_enabled,
+            "stream_flush_interval_ms": self.stream_flush_interval_ms,
+            "stream_flush_chars": self.stream_flush_chars,
+            "single_flight_enabled": self.single_flight_enabled,
+            "response_cache_enabled": self.response_cache_enabled,
+            "response_cache_max_entries": self.response_cache_max_entries,
+            "response_cache_ttl_seconds": self.response_cache_ttl_seconds,
+            "conversation_store": self.conversation_store,
+            "conversation_db_path": self.conversation_db_path,
+            "conversation_max_sessions": self.conversation_max_sessions,
+            "conversation_max_messages": self.conversation_max_messages,
+            "conversation_flush_interval_ms": self.conversation_flush_interval_ms,
+            "conversation_flush_batch_size": self.conversation_flush_batch_size,
+            "outbound_queue_size": self.outbound_queue_size,
+            "outbound_overflow_policy": self.outbound_overflow_policy,
+            "outbound_send_timeout_seconds": self.outbound_send_timeout_seconds,
+            "ws_default_protocol": self.ws_default_protocol,
+            "ws_per_message_deflate": self.ws_per_message_deflate,
+            "ws_ping_interval_seconds": self.ws_ping_interval_seconds,
+            "ws_ping_timeout_seconds": self.ws_ping_timeout_seconds,
+            "ws_idle_timeout_seconds": self.ws_idle_timeout_seconds,
+            "shutdown_drain_seconds": self.shutdown_drain_seconds,
+            "shutdown_reconnect_spread_seconds": self.shutdown_reconnect_spread_seconds,
+            "message_bus": self.message_bus,
+            "message_bus_url": self.message_bus_url,
+            "message_bus_embed_broker": self.message_bus_embed_broker,
+            "message_bus_token": self.message_bus_token,
+            "message_bus_stats_interval_seconds": self.message_bus_stats_interval_seconds,
+            "admin_token": self.admin_token,
+            "loop_lag_interval_ms": self.loop_lag_interval_ms,
+            "metrics_enabled": self.metrics_enabled,
             "host": self.host,
             "port": self.port,
+            "workers": self.workers,
             "cors_origins": self.cors_origins,
             "system_prompt": self.system_prompt,
         }
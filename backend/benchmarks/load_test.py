@@ -0,0 +1,349 @@
+"""
+WebSocket Load Test
+Starts the mock LLM server and main:app, opens N concurrent WebSocket clients and
+reports throughput, latency percentiles, time-to-first-token, per-connection RSS
+and event-loop lag as JSON, so runs can be compared across releases.
+
+    python benchmarks/load_test.py --clients 200 --messages 5 --output results.json
+    python benchmarks/load_test.py --url http://localhost:8000 --clients 50   # existing server
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import websockets
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """Nearest-rank percentiles in milliseconds"""
+    if not values:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, max(0, int(len(ordered) * p + 0.5) - 1))] * 1000, 2)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p50": rank(0.50),
+        "p95": rank(0.95),
+        "p99": rank(0.99),
+        "max": round(ordered[-1] * 1000, 2),
+    }
+
+
+def http_get_json(url: str, timeout: float = 5.0) -> dict:
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+async def get_status(base_url: str) -> dict:
+    return await asyncio.to_thread(http_get_json, f"{base_url}/status")
+
+
+async def wait_until_ready(url: str, process: Optional[subprocess.Popen], timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Process for {url} exited with code {process.returncode}")
+        try:
+            await asyncio.to_thread(http_get_json, url, 1.0)
+            return
+        except Exception:
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"{url} did not become ready within {timeout}s")
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+# Compact frame type codes (see services/websocket/codec.py)
+COMPACT_TYPES = {"a": "assistant", "d": "assistant_delta", "f": "assistant_done", "e": "error"}
+
+
+def decode_frame(raw) -> Tuple[Optional[str], dict]:
+    """Frame type and body for any negotiated protocol"""
+    frame = msgpack.unpackb(raw) if isinstance(raw, bytes) else json.loads(raw)
+    if "type" in frame:
+        return frame["type"], frame
+    return COMPACT_TYPES.get(frame.get("t"), frame.get("t")), {"code": frame.get("c")}
+
+
+class ClientResult:
+    __slots__ = ("connect_seconds", "latencies", "ttfts", "errors", "error_codes")
+
+    def __init__(self):
+        self.connect_seconds: Optional[float] = None
+        self.latencies: List[float] = []
+        self.ttfts: List[float] = []
+        self.errors = 0
+        self.error_codes: Dict[str, int] = {}
+
+
+async def run_client(ws_url: str, client_id: str, args, connected: asyncio.Event,
+                     all_connected: asyncio.Event, result: ClientResult):
+    started = time.perf_counter()
+    query = f"?protocol={args.protocol}&echo={1 if args.echo else 0}"
+    try:
+        websocket = await websockets.connect(
+            f"{ws_url}/ws/{client_id}{query}", open_timeout=args.turn_timeout, ping_interval=None,
+            max_size=None, compression="deflate" if args.deflate else None,
+        )
+    except Exception:
+        result.errors += 1
+        result.error_codes["connect"] = result.error_codes.get("connect", 0) + 1
+        connected.set()
+        return
+    result.connect_seconds = time.perf_counter() - started
+    connected.set()
+
+    try:
+        # Measure idle memory with every client connected before any turns start
+        await all_connected.wait()
+        for index in range(args.messages):
+            payload = {"message": f"Benchmark message {index} from {client_id}", "stream": args.stream}
+            sent_at = time.perf_counter()
+            await websocket.send(json.dumps(payload))
+            first_token_at = None
+            while True:
+                frame_type, frame = decode_frame(await asyncio.wait_for(websocket.recv(), args.turn_timeout))
+                if frame_type == "assistant_delta" and first_token_at is None:
+                    first_token_at = time.perf_counter()
+                elif frame_type in ("assistant", "assistant_done"):
+                    finished_at = time.perf_counter()
+                    result.latencies.append(finished_at - sent_at)
+                    result.ttfts.append((first_token_at or finished_at) - sent_at)
+                    break
+                elif frame_type == "error":
+                    code = frame.get("code") or "error"
+                    result.errors += 1
+                    result.error_codes[code] = result.error_codes.get(code, 0) + 1
+                    break
+            if args.think_ms:
+                await asyncio.sleep(args.think_ms / 1000)
+    except Exception as e:
+        result.errors += 1
+        kind = type(e).__name__
+        result.error_codes[kind] = result.error_codes.get(kind, 0) + 1
+    finally:
+        await websocket.close()
+
+
+async def run_load(base_url: str, args) -> dict:
+    ws_url = base_url.replace("http://", "ws://").replace("https://", "wss://")
+    run_id = uuid.uuid4().hex[:8]
+    results = [ClientResult() for _ in range(args.clients)]
+    connected_events = [asyncio.Event() for _ in range(args.clients)]
+    all_connected = asyncio.Event()
+
+    baseline = await get_status(base_url)
+
+    tasks = []
+    connect_started = time.perf_counter()
+    for index in range(args.clients):
+        tasks.append(asyncio.create_task(run_client(
+            ws_url, f"bench-{run_id}-{index}", args, connected_events[index], all_connected, results[index]
+        )))
+        if args.ramp_ms:
+            await asyncio.sleep(args.ramp_ms / 1000)
+    await asyncio.gather(*(event.wait() for event in connected_events))
+    connect_wall = time.perf_counter() - connect_started
+    # Give the server a moment to finish per-connection setup before sampling memory
+    await asyncio.sleep(0.5)
+    connected_status = await get_status(base_url)
+
+    turns_started = time.perf_counter()
+    all_connected.set()
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - turns_started
+    final_status = await get_status(base_url)
+
+    latencies = [latency for result in results for latency in result.latencies]
+    ttfts = [ttft for result in results for ttft in result.ttfts]
+    connects = [result.connect_seconds for result in results if result.connect_seconds is not None]
+    error_codes: Dict[str, int] = {}
+    for result in results:
+        for code, count in result.error_codes.items():
+            error_codes[code] = error_codes.get(code, 0) + count
+
+    baseline_rss = baseline["runtime_stats"]["rss_bytes"]
+    connected_rss = connected_status["runtime_stats"]["rss_bytes"]
+    return {
+        "turns_completed": len(latencies),
+        "turns_attempted": args.clients * args.messages,
+        "errors": sum(result.errors for result in results),
+        "error_codes": error_codes,
+        "clients_connected": len(connects),
+        "duration_seconds": round(wall, 3),
+        "throughput_turns_per_second": round(len(latencies) / wall, 2) if wall else None,
+        "latency_ms": percentiles(latencies),
+        "ttft_ms": percentiles(ttfts),
+        "connect_ms": percentiles(connects),
+        "connect_wall_seconds": round(connect_wall, 3),
+        "rss": {
+            "baseline_bytes": baseline_rss,
+            "connected_bytes": connected_rss,
+            "final_bytes": final_status["runtime_stats"]["rss_bytes"],
+            "per_connection_bytes": (
+                round((connected_rss - baseline_rss) / len(connects)) if connects else None
+            ),
+        },
+        "event_loop_lag_ms": {
+            "p99_recent": final_status["runtime_stats"]["event_loop_lag_p99_ms"],
+            "max": final_status["runtime_stats"]["event_loop_lag_max_ms"],
+        },
+        "server": {
+            "execution_stats": final_status.get("execution_stats"),
+            "admission_stats": final_status.get("admission_stats"),
+            "outbound_stats": final_status.get("outbound_stats"),
+            "upstream_stats": final_status.get("upstream_stats"),
+        },
+    }
+
+
+def start_processes(args) -> Tuple[str, str, List[subprocess.Popen]]:
+    mock_port, app_port = free_port(), free_port()
+    output = None if args.verbose else subprocess.DEVNULL
+    mock = subprocess.Popen(
+        [
+            sys.executable, os.path.join(BACKEND_DIR, "benchmarks", "mock_llm_server.py"),
+            "--port", str(mock_port),
+            "--ttft-ms", str(args.ttft_ms),
+            "--token-ms", str(args.token_ms),
+            "--tokens", str(args.tokens),
+            "--error-rate", str(args.error_rate),
+            "--hang-rate", str(args.hang_rate),
+        ],
+        cwd=BACKEND_DIR, stdout=output, stderr=output,
+    )
+    env = {
+        **os.environ,
+        "API_KEY": "benchmark",
+        "BASE_URL": f"http://127.0.0.1:{mock_port}/v1",
+        "UPSTREAMS": "",
+        # Measure the serving path, not the cache or the per-client limiter
+        "RESPONSE_CACHE_ENABLED": "false",
+        "CLIENT_RATE_PER_SECOND": "0",
+    }
+    for setting in args.env:
+        key, _, value = setting.partition("=")
+        env[key] = value
+    app = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1", "--port", str(app_port),
+            "--log-level", "warning", "--ws-max-queue", "1024",
+        ],
+        cwd=BACKEND_DIR, env=env, stdout=output, stderr=output,
+    )
+    return f"http://127.0.0.1:{app_port}", f"http://127.0.0.1:{mock_port}", [mock, app]
+
+
+async def main(args) -> dict:
+    processes: List[subprocess.Popen] = []
+    try:
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            base_url, mock_url, processes = start_processes(args)
+            await wait_until_ready(f"{mock_url}/v1/models", processes[0])
+            await wait_until_ready(f"{base_url}/health", processes[1])
+
+        results = await run_load(base_url, args)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    return {
+        "benchmark": "websocket_load",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "config": {
+            "url": args.url or "spawned",
+            "clients": args.clients,
+            "messages_per_client": args.messages,
+            "stream": args.stream,
+            "protocol": args.protocol,
+            "echo": args.echo,
+            "deflate": args.deflate,
+            "think_ms": args.think_ms,
+            "ramp_ms": args.ramp_ms,
+            "mock_ttft_ms": None if args.url else args.ttft_ms,
+            "mock_token_ms": None if args.url else args.token_ms,
+            "mock_tokens": None if args.url else args.tokens,
+            "mock_error_rate": None if args.url else args.error_rate,
+            "mock_hang_rate": None if args.url else args.hang_rate,
+            "server_env": args.env,
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless WebSocket load test for the chat backend")
+    parser.add_argument("--url", help="Benchmark an already running server instead of spawning one")
+    parser.add_argument("--clients", type=int, default=50, help="Concurrent WebSocket clients")
+    parser.add_argument("--messages", type=int, default=5, help="Messages sent by each client, one at a time")
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=True,
+                        help="Request assistant_delta streaming")
+    parser.add_argument("--protocol", default="json", choices=["json", "compact", "msgpack"],
+                        help="Wire protocol to negotiate")
+    parser.add_argument("--echo", action=argparse.BooleanOptionalAction, default=True,
+                        help="Ask the server to echo each user message")
+    parser.add_argument("--deflate", action=argparse.BooleanOptionalAction, default=True,
+                        help="Offer permessage-deflate")
+    parser.add_argument("--think-ms", type=float, default=0, help="Pause between a reply and the next message")
+    parser.add_argument("--ramp-ms", type=float, default=0, help="Delay between opening consecutive clients")
+    parser.add_argument("--turn-timeout", type=float, default=120, help="Seconds to wait for a reply")
+    parser.add_argument("--ttft-ms", type=float, default=200, help="Mock time to first token")
+    parser.add_argument("--token-ms", type=float, default=20, help="Mock delay between tokens")
+    parser.add_argument("--tokens", type=int, default=50, help="Mock tokens per completion")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Mock fraction of failed completions")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Mock fraction of completions that hang")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the spawned server, e.g. --env AGENT_MAX_CONCURRENCY=128")
+    parser.add_argument("--output", help="Write the JSON report to this file as well as stdout")
+    parser.add_argument("--verbose", action="store_true", help="Show output of the spawned servers")
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    print(text)
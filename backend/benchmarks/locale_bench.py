@@ -0,0 +1,57 @@
+"""
+Client Locale Microbenchmark
+Times connect-time timezone/language resolution with a cold cache (every header
+combination new) and a warm one (a reconnect storm from browsers seen before).
+
+    python benchmarks/locale_bench.py --iterations 100000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.websocket.client_locale import resolve_client_locale  # noqa: E402
+
+HEADERS = [
+    ("", "en-US,en;q=0.9", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/126.0.0.0 Safari/537.36"),
+    ("", "de-DE,de;q=0.9,en-US;q=0.8,en;q=0.7", "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) Safari/605.1.15"),
+    ("", "ja;q=0.9, en;q=0.5", "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) Mobile/15E148"),
+    ("Europe/Paris", "fr-FR,fr;q=0.9", "Mozilla/5.0 (X11; Linux x86_64; rv:127.0) Gecko/20100101 Firefox/127.0"),
+    ("", "zh-Hant-TW,zh;q=0.8", "Mozilla/5.0 (Linux; Android 14; Pixel 8) Chrome/126.0.0.0 Mobile Safari/537.36"),
+    ("", "", "curl/8.5.0"),
+]
+
+
+def per_call_us(started: float, calls: int) -> float:
+    return round((time.perf_counter() - started) / calls * 1e6, 3)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmark for client locale resolution")
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    uncached = resolve_client_locale.__wrapped__
+    started = time.perf_counter()
+    for index in range(args.iterations):
+        uncached(*HEADERS[index % len(HEADERS)])
+    cold = per_call_us(started, args.iterations)
+
+    resolve_client_locale.cache_clear()
+    started = time.perf_counter()
+    for index in range(args.iterations):
+        resolve_client_locale(*HEADERS[index % len(HEADERS)])
+    warm = per_call_us(started, args.iterations)
+
+    info = resolve_client_locale.cache_info()
+    print(json.dumps({
+        "iterations": args.iterations,
+        "cold_us_per_call": cold,
+        "cached_us_per_call": warm,
+        "cache_hits": info.hits,
+        "cache_misses": info.misses,
+    }, indent=2))
@@ -0,0 +1,163 @@
+"""
+Mock LLM Server
+OpenAI-compatible chat completions endpoint with configurable latency, errors and
+hangs, for exercising upstream routing, failover, deadlines, circuit breakers and
+load tests without a real model. Faults can be changed at runtime with POST /settings.
+
+    python benchmarks/mock_llm_server.py --port 9001 --ttft-ms 200 --token-ms 20
+    python benchmarks/mock_llm_server.py --port 9001 --error-rate 0.3 --hang-rate 0.1
+    curl -X POST localhost:9001/settings -d '{"error_rate": 1.0}'   # full outage
+    UPSTREAMS='[{"base_url": "http://127.0.0.1:9001/v1"}, {"base_url": "http://127.0.0.1:9002/v1"}]'
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def create_app(ttft_ms: float = 100, token_ms: float = 10, tokens: int = 40,
+               error_rate: float = 0.0, model: str = "mock-model", error_status: int = 503,
+               hang_rate: float = 0.0, hang_ms: float = 0) -> FastAPI:
+    app = FastAPI(title="Mock LLM Server")
+    app.state.settings = {
+        "ttft_ms": ttft_ms,
+        "token_ms": token_ms,
+        "tokens": tokens,
+        "error_rate": error_rate,
+        "error_status": error_status,
+        # Hung requests send nothing for hang_ms (0: until the client gives up)
+        "hang_rate": hang_rate,
+        "hang_ms": hang_ms,
+    }
+    app.state.requests = 0
+    app.state.errors = 0
+    app.state.hangs = 0
+
+    def completion_words(messages: list) -> list:
+        prompt = next((m.get("content") for m in reversed(messages) if m.get("role") == "user"), "") or ""
+        seed = f"Mock reply to: {prompt[:40]}".split()
+        count = app.state.settings["tokens"]
+        return [(seed[i] if i < len(seed) else f"token{i}") + " " for i in range(count)]
+
+    def chunk(completion_id: str, delta: dict, finish_reason=None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": model, "object": "model", "created": 0, "owned_by": "mock"}]}
+
+    @app.get("/settings")
+    async def get_settings():
+        return {
+            **app.state.settings,
+            "requests": app.state.requests,
+            "errors": app.state.errors,
+            "hangs": app.state.hangs,
+        }
+
+    @app.post("/settings")
+    async def update_settings(request: Request):
+        """Change latency, errors or hangs at runtime, e.g. to degrade one upstream mid-test"""
+        app.state.settings.update(await request.json())
+        return app.state.settings
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        settings = app.state.settings
+        app.state.requests += 1
+
+        if random.random() < settings["error_rate"]:
+            app.state.errors += 1
+            return JSONResponse(
+                status_code=settings["error_status"],
+                content={"error": {"message": "Injected failure", "type": "server_error"}},
+            )
+
+        if random.random() < settings["hang_rate"]:
+            app.state.hangs += 1
+            # Accepted but never answered, like a wedged inference server
+            await asyncio.sleep(settings["hang_ms"] / 1000 if settings["hang_ms"] else 3600)
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        words = completion_words(body.get("messages", []))
+        usage = {"prompt_tokens": 10, "completion_tokens": len(words), "total_tokens": 10 + len(words)}
+
+        if not body.get("stream"):
+            await asyncio.sleep((settings["ttft_ms"] + settings["token_ms"] * len(words)) / 1000)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(words).strip()},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        async def stream():
+            await asyncio.sleep(settings["ttft_ms"] / 1000)
+            yield chunk(completion_id, {"role": "assistant", "content": ""})
+            for word in words:
+                yield chunk(completion_id, {"content": word})
+                await asyncio.sleep(settings["token_ms"] / 1000)
+            yield chunk(completion_id, {}, finish_reason="stop")
+            if include_usage:
+                payload = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [],
+                    "usage": usage,
+                }
+                yield f"data: {json.dumps(payload)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--ttft-ms", type=float, default=100, help="Delay before the first token")
+    parser.add_argument("--token-ms", type=float, default=10, help="Delay between tokens")
+    parser.add_argument("--tokens", type=int, default=40, help="Tokens per completion")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of injected errors")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Fraction of requests that hang")
+    parser.add_argument("--hang-ms", type=float, default=0, help="How long hung requests stall (0: indefinitely)")
+    parser.add_argument("--model", default="mock-model")
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(
+            args.ttft_ms, args.token_ms, args.tokens, args.error_rate, args.model,
+            args.error_status, args.hang_rate, args.hang_ms,
+        ),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+    )
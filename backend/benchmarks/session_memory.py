@@ -0,0 +1,102 @@
+"""
+Session Memory Report
+Compares per-connection bookkeeping memory of the slotted ClientSession record
+against the previous layout of parallel per-client dicts, using tracemalloc.
+Sockets and send queues are the same in both layouts and are left out.
+
+    python benchmarks/session_memory.py --clients 10000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.websocket.session import ClientSession  # noqa: E402
+
+# Header values as they arrive on the wire; each connection decodes its own copy
+USER_AGENTS = [
+    b"Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
+    b"Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Safari/605.1.15",
+    b"Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148",
+    b"Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Mobile Safari/537.36",
+]
+ACCEPT_LANGUAGES = [b"en-US,en;q=0.9", b"de-DE,de;q=0.9,en;q=0.8", b"ja-JP,ja;q=0.9", b"pt-BR,pt;q=0.9,en;q=0.7"]
+TIMEZONES = [b"America/New_York", b"Europe/Berlin", b"Asia/Tokyo", b"America/Sao_Paulo"]
+LANGUAGES = [b"en", b"de", b"ja", b"pt"]
+ORIGIN = b"https://example.com"
+
+# Stands in for the socket and send queue, which both layouts hold by reference
+PLACEHOLDER = object()
+
+
+def headers(index: int) -> dict:
+    pick = index % len(USER_AGENTS)
+    return {
+        'user_agent': USER_AGENTS[pick].decode("latin-1"),
+        'accept_language': ACCEPT_LANGUAGES[pick].decode("latin-1"),
+        'origin': ORIGIN.decode("latin-1"),
+        'timezone': TIMEZONES[pick].decode("latin-1"),
+        'language': LANGUAGES[pick].decode("latin-1"),
+    }
+
+
+def build_dicts(client_ids: list) -> tuple:
+    """The previous layout: four dicts keyed by client id, one metadata dict per client"""
+    active_connections, client_timezones, client_metadata, outbound_queues = {}, {}, {}, {}
+    for index, client_id in enumerate(client_ids):
+        values = headers(index)
+        active_connections[client_id] = PLACEHOLDER
+        outbound_queues[client_id] = PLACEHOLDER
+        client_timezones[client_id] = values['timezone']
+        client_metadata[client_id] = {
+            'user_agent': values['user_agent'],
+            'accept_language': values['accept_language'],
+            'origin': values['origin'],
+            'timezone': values['timezone'],
+            'country': None,
+            'language': values['language'],
+            'protocol': 'json',
+            'echo': True,
+        }
+    return active_connections, client_timezones, client_metadata, outbound_queues
+
+
+def build_sessions(client_ids: list) -> dict:
+    """The current layout: one slotted record per client with shared metadata strings"""
+    return {
+        client_id: ClientSession(client_id, PLACEHOLDER, PLACEHOLDER, **headers(index))
+        for index, client_id in enumerate(client_ids)
+    }
+
+
+def measure(build, client_ids: list) -> int:
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    state = build(client_ids)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del state
+    return allocated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-connection memory of client bookkeeping")
+    parser.add_argument("--clients", type=int, default=10000)
+    args = parser.parse_args()
+
+    # Client ids exist in both layouts, so they are allocated outside the measurement
+    client_ids = [f"client-{index:08d}" for index in range(args.clients)]
+    dicts_bytes = measure(build_dicts, client_ids)
+    sessions_bytes = measure(build_sessions, client_ids)
+    print(json.dumps({
+        "clients": args.clients,
+        "dicts_bytes_per_connection": round(dicts_bytes / args.clients),
+        "sessions_bytes_per_connection": round(sessions_bytes / args.clients),
+        "saving_bytes_per_connection": round((dicts_bytes - sessions_bytes) / args.clients),
+        "saving_percent": round(100 * (dicts_bytes - sessions_bytes) / dicts_bytes, 1) if dicts_bytes else None,
+    }, indent=2))
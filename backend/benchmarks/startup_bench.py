@@ -0,0 +1,131 @@
+"""
+Startup Benchmark
+Measures what a new pod pays before it can serve: importing main in a fresh
+interpreter (which must not load haystack or need API_KEY), preloading and
+building the services, and the time until serve.py answers /health. With
+--max-import-ms / --max-ready-ms it exits non-zero on a regression, e.g. in CI.
+
+    python benchmarks/startup_bench.py --runs 5 --workers 2 --max-import-ms 1500
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+print(json.dumps({"import_ms": elapsed * 1000, "haystack_loaded": "haystack" in sys.modules}))
+"""
+
+BUILD_PROBE = """
+import asyncio, json
+import main
+main.container.preload()
+
+async def build():
+    await main.container.start()
+    await main.container.close()
+
+asyncio.run(build())
+print(json.dumps(main.container.get_stats()))
+"""
+
+
+def probe(code: str, env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_ready(env: dict, workers: int, timeout: float = 60) -> float:
+    """Seconds from spawning serve.py until /health answers"""
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"serve.py exited with status {process.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError(f"serve.py not ready after {timeout}s")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def summary(values: list) -> dict:
+    return {
+        "median_ms": round(statistics.median(values), 1),
+        "min_ms": round(min(values), 1),
+        "max_ms": round(max(values), 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time and startup benchmark for the chat backend")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per measurement")
+    parser.add_argument("--workers", type=int, default=1, help="Workers for the serve.py readiness run")
+    parser.add_argument("--max-import-ms", type=float, help="Fail if the median import of main is slower")
+    parser.add_argument("--max-ready-ms", type=float, help="Fail if the median time to /health is slower")
+    args = parser.parse_args()
+
+    base_env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "0"}
+    # Importing main must work without credentials
+    import_env = {key: value for key, value in base_env.items() if key not in ("API_KEY", "NVIDIA_API_KEY")}
+    # Building needs a key but no upstream; warmup would measure the network instead
+    serve_env = {**base_env, "API_KEY": base_env.get("API_KEY") or "benchmark", "UPSTREAM_WARMUP": "false"}
+
+    imports = [probe(IMPORT_PROBE, import_env) for _ in range(args.runs)]
+    builds = [probe(BUILD_PROBE, serve_env) for _ in range(args.runs)]
+    ready = [time_to_ready(serve_env, args.workers) * 1000 for _ in range(args.runs)]
+
+    report = {
+        "benchmark": "startup",
+        "runs": args.runs,
+        "import_main": summary([run["import_ms"] for run in imports]),
+        "import_loads_haystack": any(run["haystack_loaded"] for run in imports),
+        "preload": summary([run["preload_ms"] for run in builds]),
+        "build_services": summary([run["build_ms"] for run in builds]),
+        "serve_ready": {**summary(ready), "workers": args.workers},
+    }
+    print(json.dumps(report, indent=2))
+
+    failures = []
+    if report["import_loads_haystack"]:
+        failures.append("importing main loaded haystack")
+    if args.max_import_ms and report["import_main"]["median_ms"] > args.max_import_ms:
+        failures.append(f"import {report['import_main']['median_ms']} ms > {args.max_import_ms} ms")
+    if args.max_ready_ms and report["serve_ready"]["median_ms"] > args.max_ready_ms:
+        failures.append(f"ready {report['serve_ready']['median_ms']} ms > {args.max_ready_ms} ms")
+    if failures:
+        print("Startup regression: " + "; ".join(failures), file=sys.stderr)
+        sys.exit(1)
@@ -3,19 +3,31 @@ FastAPI WebSocket Chat Server with Nvidia OpenAI LLM
 Clean architecture with separated services
 """
 
+import asyncio
+import hmac
+import json
 import logging
 import os
+import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime
+from typing import List, Optional
 
 import uvicorn
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
-# Import our services
+# Import our services (heavy ones are imported when the container builds them)
 from app_config import app_config
-from services import AgentService, ConnectionManager, WebSocketHandler
+from services import (
+    ServiceContainer, admission_controller, execution_service, response_cache, single_flight
+)
+from services.conversation.session_ids import issue_session_id
+from services.runtime_monitor import runtime_monitor
+from services.metrics_service import metrics
 
 # Load environment variables from .env file
 load_dotenv()
@@ -24,16 +36,24 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize services
-agent_service = AgentService()
-connection_manager = ConnectionManager()
-websocket_handler = WebSocketHandler(connection_manager, agent_service)
+# Services are built per process in the lifespan, so importing this module stays cheap
+container = ServiceContainer()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build services and start their background tasks"""
+    await container.start()
+    yield
+    await container.close()
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Chat Assistant Backend",
     description="WebSocket-based chat server with Nvidia OpenAI LLM",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS middleware for frontend connections
@@ -58,12 +78,44 @@ class StatusResponse(BaseModel):
     model: str
     model_settings: dict
     connection_stats: dict
+    cluster_stats: dict
+    outbound_stats: dict
+    execution_stats: dict
+    admission_stats: dict
+    cache_stats: dict
+    single_flight_stats: dict
+    agent_cache_stats: dict
+    tool_stats: dict
+    lifecycle_stats: dict
+    upstream_stats: dict
+    upstream_health: dict
+    runtime_stats: dict
+    startup_stats: dict
 
 
 class ChatMessage(BaseModel):
     message: str
+    # Informational only: rate limits are keyed on the caller's address, not on this
+    user_id: str = "anonymous"
+    # An id from POST /sessions (or a WebSocket reply); without one the turn has no
+    # history and nothing is kept afterwards. Ids the server did not issue are refused.
+    session_id: Optional[str] = None
+    stream: bool = False
+    timezone: Optional[str] = None
+    language: Optional[str] = None
+    # Honoured only from the tenant's origins, if it lists any
+    tenant: Optional[str] = None
+
+
+class ChatBatchRequest(BaseModel):
+    requests: List[ChatMessage]
     user_id: str = "anonymous"
-    session_id: str = "default"
+
+
+# Frames that end a turn
+TERMINAL_FRAMES = {"assistant", "assistant_done", "error"}
+
+ERROR_STATUS = {"invalid_session": 403, "rate_limited": 429, "overloaded": 503, "upstream_unavailable": 503, "timeout": 504}
 
 
 # API Routes
@@ -72,21 +124,30 @@ async def root():
     return {
         "message": "Chat Assistant Backend API",
         "version": "1.0.0",
-        "endpoints": {"status": "/status", "websocket": "/ws/{client_id}"},
+        "endpoints": {
+            "status": "/status",
+            "metrics": "/metrics",
+            "chat": "/chat",
+            "chat_batch": "/chat/batch",
+            "websocket": "/ws/{client_id}",
+        },
     }
 
 
 @app.get("/status", response_model=StatusResponse)
 async def get_status():
     """Health check and status endpoint with connection statistics"""
+    connection_manager = container.connection_manager
+    websocket_handler = container.websocket_handler
+    agent_service = container.agent_service
     connection_stats = connection_manager.get_connection_stats()
     conversation_stats = websocket_handler.get_conversation_stats()
     
     return StatusResponse(
         status="online",
         timestamp=datetime.now().isoformat(),
-        active_connections=len(connection_manager.active_connections),
-        model=app_config.model,
+        active_connections=connection_manager.connection_count,
+        model=agent_service.model,
         model_settings={
             "temperature": app_config.model_temperature,
             "max_tokens": app_config.model_max_tokens,
@@ -96,49 +157,229 @@ async def get_status():
         connection_stats={
             **connection_stats,
             **conversation_stats
-        }
+        },
+        cluster_stats=await connection_manager.get_cluster_stats(),
+        outbound_stats=connection_manager.get_outbound_stats(),
+        execution_stats={
+            **execution_service.get_stats(),
+            **websocket_handler.get_turn_stats()
+        },
+        admission_stats=admission_controller.get_stats(),
+        cache_stats=response_cache.get_stats(),
+        single_flight_stats=single_flight.get_stats(),
+        agent_cache_stats=agent_service.get_agent_cache_stats(),
+        tool_stats=container.tool_service.get_stats(),
+        lifecycle_stats=container.connection_lifecycle.get_stats(),
+        upstream_stats=container.upstream_pool.get_stats(),
+        upstream_health=agent_service.router.get_stats(),
+        runtime_stats=runtime_monitor.get_stats(),
+        startup_stats=container.get_stats(),
     )
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus metrics in the text exposition format"""
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/admin/clients")
+async def list_clients(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    timezone: Optional[str] = None,
+    language: Optional[str] = None,
+    prefix: Optional[str] = None,
+    authorization: str = Header(""),
+):
+    """Paginated listing of clients connected to this worker"""
+    if app_config.admin_token and not hmac.compare_digest(authorization, f"Bearer {app_config.admin_token}"):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+    return container.connection_manager.list_clients(offset, limit, timezone, language, prefix)
+
+
+async def _run_http_turn(chat: ChatMessage, sink, rate_key: Optional[str]):
+    """Run one HTTP turn through the WebSocket pipeline, frames going to sink"""
+    client_id = f"http-{uuid.uuid4().hex}"
+    try:
+        await container.websocket_handler.run_turn(client_id, chat.model_dump(), sink, rate_key)
+    finally:
+        if not chat.session_id:
+            await container.websocket_handler.conversation_store.delete(client_id)
+
+
+async def _collect_turn(chat: ChatMessage, rate_key: Optional[str]) -> dict:
+    """Run a non-streamed turn and return its final frame"""
+    final = {}
+
+    async def sink(frame: dict):
+        if frame["type"] in TERMINAL_FRAMES:
+            final.update(frame)
+
+    await _run_http_turn(chat.model_copy(update={"stream": False}), sink, rate_key)
+    return final or {"type": "error", "message": "No response was produced"}
+
+
+async def _stream_turn(chat: ChatMessage, rate_key: str):
+    """Server-sent events for one streamed turn; closing the request cancels the turn"""
+    frames: asyncio.Queue = asyncio.Queue()
+
+    async def sink(frame: dict):
+        if frame["type"] != "user":
+            await frames.put(frame)
+
+    turn = asyncio.create_task(_run_http_turn(chat.model_copy(update={"stream": True}), sink, rate_key))
+    turn.add_done_callback(lambda _: frames.put_nowait(None))
+    try:
+        while True:
+            frame = await frames.get()
+            if frame is None:
+                break
+            yield f"event: {frame['type']}\ndata: {json.dumps(frame)}\n\n"
+    finally:
+        if not turn.done():
+            turn.cancel()
+
+
+def _with_tenant(chat: ChatMessage, origin: Optional[str]) -> ChatMessage:
+    """Resolve the turn's tenant from the request, as connect does for WebSockets"""
+    return chat.model_copy(update={"tenant": container.tenant_registry.resolve(chat.tenant, origin).name})
+
+
+def _rate_key(request: Request) -> str:
+    """
+    Token bucket for an HTTP caller, keyed on the peer address rather than
+    anything in the body (uvicorn resolves it from X-Forwarded-For only for
+    FORWARDED_ALLOW_IPS proxies)
+    """
+    return f"http:{request.client.host if request.client else 'unknown'}"
+
+
+def _error_detail(frame: dict) -> dict:
+    return {"code": frame.get("code", "error"), "message": frame.get("message", "")}
+
+
+@app.post("/sessions")
+async def create_session():
+    """Issue a conversation id; pass it as session_id to /chat to keep history across turns"""
+    return {"session_id": issue_session_id()}
+
+
+@app.post("/chat")
+async def chat(chat_message: ChatMessage, request: Request, origin: Optional[str] = Header(None)):
+    """Single chat turn over HTTP; with stream=true the reply is sent as server-sent events"""
+    if not chat_message.message.strip():
+        raise HTTPException(status_code=400, detail="Message must not be empty")
+    chat_message = _with_tenant(chat_message, origin)
+    rate_key = _rate_key(request)
+
+    if chat_message.stream:
+        return StreamingResponse(
+            _stream_turn(chat_message, rate_key),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    frame = await _collect_turn(chat_message, rate_key)
+    if frame["type"] == "error":
+        retry_after = frame.get("retry_after")
+        raise HTTPException(
+            status_code=ERROR_STATUS.get(frame.get("code"), 500),
+            detail=_error_detail(frame),
+            headers={"Retry-After": str(int(retry_after + 0.999))} if retry_after else None,
+        )
+    return {"response": frame["message"], "session_id": chat_message.session_id, "timestamp": frame["timestamp"]}
+
+
+@app.post("/chat/batch")
+async def chat_batch(batch: ChatBatchRequest, request: Request, origin: Optional[str] = Header(None)):
+    """
+    Run independent prompts concurrently. Each prompt is charged to the
+    caller's rate limit and waits for admission like any other turn; prompts
+    over the limit fail with rate_limited while the rest are answered.
+    """
+    if not batch.requests:
+        raise HTTPException(status_code=400, detail="Batch must contain at least one request")
+    if len(batch.requests) > app_config.chat_batch_max_size:
+        raise HTTPException(
+            status_code=413, detail=f"Batch exceeds {app_config.chat_batch_max_size} requests"
+        )
+    rate_key = _rate_key(request)
+
+    # Bound each batch's share of the admission slots so one job cannot crowd out live chats
+    slots = asyncio.Semaphore(app_config.chat_batch_concurrency)
+
+    async def run_item(index: int, chat_message: ChatMessage) -> dict:
+        if not chat_message.message.strip():
+            return {"index": index, "error": {"code": "invalid", "message": "Message must not be empty"}}
+        async with slots:
+            frame = await _collect_turn(_with_tenant(chat_message, origin), rate_key)
+        if frame["type"] == "error":
+            return {"index": index, "error": _error_detail(frame)}
+        return {"index": index, "response": frame["message"], "session_id": chat_message.session_id}
+
+    results = await asyncio.gather(*(run_item(index, item) for index, item in enumerate(batch.requests)))
+    failed = sum(1 for result in results if "error" in result)
+    return {"results": results, "completed": len(results) - failed, "failed": failed}
+
+
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
     """WebSocket endpoint for real-time chat with automatic timezone detection"""
+    connection_manager = container.connection_manager
+    websocket_handler = container.websocket_handler
     
-    await connection_manager.connect(websocket, client_id)
+    if not await connection_manager.connect(websocket, client_id):
+        return
     
     try:
         while True:
-            # Receive message from client
-            raw_message = await websocket.receive_text()
+            # Receive message from client (binary frames are msgpack clients)
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            raw_message = message["text"] if message.get("text") is not None else message.get("bytes")
             
-            # Handle the message using our WebSocket handler
-            await websocket_handler.handle_message(websocket, client_id, raw_message)
+            # Process in a per-client task so cancel/new messages are received meanwhile
+            await websocket_handler.dispatch(websocket, client_id, raw_message)
             
     except WebSocketDisconnect:
-        connection_manager.disconnect(client_id)
-        websocket_handler.cleanup_client_history(client_id)
+        pass
     except Exception as e:
         logger.error(f"WebSocket error for client {client_id}: {str(e)}")
-        connection_manager.disconnect(client_id)
-        websocket_handler.cleanup_client_history(client_id)
+    finally:
+        # Nobody will read the answer any more, so stop paying for it
+        websocket_handler.cancel_turn(client_id, websocket)
+        connection_manager.disconnect(client_id, websocket)
 
 
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    """Simple health check"""
+    """Simple health check; 503 while draining so load balancers stop routing here"""
+    if container.draining:
+        return JSONResponse(status_code=503, content={"status": "draining", "timestamp": datetime.now().isoformat()})
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
 
 if __name__ == "__main__":
     # Get port from environment variable (for Hugging Face) or default to 8000
     port = int(os.getenv("PORT", 8000))
-    
-    # Run server
-    uvicorn.run(
-        "main:app",
+    server_options = dict(
         host="0.0.0.0",
         port=port,
-        reload=True,
-        log_level="info"
+        log_level="info",
+        ws_per_message_deflate=app_config.ws_per_message_deflate,
+        ws_ping_interval=app_config.ws_ping_interval_seconds,
+        ws_ping_timeout=app_config.ws_ping_timeout_seconds,
     )
+    
+    # Run server; the reloader restarts workers itself, so only drain without it
+    if os.getenv("RELOAD", "true").lower() == "true":
+        uvicorn.run("main:app", reload=True, **server_options)
+    else:
+        # Production mode (see serve.py); pass this module's app and container so it drains them
+        from serve import run_server
+        raise SystemExit(run_server(app, container, port=port))
@@ -0,0 +1,182 @@
+"""
+Production Server
+Imports the app and its heavy dependencies once, then serves it from one
+process or from preforked workers sharing the listening socket. Workers start
+from the master's already-imported, copy-on-write image and build their own
+services in the app lifespan. uvloop and httptools are used when installed.
+
+    python serve.py --workers 4
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, Optional
+
+import uvicorn
+
+from app_config import app_config
+
+logger = logging.getLogger("serve")
+
+# uvicorn's exit status when the application fails to start
+STARTUP_FAILURE = 3
+
+# A worker dying sooner than this after its start is restarted with a delay
+RESPAWN_BACKOFF_SECONDS = 1.0
+
+
+def event_loop() -> str:
+    try:
+        import uvloop  # noqa: F401
+        return "uvloop"
+    except ImportError:
+        return "asyncio"
+
+
+def http_protocol() -> str:
+    try:
+        import httptools  # noqa: F401
+        return "httptools"
+    except ImportError:
+        return "h11"
+
+
+class DrainingServer(uvicorn.Server):
+    """
+    uvicorn closes every WebSocket with 1012 before the lifespan shutdown runs,
+    so drain first: finish in-flight turns and close with a retry hint.
+    """
+
+    def __init__(self, config: uvicorn.Config, container):
+        super().__init__(config)
+        self.container = container
+
+    async def shutdown(self, sockets=None):
+        await self.container.drain()
+        await super().shutdown(sockets)
+
+
+def build_config(app, host: Optional[str] = None, port: Optional[int] = None) -> uvicorn.Config:
+    return uvicorn.Config(
+        app,
+        host=host or app_config.host,
+        port=port or app_config.port,
+        loop=event_loop(),
+        http=http_protocol(),
+        log_level="info",
+        ws_per_message_deflate=app_config.ws_per_message_deflate,
+        ws_ping_interval=app_config.ws_ping_interval_seconds,
+        ws_ping_timeout=app_config.ws_ping_timeout_seconds,
+    )
+
+
+class Prefork:
+    """
+    Master process: forks the workers, restarts any that die, and on SIGTERM
+    or SIGINT forwards SIGTERM so every worker drains before exiting.
+    """
+
+    def __init__(self, config: uvicorn.Config, container, sock: socket.socket, workers: int):
+        self.config = config
+        self.container = container
+        self.sock = sock
+        self.workers = workers
+        self.children: Dict[int, float] = {}  # pid -> start time
+        self.stopping = False
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for _ in range(self.workers):
+            self._spawn()
+        logger.info(f"Master {os.getpid()} serving with {self.workers} workers")
+
+        exit_code = 0
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started_at = self.children.pop(pid, None)
+            if started_at is None or self.stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if code == STARTUP_FAILURE:
+                # Every worker would fail the same way; restarting them only hides it
+                logger.error(f"Worker {pid} failed to start, shutting down")
+                exit_code = STARTUP_FAILURE
+                self._stop(signal.SIGTERM, None)
+                continue
+            logger.warning(f"Worker {pid} exited with status {code}, starting a replacement")
+            if time.monotonic() - started_at < RESPAWN_BACKOFF_SECONDS:
+                time.sleep(RESPAWN_BACKOFF_SECONDS)
+            self._spawn()
+
+        self.sock.close()
+        return exit_code
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            return
+
+        # Worker: uvicorn installs its own handlers once it runs
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        code = 1
+        try:
+            server = DrainingServer(self.config, self.container)
+            server.run(sockets=[self.sock])
+            code = 0 if server.started else STARTUP_FAILURE
+        except BaseException:
+            logger.exception(f"Worker {os.getpid()} crashed")
+        finally:
+            os._exit(code)
+
+    def _stop(self, signum, frame):
+        if not self.stopping:
+            logger.info(f"Stopping {len(self.children)} workers")
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+def run_server(app, container, workers: Optional[int] = None, host: Optional[str] = None,
+               port: Optional[int] = None) -> int:
+    """Serve app in this process (one worker) or from a prefork master; returns the exit status"""
+    workers = workers or app_config.workers
+    config = build_config(app, host, port)
+    preload_seconds = container.preload()
+    logger.info(
+        f"Preloaded services in {preload_seconds * 1000:.0f} ms "
+        f"(loop={config.loop}, http={config.http}, workers={workers})"
+    )
+
+    if workers <= 1:
+        server = DrainingServer(config, container)
+        server.run()
+        return 0 if server.started else STARTUP_FAILURE
+
+    sock = config.bind_socket()
+    return Prefork(config, container, sock, workers).run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the chat backend for production")
+    parser.add_argument("--workers", type=int, default=app_config.workers)
+    parser.add_argument("--host", default=app_config.host)
+    parser.add_argument("--port", type=int, default=app_config.port)
+    args = parser.parse_args()
+
+    import main
+
+    sys.exit(run_server(main.app, main.container, args.workers, args.host, args.port))
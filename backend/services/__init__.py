@@ -1,15 +1,54 @@
 """
 Services Package
+
+Services that pull in haystack, openai or httpx are imported on first
+access, so importing the app (or one light service) stays cheap.
 """
 
-from .agent_service import AgentService
+import importlib
+
+from .admission_service import AdmissionController, AdmissionRejected, admission_controller
+from .cache_service import ResponseCache, response_cache
+from .container import ServiceContainer
+from .deadline import DeadlineExceeded, turn_deadline
+from .execution_service import ExecutionService, execution_service
 from .prompt_service import PromptService, prompt_service
-from .tools_service import ToolsService, tool_service
-from .websocket import ConnectionManager, WebSocketHandler
+from .resilience import CircuitBreaker, RetryBudget, UpstreamUnavailable
+from .single_flight import SingleFlight, single_flight
+
+_LAZY_EXPORTS = {
+    'AgentService': 'agent_service',
+    'Tenant': 'tenant_service', 'TenantRegistry': 'tenant_service', 'tenant_registry': 'tenant_service',
+    'ToolPolicy': 'tool_runtime', 'ToolRuntime': 'tool_runtime', 'ToolTimeout': 'tool_runtime',
+    'ToolContext': 'tools_service', 'ToolsService': 'tools_service', 'tool_service': 'tools_service',
+    'Upstream': 'upstream_router', 'UpstreamRouter': 'upstream_router',
+    'UpstreamClientPool': 'upstream_service', 'upstream_pool': 'upstream_service',
+    'ConnectionLifecycle': 'websocket', 'ConnectionManager': 'websocket', 'WebSocketHandler': 'websocket',
+}
 
 __all__ = [
-    'AgentService', 
+    'AdmissionController', 'AdmissionRejected', 'admission_controller',
+    'AgentService',
+    'ServiceContainer',
+    'DeadlineExceeded', 'turn_deadline',
+    'ResponseCache', 'response_cache',
+    'ExecutionService', 'execution_service',
     'PromptService', 'prompt_service',
-    'ToolsService', 'tool_service',
-    'ConnectionManager', 'WebSocketHandler'
+    'CircuitBreaker', 'RetryBudget', 'UpstreamUnavailable',
+    'SingleFlight', 'single_flight',
+    'Tenant', 'TenantRegistry', 'tenant_registry',
+    'ToolPolicy', 'ToolRuntime', 'ToolTimeout',
+    'ToolContext', 'ToolsService', 'tool_service',
+    'Upstream', 'UpstreamRouter',
+    'UpstreamClientPool', 'upstream_pool',
+    'ConnectionLifecycle', 'ConnectionManager', 'WebSocketHandler'
 ]
+
+
+def __getattr__(name: str):
+    module = _LAZY_EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,231 @@
+"""
+Admission Control Service
+Global in-flight cap with a bounded FIFO wait queue and per-client token buckets
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from app_config import app_config
+from services import deadline
+
+logger = logging.getLogger(__name__)
+
+QueuedCallback = Callable[[int], Awaitable[None]]
+
+
+class AdmissionRejected(Exception):
+    """Raised when a turn is shed instead of admitted"""
+
+    def __init__(self, code: str, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def take(self) -> float:
+        """Take one token; returns 0 on success, otherwise seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """
+    Admits at most max_in_flight turns at once. Further turns wait in a FIFO
+    queue of at most max_queue entries for up to queue_timeout seconds; beyond
+    that they are rejected straight away so overload never turns into timeouts.
+    Waiters are told their position when they join, and again at most every
+    position_interval seconds while the queue moves.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        queue_timeout: Optional[float] = None,
+        rate_per_second: Optional[float] = None,
+        burst: Optional[int] = None,
+        max_tracked_clients: int = 10000,
+        position_interval: float = 1.0,
+    ):
+        self.max_in_flight = max_in_flight or app_config.admission_max_in_flight
+        self.max_queue = app_config.admission_max_queue if max_queue is None else max_queue
+        self.queue_timeout = queue_timeout or app_config.admission_queue_timeout_seconds
+        self.rate_per_second = app_config.client_rate_per_second if rate_per_second is None else rate_per_second
+        self.burst = burst or app_config.client_rate_burst
+        self.max_tracked_clients = max_tracked_clients
+        self.position_interval = position_interval
+
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Position callback and the position last reported, per waiter that wants updates
+        self._positions: Dict[asyncio.Future, List] = {}
+        self._position_update: Optional[asyncio.TimerHandle] = None
+        self._notifications: Set[asyncio.Task] = set()
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_overloaded = 0
+        self.rejected_rate_limited = 0
+        self.queue_timeouts = 0
+        self.deadline_exceeded = 0
+
+    def check_rate(self, client_id: str):
+        """Charge one message to the client's token bucket, raising if it is empty"""
+        if self.rate_per_second <= 0:
+            return
+        bucket = self._buckets.get(client_id)
+        if bucket is None:
+            bucket = TokenBucket(self.rate_per_second, self.burst)
+            self._buckets[client_id] = bucket
+            # Idle clients' buckets are full anyway, so forgetting the oldest is harmless
+            while len(self._buckets) > self.max_tracked_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client_id)
+
+        retry_after = bucket.take()
+        if retry_after:
+            self.rejected_rate_limited += 1
+            raise AdmissionRejected(
+                "rate_limited",
+                "You're sending messages too quickly. Please wait a moment and try again.",
+                retry_after=round(retry_after, 2),
+            )
+
+    async def acquire(self, on_queued: Optional[QueuedCallback] = None):
+        """
+        Wait for an in-flight slot, raising AdmissionRejected when overloaded and
+        DeadlineExceeded when the turn's deadline ends the wait before queue_timeout
+        """
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_overloaded += 1
+            raise self._overloaded()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        deadline_bound = False
+        try:
+            if on_queued is not None:
+                position = len(self._waiters)
+                self._positions[waiter] = [on_queued, position]
+                await on_queued(position)
+            # A turn never queues past its own deadline
+            left = deadline.remaining()
+            deadline_bound = left is not None and left < self.queue_timeout
+            await asyncio.wait_for(asyncio.shield(waiter), left if deadline_bound else self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            if deadline_bound:
+                # The turn ran out of time, which says nothing about overload
+                self.deadline_exceeded += 1
+                raise deadline.DeadlineExceeded("Turn deadline exceeded while queued")
+            self.queue_timeouts += 1
+            self.rejected_overloaded += 1
+            raise self._overloaded()
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        finally:
+            self._positions.pop(waiter, None)
+        self.admitted += 1
+
+    def release(self):
+        """Free a slot, handing it straight to the oldest waiter if there is one"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # in_flight stays the same: the slot changes hands
+                waiter.set_result(None)
+                self._queue_moved()
+                return
+        self.in_flight -= 1
+
+    def _abandon(self, waiter: asyncio.Future):
+        if waiter.done() and not waiter.cancelled():
+            # The slot was handed over just as we gave up; pass it on
+            self.release()
+            return
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            return
+        self._queue_moved()
+
+    def _queue_moved(self):
+        # Batch updates: one sweep per interval however many turns leave the queue
+        if self._positions and self._position_update is None:
+            self._position_update = asyncio.get_running_loop().call_later(
+                self.position_interval, self._update_positions
+            )
+
+    def _update_positions(self):
+        """Tell waiters whose place in the queue changed since they were last told"""
+        self._position_update = None
+        for position, waiter in enumerate(self._waiters, start=1):
+            entry = self._positions.get(waiter)
+            if entry is None or entry[1] == position or waiter.done():
+                continue
+            entry[1] = position
+            task = asyncio.ensure_future(self._notify(entry[0], position))
+            self._notifications.add(task)
+            task.add_done_callback(self._notifications.discard)
+
+    @staticmethod
+    async def _notify(on_queued: QueuedCallback, position: int):
+        try:
+            await on_queued(position)
+        except Exception as e:
+            logger.warning(f"Could not send queue position update: {e}")
+
+    def _overloaded(self) -> AdmissionRejected:
+        return AdmissionRejected(
+            "overloaded",
+            "The assistant is handling too many conversations right now. Please try again shortly.",
+            retry_after=self.queue_timeout,
+        )
+
+    def get_stats(self) -> dict:
+        """Get admission statistics"""
+        return {
+            'max_in_flight': self.max_in_flight,
+            'in_flight': self.in_flight,
+            'waiting': len(self._waiters),
+            'max_queue': self.max_queue,
+            'admitted': self.admitted,
+            'queued': self.queued,
+            'rejected_overloaded': self.rejected_overloaded,
+            'rejected_rate_limited': self.rejected_rate_limited,
+            'queue_timeouts': self.queue_timeouts,
+            'deadline_exceeded': self.deadline_exceeded,
+            'rate_limited_clients_tracked': len(self._buckets),
+        }
+
+
+admission_controller = AdmissionController()
@@ -1,45 +1,301 @@
+import asyncio
+import dataclasses
+import threading
+import time
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
 from app_config import app_config
-from services.prompt_service import prompt_service
-from services.tools_service import tool_service
+from services.cache_service import response_cache
+from services.conversation import ConversationWindow, estimate_tokens
+from services import deadline
+from services.deadline import DeadlineExceeded
+from services.execution_service import execution_service
+from services.metrics_service import COMPLETION_TOKENS, PROMPT_TOKENS, TTFT_SECONDS, TURN_SECONDS
+from services.resilience import UpstreamUnavailable
+from services.single_flight import Flight, single_flight
+from services.streaming import DeltaStream
+from services.tenant_service import Tenant, tenant_registry
+from services.tools_service import ToolContext, tool_service
+from services.upstream_router import UpstreamRouter, load_upstreams
 
-from haystack.utils import Secret
 from haystack.components.agents import Agent
 from haystack.dataclasses import ChatMessage
-from haystack.components.generators.chat import OpenAIChatGenerator
+
+
+class TurnCancelled(Exception):
+    """Raised inside the generator stream to abort an upstream request nobody will read"""
 
 
 class AgentService:
     def __init__(
-        self, api_base_url: str = "", api_key: str = "", model: str = ""
+        self, api_base_url: str = "", api_key: str = "", model: str = "", agent_cache_size: Optional[int] = None
     ):
         if not app_config.api_key:
             raise ValueError("API_KEY environment variable is not set.")
-        self.api_key = Secret.from_token(api_key or app_config.api_key)
-        self.api_base_url = api_base_url or app_config.base_url
-        self.model = model or app_config.model
-        self.agent = Agent(
-            chat_generator=OpenAIChatGenerator(
-                api_base_url=self.api_base_url, 
-                api_key=self.api_key, 
-                model=self.model
-            ),
-            system_prompt=prompt_service.get_system_prompt(),
-            tools=tool_service.get_tools(),
+        default = tenant_registry.default()
+        # One or more endpoints (UPSTREAMS), all sharing the pooled upstream client
+        self.router = UpstreamRouter(load_upstreams(api_base_url, api_key, model, default.sampling))
+        self.api_base_url = self.router.upstreams[0].base_url
+        self.model = self.router.model
+        # Routers per (model, sampling); tenants on the process defaults share self.router
+        self._routers: Dict[tuple, UpstreamRouter] = {self._router_key(default): self.router}
+        # Built agents per tenant settings, least recently used evicted first
+        self.agent_cache_size = agent_cache_size or app_config.agent_cache_size
+        self._agents: "OrderedDict[tuple, Agent]" = OrderedDict()
+        self._agents_lock = threading.Lock()
+        self.agent_cache_hits = 0
+        self.agent_cache_misses = 0
+        self.agent_cache_evictions = 0
+        self.agent_for(default)
+
+    @property
+    def agent(self) -> Agent:
+        """The default tenant's agent"""
+        return self.agent_for()
+
+    @staticmethod
+    def _router_key(tenant: Tenant) -> tuple:
+        return tenant.model, tuple(sorted(tenant.sampling.items()))
+
+    def agent_for(self, tenant: Optional[Tenant] = None) -> Agent:
+        """The agent for a tenant's prompt, tools, model and sampling, built on first use"""
+        tenant = tenant or tenant_registry.default()
+        key = tenant.agent_key()
+        with self._agents_lock:
+            agent = self._agents.get(key)
+            if agent is not None:
+                self._agents.move_to_end(key)
+                self.agent_cache_hits += 1
+                return agent
+            self.agent_cache_misses += 1
+            agent = self._agents[key] = self._build_agent(tenant)
+            while len(self._agents) > self.agent_cache_size:
+                self._agents.popitem(last=False)
+                self.agent_cache_evictions += 1
+            return agent
+
+    def _build_agent(self, tenant: Tenant) -> Agent:
+        router_key = self._router_key(tenant)
+        router = self._routers.get(router_key)
+        if router is None:
+            router = self._routers[router_key] = self.router.derive(tenant.model, tenant.sampling)
+        agent = Agent(
+            chat_generator=router,
+            system_prompt=tenant.system_prompt,
+            tools=tool_service.get_tools(tenant.tools),
+            state_schema=tool_service.state_schema,
+            # Tool calls issued in one step run concurrently
+            tool_invoker_kwargs={"max_workers": app_config.tool_parallel_calls},
         )
+        agent.warm_up()
+        return agent
 
-    def run(self, user_message: str, conversation_history: list = None, client_timezone: str = "UTC") -> str:
-        # Set client timezone for tools
-        tool_service.set_client_timezone(client_timezone)
-        
+    def history_token_budget(self, tenant: Optional[Tenant] = None) -> int:
+        """Tokens available for conversation history once the system prompt and reply are reserved"""
+        tenant = tenant or tenant_registry.default()
+        return (
+            app_config.model_context_tokens
+            - tenant.max_tokens
+            - estimate_tokens(tenant.system_prompt)
+        )
+
+    def new_conversation_window(self) -> ConversationWindow:
+        return ConversationWindow(self.history_token_budget(), app_config.conversation_max_messages)
+
+    def _build_messages(self, user_message: str, conversation_history: ConversationWindow = None,
+                        tenant: Optional[Tenant] = None) -> List[ChatMessage]:
         messages = []
         
-        if conversation_history:
-            for msg in conversation_history[-10:]:
-                if msg.get("role") == "user":
-                    messages.append(ChatMessage.from_user(msg["content"]))
-                elif msg.get("role") == "assistant":
-                    messages.append(ChatMessage.from_assistant(msg["content"]))
+        if conversation_history is not None:
+            # Windows are sized for the default tenant; trim further for a longer prompt or reply
+            extra = max(0, conversation_history.token_budget - self.history_token_budget(tenant))
+            messages = conversation_history.messages(reserve_tokens=estimate_tokens(user_message) + extra)
         
         messages.append(ChatMessage.from_user(user_message))
-        result = self.agent.run(messages=messages)
-        return result["messages"][-1].text
+        return messages
+
+    def _cache_key(self, user_message: str, messages: List[ChatMessage], tenant: Tenant) -> str:
+        window = [(msg.role.value, msg.text) for msg in messages[:-1]]
+        return response_cache.make_key(
+            user_message, window, tenant.system_prompt, tenant.model or self.model, tenant.sampling, tenant.tools
+        )
+
+    def _run_turn(self, messages: List[ChatMessage], tool_context: ToolContext = None,
+                  streaming_callback=None, cancel_event: Optional[threading.Event] = None,
+                  agent: Optional[Agent] = None) -> Tuple[str, bool]:
+        """Run the agent and return the response plus whether it is safe to cache"""
+        agent = agent or self.agent_for()
+        started = time.perf_counter()
+        streaming_callback = self._first_chunk_timer(streaming_callback, started)
+        if cancel_event is not None:
+            if cancel_event.is_set():
+                raise TurnCancelled()
+            # Streaming from upstream lets us abort the HTTP response between chunks
+            streaming_callback = self._cancellable_callback(streaming_callback, cancel_event)
+
+        # The tool context travels in the agent state, so concurrent runs never share it;
+        # it also takes the turn deadline to the tool threads
+        tool_context = tool_context or ToolContext()
+        if deadline.current() is not None:
+            tool_context = dataclasses.replace(tool_context, deadline=deadline.current())
+        try:
+            result = agent.run(
+                messages=messages,
+                streaming_callback=streaming_callback,
+                tool_context=tool_context,
+            )
+        except Exception as e:
+            # The agent wraps component errors; deadline and availability errors get their own frames
+            cause = e.__cause__
+            while cause is not None:
+                if isinstance(cause, (DeadlineExceeded, UpstreamUnavailable)):
+                    raise cause
+                cause = cause.__cause__
+            raise
+        TURN_SECONDS.observe(time.perf_counter() - started)
+        self._count_tokens(result["messages"])
+        cacheable = not any(
+            tool_service.is_time_dependent(tool_call.tool_name)
+            for msg in result["messages"]
+            for tool_call in msg.tool_calls
+        )
+        return result["messages"][-1].text, cacheable
+
+    @staticmethod
+    def _first_chunk_timer(streaming_callback, started: float):
+        first_chunk = True
+
+        def on_chunk(chunk):
+            nonlocal first_chunk
+            if first_chunk:
+                first_chunk = False
+                TTFT_SECONDS.observe(time.perf_counter() - started)
+            if streaming_callback is not None:
+                streaming_callback(chunk)
+        return on_chunk
+
+    @staticmethod
+    def _count_tokens(messages: List[ChatMessage]):
+        for msg in messages:
+            usage = msg.meta.get("usage") if msg.meta else None
+            if usage:
+                PROMPT_TOKENS.inc(usage.get("prompt_tokens") or 0)
+                COMPLETION_TOKENS.inc(usage.get("completion_tokens") or 0)
+
+    @staticmethod
+    def _cancellable_callback(streaming_callback, cancel_event: threading.Event):
+        def on_chunk(chunk):
+            if cancel_event.is_set():
+                raise TurnCancelled()
+            if streaming_callback is not None:
+                streaming_callback(chunk)
+        return on_chunk
+
+    def _store(self, key: str, response: str, cacheable: bool):
+        if cacheable:
+            response_cache.set(key, response)
+        else:
+            response_cache.record_bypass()
+
+    def run(self, user_message: str, conversation_history: ConversationWindow = None, tool_context: ToolContext = None,
+            streaming_callback=None, tenant: Optional[Tenant] = None) -> str:
+        messages = self._build_messages(user_message, conversation_history, tenant)
+        response, _ = self._run_turn(messages, tool_context, streaming_callback, agent=self.agent_for(tenant))
+        return response
+
+    async def run_async(self, user_message: str, conversation_history: ConversationWindow = None,
+                        tool_context: ToolContext = None, tenant: Optional[Tenant] = None) -> str:
+        """Run an agent turn on the bounded execution pool without blocking the event loop"""
+        async with aclosing(self._turn(user_message, conversation_history, tool_context, tenant, False)) as events:
+            async for event, text in events:
+                if event == "done":
+                    return text
+
+    async def stream(self, user_message: str, conversation_history: ConversationWindow = None,
+                     tool_context: ToolContext = None, tenant: Optional[Tenant] = None) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Run an agent turn and yield ("delta", text) events as tokens arrive,
+        followed by a single ("done", full_response) event.
+        """
+        async with aclosing(self._turn(user_message, conversation_history, tool_context, tenant, True)) as events:
+            async for event in events:
+                yield event
+
+    async def _turn(self, user_message: str, conversation_history: Optional[ConversationWindow],
+                    tool_context: Optional[ToolContext], tenant: Optional[Tenant],
+                    stream: bool) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Answer from the response cache, or join the identical turn already in
+        flight, or start one. Turns that would send the same request share one
+        upstream call.
+        """
+        tenant = tenant or tenant_registry.default()
+        messages = self._build_messages(user_message, conversation_history, tenant)
+        key = self._cache_key(user_message, messages, tenant)
+        cached = response_cache.get(key)
+        if cached is not None:
+            yield "done", cached
+            return
+
+        agent = self.agent_for(tenant)
+        flight_key = key
+        if agent.tools and tool_context is not None:
+            # Tool results depend on the client's locale; the cache key cannot see that
+            flight_key = f"{key}:{tool_context.timezone}:{tool_context.language}"
+
+        async def call(flight: Flight) -> str:
+            return await self._fly(flight, key, messages, tool_context, agent, stream)
+
+        async with aclosing(single_flight.stream(flight_key, call)) as events:
+            async for event in events:
+                yield event
+
+    async def _fly(self, flight: Flight, key: str, messages: List[ChatMessage],
+                   tool_context: Optional[ToolContext], agent: Agent, stream: bool) -> str:
+        """
+        The upstream call behind a flight. Deltas are published only when the
+        turn that started it streams; streamed turns joining a non-streamed call
+        get the whole response at once, as on a cache hit.
+        """
+        deltas = DeltaStream(asyncio.get_running_loop()) if stream else None
+        cancel_event = threading.Event()
+        turn = asyncio.ensure_future(execution_service.run(
+            self._run_turn,
+            messages,
+            tool_context=tool_context,
+            streaming_callback=deltas.on_chunk if deltas else None,
+            cancel_event=cancel_event,
+            agent=agent,
+        ))
+        try:
+            if deltas is not None:
+                turn.add_done_callback(lambda _: deltas.close())
+                async for delta in deltas:
+                    flight.publish(delta)
+            response, cacheable = await turn
+            self._store(key, response, cacheable)
+            return response
+        finally:
+            if not turn.done():
+                # The worker thread keeps running until the next chunk, then aborts upstream
+                cancel_event.set()
+                turn.cancel()
+
+    def close(self):
+        """Release the routers' shared hedging threads, called from the app lifespan"""
+        self.router.close()
+
+    def get_agent_cache_stats(self) -> dict:
+        """Get built-agent cache statistics"""
+        with self._agents_lock:
+            return {
+                'size': len(self._agents),
+                'max_size': self.agent_cache_size,
+                'hits': self.agent_cache_hits,
+                'misses': self.agent_cache_misses,
+                'evictions': self.agent_cache_evictions,
+                'routers': len(self._routers),
+                **tenant_registry.get_stats(),
+            }
@@ -0,0 +1,104 @@
+"""
+Response Cache Service
+Bounded LRU + TTL cache for agent responses to repeated prompts
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app_config import app_config
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        enabled: Optional[bool] = None,
+    ):
+        self.max_entries = max_entries or app_config.response_cache_max_entries
+        self.ttl_seconds = ttl_seconds or app_config.response_cache_ttl_seconds
+        self.enabled = app_config.response_cache_enabled if enabled is None else enabled
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(message: str) -> str:
+        """Normalize a user message so trivial variations share a cache entry"""
+        return _WHITESPACE.sub(" ", message.casefold()).strip().rstrip("?!. ")
+
+    def make_key(self, user_message: str, window: list, system_prompt: str,
+                 model: str, sampling: dict, tools: Optional[tuple] = None) -> str:
+        """Build a cache key from everything that shapes the completion"""
+        payload = json.dumps(
+            [self.normalize(user_message), window, system_prompt, model, sampling, tools],
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached response, or None on a miss or expired entry"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, response = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return response
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: str, response: str):
+        """Store a response, evicting the least recently used entries over capacity"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def record_bypass(self):
+        """Count a turn that was not cached because it used time-dependent tools"""
+        with self._lock:
+            self.bypassed += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        """Get cache statistics"""
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'bypassed': self.bypassed,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+response_cache = ResponseCache()
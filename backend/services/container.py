@@ -0,0 +1,158 @@
+"""
+Service Container
+Per-process services built on first use, normally from the app lifespan, so
+importing the app is cheap, needs no API_KEY, and a forking server can load
+the code once before any worker creates clients, threads or sockets
+"""
+
+import importlib
+import logging
+import os
+import time
+from functools import cached_property
+from typing import TYPE_CHECKING, Optional
+
+from app_config import app_config
+from services.admission_service import admission_controller
+from services.execution_service import execution_service
+from services.metrics_service import active_connections, active_conversations, admission_in_flight, admission_waiting
+from services.runtime_monitor import runtime_monitor
+
+if TYPE_CHECKING:
+    from services.agent_service import AgentService
+    from services.tenant_service import TenantRegistry
+    from services.tools_service import ToolsService
+    from services.upstream_service import UpstreamClientPool
+    from services.websocket import ConnectionLifecycle, ConnectionManager, WebSocketHandler
+
+logger = logging.getLogger(__name__)
+
+# Modules behind nearly all of the startup time (haystack, openai, httpx)
+PRELOAD_MODULES = (
+    "services.agent_service",
+    "services.conversation",
+    "services.upstream_service",
+    "services.websocket",
+)
+
+
+class ServiceContainer:
+    """
+    The services of one worker process. Each is built the first time it is
+    used; start() builds them all and starts their background tasks.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.preload_seconds: Optional[float] = None
+        self.build_seconds: Optional[float] = None
+        self.startup_seconds: Optional[float] = None
+
+    def preload(self) -> float:
+        """Import the heavy modules without building anything, e.g. before forking workers"""
+        started = time.perf_counter()
+        for module in PRELOAD_MODULES:
+            importlib.import_module(module)
+        self.preload_seconds = time.perf_counter() - started
+        return self.preload_seconds
+
+    @cached_property
+    def agent_service(self) -> "AgentService":
+        from services.agent_service import AgentService
+        return AgentService()
+
+    @cached_property
+    def connection_manager(self) -> "ConnectionManager":
+        from services.websocket import ConnectionManager
+        return ConnectionManager()
+
+    @cached_property
+    def websocket_handler(self) -> "WebSocketHandler":
+        from services.websocket import WebSocketHandler
+        return WebSocketHandler(self.connection_manager, self.agent_service)
+
+    @cached_property
+    def connection_lifecycle(self) -> "ConnectionLifecycle":
+        from services.websocket import ConnectionLifecycle
+        return ConnectionLifecycle(self.connection_manager, self.websocket_handler)
+
+    @cached_property
+    def tool_service(self) -> "ToolsService":
+        from services.tools_service import tool_service
+        return tool_service
+
+    @cached_property
+    def tenant_registry(self) -> "TenantRegistry":
+        from services.tenant_service import tenant_registry
+        return tenant_registry
+
+    @cached_property
+    def upstream_pool(self) -> "UpstreamClientPool":
+        from services.upstream_service import upstream_pool
+        return upstream_pool
+
+    def _register_gauges(self):
+        # Gauges are read when /metrics is scraped rather than updated on every change
+        active_connections.set_function(lambda: self.connection_manager.connection_count)
+        active_conversations.set_function(
+            lambda: self.websocket_handler.get_conversation_stats()['active_conversations']
+        )
+        admission_in_flight.set_function(lambda: admission_controller.in_flight)
+        admission_waiting.set_function(lambda: admission_controller.get_stats()['waiting'])
+
+    async def start(self):
+        """Build every service and start background tasks, called from the app lifespan"""
+        started = time.perf_counter()
+        await runtime_monitor.start()
+        # The lifecycle depends on every other connection-facing service
+        self.connection_lifecycle
+        self.build_seconds = time.perf_counter() - started
+        self._register_gauges()
+
+        await self.connection_manager.start()
+        await self.websocket_handler.conversation_store.start()
+        await self.connection_lifecycle.start()
+        await self.tool_service.runtime.start()
+        if app_config.upstream_warmup:
+            await self.upstream_pool.warmup()
+        self.started = True
+        self.startup_seconds = time.perf_counter() - started
+        logger.info(
+            f"Services started in {self.startup_seconds * 1000:.0f} ms "
+            f"(built in {self.build_seconds * 1000:.0f} ms, pid {os.getpid()})"
+        )
+
+    async def close(self):
+        """Stop background tasks and release resources, called from the app lifespan"""
+        if not self.started:
+            return
+        # A no-op when the server already drained before closing the sockets
+        await self.connection_lifecycle.close()
+        await self.websocket_handler.conversation_store.close()
+        await self.connection_manager.close()
+        execution_service.shutdown(wait=False)
+        self.agent_service.close()
+        self.upstream_pool.close()
+        self.tool_service.runtime.close()
+        await runtime_monitor.close()
+
+    async def drain(self):
+        """Finish in-flight turns and close connections with a retry hint"""
+        if self.started:
+            await self.connection_lifecycle.drain()
+
+    @property
+    def draining(self) -> bool:
+        return self.started and self.connection_lifecycle.draining
+
+    def get_stats(self) -> dict:
+        """Get process startup timings"""
+        def ms(seconds: Optional[float]) -> Optional[float]:
+            return round(seconds * 1000, 1) if seconds is not None else None
+
+        return {
+            'pid': os.getpid(),
+            'preload_ms': ms(self.preload_seconds),
+            'build_ms': ms(self.build_seconds),
+            'startup_ms': ms(self.startup_seconds),
+        }
@@ -0,0 +1,19 @@
+"""
+Conversation Services Package
+"""
+
+from .window import ConversationWindow, estimate_tokens
+from .session_ids import issue_session_id, verify_session_id
+from .store import (
+    ConversationStore,
+    InMemoryConversationStore,
+    SQLiteConversationStore,
+    create_conversation_store,
+)
+
+__all__ = [
+    'ConversationWindow', 'estimate_tokens',
+    'issue_session_id', 'verify_session_id',
+    'ConversationStore', 'InMemoryConversationStore', 'SQLiteConversationStore',
+    'create_conversation_store',
+]
@@ -0,0 +1,34 @@
+"""
+Session IDs
+Conversation ids are issued by the server and signed with SESSION_SECRET, so
+a client can resume a conversation it was given but cannot name another one
+"""
+
+import base64
+import hashlib
+import hmac
+import secrets
+
+from app_config import app_config
+
+# Longer ids are rejected before any hashing
+MAX_SESSION_ID_LENGTH = 128
+
+
+def _sign(token: str) -> str:
+    digest = hmac.new(app_config.session_secret.encode(), token.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:18]).decode()
+
+
+def issue_session_id() -> str:
+    """A new unguessable conversation id"""
+    token = secrets.token_urlsafe(18)
+    return f"{token}.{_sign(token)}"
+
+
+def verify_session_id(session_id) -> bool:
+    """Whether session_id was issued by this server (or another sharing its SESSION_SECRET)"""
+    if not isinstance(session_id, str) or len(session_id) > MAX_SESSION_ID_LENGTH:
+        return False
+    token, _, signature = session_id.partition(".")
+    return bool(token) and hmac.compare_digest(signature.encode(), _sign(token).encode())
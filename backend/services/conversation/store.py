@@ -0,0 +1,290 @@
+"""
+Conversation Stores
+Bounded, pluggable per-session conversation storage that survives reconnects
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from app_config import app_config
+from services.conversation.window import ConversationWindow
+
+logger = logging.getLogger(__name__)
+
+WindowFactory = Callable[[], ConversationWindow]
+
+
+class ConversationStore(ABC):
+    """Interface for session-keyed conversation storage"""
+
+    @abstractmethod
+    async def load(self, session_id: str) -> ConversationWindow:
+        """Return the conversation window for a session, creating an empty one if needed"""
+
+    @abstractmethod
+    async def append_turn(self, session_id: str, user_message: str, assistant_message: str):
+        """Record a completed user/assistant turn"""
+
+    @abstractmethod
+    async def delete(self, session_id: str):
+        """Forget a session"""
+
+    @abstractmethod
+    def get_stats(self) -> dict:
+        """Get store statistics"""
+
+    async def release(self, session_id: str):
+        """Drop a session from memory if a durable copy exists; a later load restores it"""
+
+    async def start(self):
+        """Start background work, called from the app lifespan"""
+
+    async def close(self):
+        """Flush and release resources, called from the app lifespan"""
+
+
+class InMemoryConversationStore(ConversationStore):
+    def __init__(self, window_factory: WindowFactory, max_sessions: Optional[int] = None):
+        self.window_factory = window_factory
+        self.max_sessions = max_sessions or app_config.conversation_max_sessions
+        self._sessions: "OrderedDict[str, ConversationWindow]" = OrderedDict()
+        self.evictions = 0
+        # Kept incrementally so get_stats never walks every conversation
+        self.total_messages = 0
+
+    def _get_cached(self, session_id: str) -> Optional[ConversationWindow]:
+        window = self._sessions.get(session_id)
+        if window is not None:
+            self._sessions.move_to_end(session_id)
+        return window
+
+    def _put(self, session_id: str, window: ConversationWindow):
+        self._sessions[session_id] = window
+        self._sessions.move_to_end(session_id)
+        self.total_messages += len(window)
+        while len(self._sessions) > self.max_sessions:
+            evicted_id, evicted = self._sessions.popitem(last=False)
+            self.total_messages -= len(evicted)
+            self.evictions += 1
+            logger.debug(f"Evicted conversation {evicted_id} from memory")
+
+    async def load(self, session_id: str) -> ConversationWindow:
+        window = self._get_cached(session_id)
+        if window is None:
+            window = self.window_factory()
+            self._put(session_id, window)
+        return window
+
+    async def append_turn(self, session_id: str, user_message: str, assistant_message: str):
+        window = await self.load(session_id)
+        before = len(window)
+        window.append("user", user_message)
+        window.append("assistant", assistant_message)
+        # Appending may also trim old messages, so count the net change
+        self.total_messages += len(window) - before
+
+    async def delete(self, session_id: str):
+        window = self._sessions.pop(session_id, None)
+        if window is not None:
+            self.total_messages -= len(window)
+
+    def get_stats(self) -> dict:
+        return {
+            'backend': 'memory',
+            'active_conversations': len(self._sessions),
+            'total_messages': self.total_messages,
+            'max_sessions': self.max_sessions,
+            'evictions': self.evictions,
+        }
+
+
+class SQLiteConversationStore(InMemoryConversationStore):
+    """
+    Keeps hot sessions in the in-memory LRU and persists turns to SQLite in
+    WAL mode. Writes are batched behind a flush interval; all database work
+    runs on one dedicated thread, so a load always sees earlier writes.
+    """
+
+    def __init__(
+        self,
+        window_factory: WindowFactory,
+        path: Optional[str] = None,
+        max_sessions: Optional[int] = None,
+        max_messages: Optional[int] = None,
+        flush_interval_ms: Optional[int] = None,
+        flush_batch_size: Optional[int] = None,
+    ):
+        super().__init__(window_factory, max_sessions)
+        self.path = path or app_config.conversation_db_path
+        self.max_messages = max_messages or app_config.conversation_max_messages
+        self.flush_interval = (flush_interval_ms or app_config.conversation_flush_interval_ms) / 1000
+        self.flush_batch_size = flush_batch_size or app_config.conversation_flush_batch_size
+
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-db")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pending: List[Tuple[str, str, str, float]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_wakeup = asyncio.Event()
+
+        self.rows_written = 0
+        self.flushes = 0
+        self.loads = 0
+
+    # Database thread
+
+    def _open(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, seq)"
+        )
+        self._conn.commit()
+
+    def _write_batch(self, rows: List[Tuple[str, str, str, float]]):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO messages (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            # Keep only the newest max_messages rows for every session touched by this batch
+            for session_id in {row[0] for row in rows}:
+                self._conn.execute(
+                    """
+                    DELETE FROM messages WHERE session_id = ? AND seq <= (
+                        SELECT seq FROM messages WHERE session_id = ?
+                        ORDER BY seq DESC LIMIT 1 OFFSET ?
+                    )
+                    """,
+                    (session_id, session_id, self.max_messages),
+                )
+
+    def _read_session(self, session_id: str) -> List[Tuple[str, str]]:
+        rows = self._conn.execute(
+            "SELECT role, content FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+            (session_id, self.max_messages),
+        ).fetchall()
+        rows.reverse()
+        return rows
+
+    def _delete_session(self, session_id: str):
+        with self._conn:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+
+    # Event loop side
+
+    async def _run_db(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._db_executor, func, *args)
+
+    async def start(self):
+        await self._run_db(self._open)
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        logger.info(f"SQLite conversation store opened at {self.path}")
+
+    async def close(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        if self._conn is not None:
+            await self._run_db(self._conn.close)
+        self._db_executor.shutdown(wait=True)
+
+    async def flush(self):
+        """Write all pending rows in one transaction"""
+        if not self._pending or self._conn is None:
+            return
+        rows, self._pending = self._pending, []
+        try:
+            await self._run_db(self._write_batch, rows)
+            self.rows_written += len(rows)
+            self.flushes += 1
+        except Exception as e:
+            logger.error(f"Failed to persist {len(rows)} conversation rows: {e}")
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_wakeup.clear()
+            await self.flush()
+
+    async def load(self, session_id: str) -> ConversationWindow:
+        window = self._get_cached(session_id)
+        if window is not None:
+            return window
+
+        window = self.window_factory()
+        if self._conn is not None:
+            # Pending rows must land before reading so a reconnect sees its latest turn
+            await self.flush()
+            for role, content in await self._run_db(self._read_session, session_id):
+                window.append(role, content)
+            self.loads += 1
+
+        # Another coroutine may have loaded the same session while we were reading
+        cached = self._get_cached(session_id)
+        if cached is not None:
+            return cached
+        self._put(session_id, window)
+        return window
+
+    async def append_turn(self, session_id: str, user_message: str, assistant_message: str):
+        await super().append_turn(session_id, user_message, assistant_message)
+        now = time.time()
+        self._pending.append((session_id, "user", user_message, now))
+        self._pending.append((session_id, "assistant", assistant_message, now))
+        if len(self._pending) >= self.flush_batch_size:
+            self._flush_wakeup.set()
+
+    async def delete(self, session_id: str):
+        await super().delete(session_id)
+        self._pending = [row for row in self._pending if row[0] != session_id]
+        if self._conn is not None:
+            await self._run_db(self._delete_session, session_id)
+
+    async def release(self, session_id: str):
+        # Pending rows stay queued and load() flushes them before reading back
+        await InMemoryConversationStore.delete(self, session_id)
+
+    def get_stats(self) -> dict:
+        return {
+            **super().get_stats(),
+            'backend': 'sqlite',
+            'pending_writes': len(self._pending),
+            'rows_written': self.rows_written,
+            'flushes': self.flushes,
+            'loads': self.loads,
+        }
+
+
+def create_conversation_store(window_factory: WindowFactory) -> ConversationStore:
+    """Build the conversation store selected by CONVERSATION_STORE"""
+    backend = app_config.conversation_store.lower()
+    if backend == "sqlite":
+        return SQLiteConversationStore(window_factory)
+    if backend != "memory":
+        logger.warning(f"Unknown CONVERSATION_STORE '{backend}', falling back to memory")
+    return InMemoryConversationStore(window_factory)
@@ -0,0 +1,78 @@
+"""
+Conversation Window
+Token-budgeted, incrementally maintained message history for one session
+"""
+
+from collections import deque
+from itertools import islice
+from typing import Deque, List, Optional, Tuple
+
+from haystack.dataclasses import ChatMessage, ChatRole
+
+# Rough characters-per-token ratio for English text with Llama-style tokenizers
+CHARS_PER_TOKEN = 4
+# Per-message overhead for role markers and separators in the chat template
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of a message without running a tokenizer"""
+    return len(text) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+class ConversationWindow:
+    def __init__(self, token_budget: int, max_messages: Optional[int] = None):
+        self.token_budget = token_budget
+        self.max_messages = max_messages
+        self._messages: Deque[Tuple[ChatMessage, int]] = deque()
+        self.total_tokens = 0
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def append(self, role: str, content: str):
+        """Append a message, converting it once and trimming the oldest turns over budget"""
+        if role == "user":
+            message = ChatMessage.from_user(content)
+        elif role == "assistant":
+            message = ChatMessage.from_assistant(content)
+        else:
+            raise ValueError(f"Unsupported conversation role: {role}")
+
+        tokens = estimate_tokens(content)
+        self._messages.append((message, tokens))
+        self.total_tokens += tokens
+        self._trim(0)
+
+    def messages(self, reserve_tokens: int = 0) -> List[ChatMessage]:
+        """
+        Return the window as ChatMessages, leaving out the oldest turns so that
+        reserve_tokens (e.g. the incoming user message) still fit. The window
+        itself is not trimmed; the store counts its messages.
+        """
+        excess = self.total_tokens + reserve_tokens - self.token_budget
+        skip = 0
+        for message, tokens in self._messages:
+            # Whole turns only: never start on a reply whose prompt was left out
+            if excess <= 0 and message.is_from(ChatRole.USER):
+                break
+            excess -= tokens
+            skip += 1
+        return [message for message, _ in islice(self._messages, skip, None)]
+
+    def _trim(self, reserve_tokens: int):
+        # Each message is popped at most once, so trimming is amortized O(1) per append
+        while self._messages and (
+            self.total_tokens + reserve_tokens > self.token_budget
+            or (self.max_messages is not None and len(self._messages) > self.max_messages)
+        ):
+            _, tokens = self._messages.popleft()
+            self.total_tokens -= tokens
+        # Whole turns only: a reply whose prompt was trimmed would confuse the model
+        while self._messages and not self._messages[0][0].is_from(ChatRole.USER):
+            _, tokens = self._messages.popleft()
+            self.total_tokens -= tokens
+
+    def clear(self):
+        self._messages.clear()
+        self.total_tokens = 0
@@ -0,0 +1,88 @@
+"""
+Turn Deadlines
+An end-to-end deadline for the current turn, carried in a contextvar from the
+message handler through the execution pool, the agent, upstream requests and
+tool calls, so every wait inside a turn is bounded by what is left of it
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from app_config import app_config
+
+# Monotonic time the current turn must finish by, or None for no deadline
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("turn_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a turn runs out of time; the client gets a friendly error frame"""
+
+    code = "timeout"
+    message = "The assistant is taking too long to respond. Please try again."
+
+    def __init__(self, detail: str = "Turn deadline exceeded", retry_after: Optional[float] = None):
+        super().__init__(detail)
+        self.retry_after = retry_after
+
+
+@contextmanager
+def turn_deadline(seconds: Optional[float] = None) -> Iterator[Optional[float]]:
+    """
+    Set the deadline for the turn running in this context (TURN_DEADLINE_SECONDS
+    by default; 0 disables it). A tighter deadline already in effect is kept.
+    """
+    seconds = app_config.turn_deadline_seconds if seconds is None else seconds
+    deadline = time.monotonic() + seconds if seconds > 0 else None
+    current = _deadline.get()
+    if current is not None and (deadline is None or current < deadline):
+        deadline = current
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def deadline_at(deadline: Optional[float]) -> Iterator[Optional[float]]:
+    """
+    Run with a deadline captured elsewhere (see current()), e.g. on a thread
+    that did not inherit the turn's context. None keeps the deadline in effect.
+    """
+    if deadline is None:
+        yield _deadline.get()
+        return
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def current() -> Optional[float]:
+    """The monotonic time the current turn must finish by, or None"""
+    return _deadline.get()
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current turn (never negative), or None without a deadline"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def bound(seconds: float) -> float:
+    """A timeout of at most seconds that also ends with the turn; 0 (no limit) becomes the time left"""
+    left = remaining()
+    if left is None:
+        return seconds
+    return min(seconds, left) if seconds else left
+
+
+def check():
+    """Raise DeadlineExceeded if the current turn is out of time"""
+    if remaining() == 0.0:
+        raise DeadlineExceeded()
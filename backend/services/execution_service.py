@@ -0,0 +1,72 @@
+"""
+Agent Execution Service
+Runs blocking agent turns on a bounded worker pool so the event loop stays responsive
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app_config import app_config
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutionService:
+    def __init__(self, max_concurrency: Optional[int] = None):
+        self.max_concurrency = max_concurrency or app_config.agent_max_concurrency
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="agent-worker"
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        # Gauges and counters exposed on /status
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking callable on the worker pool, waiting for a free slot first"""
+        self.queue_depth += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queue_depth -= 1
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            # run_in_executor does not carry contextvars over to the worker thread
+            ctx = contextvars.copy_context()
+            call = functools.partial(ctx.run, func, *args, **kwargs)
+            result = await loop.run_in_executor(self._executor, call)
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def get_stats(self) -> dict:
+        """Get execution pool statistics"""
+        return {
+            'max_concurrency': self.max_concurrency,
+            'in_flight': self.in_flight,
+            'queue_depth': self.queue_depth,
+            'completed': self.completed,
+            'failed': self.failed,
+        }
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker pool"""
+        logger.info("Shutting down agent execution pool")
+        self._executor.shutdown(wait=wait)
+
+
+execution_service = ExecutionService()
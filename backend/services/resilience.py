@@ -0,0 +1,196 @@
+"""
+Upstream Resilience
+Circuit breakers that fail fast while an endpoint is unhealthy and probe it
+back with half-open requests, a retry budget that keeps retries a bounded
+fraction of traffic, and jittered exponential backoff between attempts
+"""
+
+import logging
+import random
+import threading
+import time
+from typing import Optional
+
+from app_config import app_config
+from services.metrics_service import metrics
+
+logger = logging.getLogger(__name__)
+
+circuit_transitions = metrics.counter(
+    "chat_upstream_circuit_transitions_total", "Upstream circuit breaker state changes", ["upstream", "state"]
+)
+upstream_retries = metrics.counter(
+    "chat_upstream_retries_total", "Upstream retries, by whether the retry budget allowed them", ["outcome"]
+)
+
+
+class UpstreamUnavailable(Exception):
+    """Raised without calling upstream while every endpoint's circuit is open"""
+
+    code = "upstream_unavailable"
+    message = "The assistant is temporarily unavailable. Please try again shortly."
+
+    def __init__(self, detail: str = "All upstream circuits are open", retry_after: Optional[float] = None):
+        super().__init__(detail)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed: requests flow and consecutive failures are counted. After
+    failure_threshold of them the circuit opens and requests are refused for
+    open_seconds. It then goes half-open: up to half_open_probes requests are
+    let through, and the first verdict closes or reopens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: Optional[int] = None, open_seconds: Optional[float] = None,
+                 half_open_probes: Optional[int] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or app_config.upstream_eject_after_failures
+        self.open_seconds = open_seconds or app_config.upstream_eject_seconds
+        self.half_open_probes = half_open_probes or app_config.upstream_half_open_probes
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.opens = 0
+        self.rejected = 0
+        # Shared by the routers of every tenant using this endpoint, across agent threads
+        self._lock = threading.Lock()
+
+    def _refresh(self, now: float):
+        if self.state == self.OPEN and now >= self.opened_at + self.open_seconds:
+            self._transition(self.HALF_OPEN)
+            self.probes = 0
+
+    def _transition(self, state: str):
+        self.state = state
+        circuit_transitions.labels(upstream=self.name, state=state).inc()
+
+    def available(self) -> bool:
+        """Whether a request would be let through right now"""
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self.state == self.CLOSED or (
+                self.state == self.HALF_OPEN and self.probes < self.half_open_probes
+            )
+
+    def acquire(self) -> Optional[str]:
+        """Admit one request: the state it was admitted in, or None if refused"""
+        with self._lock:
+            self._refresh(time.monotonic())
+            if self.state == self.CLOSED:
+                return self.CLOSED
+            if self.state == self.HALF_OPEN and self.probes < self.half_open_probes:
+                self.probes += 1
+                return self.HALF_OPEN
+            self.rejected += 1
+            return None
+
+    def release(self, ticket: Optional[str], success: Optional[bool]):
+        """Report an admitted request's outcome; None means no verdict (e.g. abandoned)"""
+        if ticket is None:
+            return
+        with self._lock:
+            if ticket == self.HALF_OPEN and self.state == self.HALF_OPEN:
+                self.probes -= 1
+            if success is None:
+                return
+            if success:
+                self.consecutive_failures = 0
+                if self.state != self.CLOSED:
+                    logger.info(f"Upstream {self.name} recovered, closing its circuit")
+                    self._transition(self.CLOSED)
+                return
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold
+            ):
+                logger.warning(
+                    f"Opening circuit for upstream {self.name} for {self.open_seconds}s "
+                    f"after {self.consecutive_failures} consecutive failures"
+                )
+                self.opened_at = time.monotonic()
+                self.opens += 1
+                self._transition(self.OPEN)
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit lets a probe through"""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            self._refresh(time.monotonic())
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'opens': self.opens,
+                'rejected': self.rejected,
+            }
+
+
+class RetryBudget:
+    """
+    Token bucket limiting retries to a fraction of requests. Every first
+    attempt deposits ratio tokens and min_per_second tokens accrue over time
+    (so low traffic can still retry); a retry spends one. During an outage
+    retries stop once the bucket is empty instead of multiplying the load.
+    """
+
+    def __init__(self, ratio: Optional[float] = None, min_per_second: Optional[float] = None,
+                 capacity: float = 10.0):
+        self.ratio = app_config.upstream_retry_budget_ratio if ratio is None else ratio
+        self.min_per_second = (
+            app_config.upstream_retry_min_per_second if min_per_second is None else min_per_second
+        )
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.retries = 0
+        self.exhausted = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.min_per_second)
+        self.updated_at = now
+
+    def record_request(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        """Take a token for one retry, or refuse it when the budget is spent"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.retries += 1
+                upstream_retries.labels(outcome="allowed").inc()
+                return True
+            self.exhausted += 1
+            upstream_retries.labels(outcome="budget_exhausted").inc()
+            return False
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                'tokens': round(self.tokens, 2),
+                'retries': self.retries,
+                'exhausted': self.exhausted,
+            }
+
+
+def backoff_delay(attempt: int, base: Optional[float] = None, cap: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff before retry number attempt (1-based)"""
+    base = app_config.upstream_retry_backoff_ms / 1000 if base is None else base
+    cap = app_config.upstream_retry_backoff_max_ms / 1000 if cap is None else cap
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
@@ -0,0 +1,80 @@
+"""
+Runtime Monitor
+Samples event-loop lag and process memory so overload is visible before timeouts are
+"""
+
+import asyncio
+import logging
+import os
+import resource
+import time
+from collections import deque
+from typing import Deque, Optional
+
+from app_config import app_config
+from services.metrics_service import metrics
+
+logger = logging.getLogger(__name__)
+
+loop_lag_seconds = metrics.histogram(
+    "chat_event_loop_lag_seconds",
+    "How late the event loop woke up for a scheduled sleep",
+)
+process_rss_bytes = metrics.gauge("chat_process_rss_bytes", "Resident set size of this worker")
+
+
+def current_rss_bytes() -> int:
+    """Current resident set size; falls back to the peak where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+class RuntimeMonitor:
+    def __init__(self, interval_ms: Optional[int] = None, window: int = 600):
+        self.interval = (interval_ms or app_config.loop_lag_interval_ms) / 1000
+        self._recent: Deque[float] = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._sample())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _sample(self):
+        while True:
+            scheduled = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - scheduled - self.interval)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self._recent.append(lag)
+            loop_lag_seconds.observe(lag)
+
+    def get_stats(self) -> dict:
+        """Get event-loop lag (over the recent sample window) and memory statistics"""
+        recent = sorted(self._recent)
+        p99 = recent[min(len(recent) - 1, int(len(recent) * 0.99))] if recent else 0.0
+        return {
+            'event_loop_lag_ms': round(self.last_lag * 1000, 3),
+            'event_loop_lag_p99_ms': round(p99 * 1000, 3),
+            'event_loop_lag_max_ms': round(self.max_lag * 1000, 3),
+            'rss_bytes': current_rss_bytes(),
+            'pid': os.getpid(),
+        }
+
+
+runtime_monitor = RuntimeMonitor()
+process_rss_bytes.set_function(current_rss_bytes)
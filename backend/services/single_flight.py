@@ -0,0 +1,142 @@
+"""
+Single-Flight Service
+Coalesces identical in-flight agent turns into one upstream call whose deltas
+and result fan out to every waiting client
+"""
+
+import asyncio
+import contextvars
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app_config import app_config
+from services import deadline
+from services.metrics_service import metrics
+
+logger = logging.getLogger(__name__)
+
+coalesced_turns = metrics.counter(
+    "chat_coalesced_turns_total", "Turns answered by joining an identical in-flight upstream call"
+)
+
+
+class Flight:
+    """One shared upstream call: the deltas so far, its outcome and how many clients wait on it"""
+
+    def __init__(self):
+        self.deltas: List[str] = []
+        self.response: Optional[str] = None
+        self.error: Optional[BaseException] = None
+        self.finished = False
+        self.waiters = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, delta: str):
+        """Append a delta for every waiter, including ones that join later"""
+        self.deltas.append(delta)
+        self._notify()
+
+    def finish(self, response: Optional[str] = None, error: Optional[BaseException] = None):
+        self.response = response
+        self.error = error
+        self.finished = True
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self) -> AsyncIterator[Tuple[str, str]]:
+        """Replay the deltas from the start, then follow live ones until the call finishes"""
+        index = 0
+        while True:
+            # Captured before draining, so an update during the yields is never missed
+            changed = self._changed
+            while index < len(self.deltas):
+                yield "delta", self.deltas[index]
+                index += 1
+            if self.finished:
+                break
+            await changed.wait()
+        if self.error is not None:
+            raise self.error
+        yield "done", self.response
+
+
+class SingleFlight:
+    """
+    Runs at most one upstream call per key. Waiters only read the shared
+    flight, so cancelling one never affects the others; the call itself is
+    aborted when its last waiter leaves. The call runs in a fresh context with
+    its own turn deadline rather than the first caller's, so joiners are not
+    cut short by the leader's remaining time; each waiter still stops
+    following at its own deadline.
+    """
+
+    def __init__(self, enabled: Optional[bool] = None):
+        self.enabled = app_config.single_flight_enabled if enabled is None else enabled
+        self.flights: Dict[str, Flight] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def stream(self, key: str, call: Callable[[Flight], Awaitable[str]]) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Yield ("delta", text) events and a final ("done", response) from the
+        flight for key, starting call(flight) if none is in flight.
+        """
+        flight = self.flights.get(key) if self.enabled else None
+        if flight is None:
+            flight = Flight()
+            flight.task = asyncio.get_running_loop().create_task(
+                self._fly(key, flight, call), context=contextvars.Context()
+            )
+            if self.enabled:
+                self.flights[key] = flight
+            self.calls += 1
+        else:
+            self.coalesced += 1
+            coalesced_turns.inc()
+
+        flight.waiters += 1
+        try:
+            async for event in flight.follow():
+                yield event
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody is left to read the reply; stop paying for it
+                self._forget(key, flight)
+                flight.task.cancel()
+                self.abandoned += 1
+
+    async def _fly(self, key: str, flight: Flight, call: Callable[[Flight], Awaitable[str]]):
+        try:
+            with deadline.turn_deadline():
+                flight.finish(response=await call(flight))
+        except asyncio.CancelledError as e:
+            flight.finish(error=e)
+            raise
+        except Exception as e:
+            flight.finish(error=e)
+        finally:
+            self._forget(key, flight)
+
+    def _forget(self, key: str, flight: Flight):
+        # Later identical turns start a fresh call (or hit the response cache)
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    def get_stats(self) -> dict:
+        """Get coalescing statistics"""
+        return {
+            'enabled': self.enabled,
+            'in_flight': len(self.flights),
+            'upstream_calls': self.calls,
+            'coalesced_turns': self.coalesced,
+            'abandoned_calls': self.abandoned,
+        }
+
+
+single_flight = SingleFlight()
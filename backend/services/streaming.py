@@ -0,0 +1,65 @@
+"""
+Streaming Service
+Bridges generator streaming callbacks from worker threads into coalesced async deltas
+"""
+
+import asyncio
+import time
+from typing import AsyncIterator, List, Optional
+
+from app_config import app_config
+
+_STREAM_END = object()
+
+
+class DeltaStream:
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        flush_interval_ms: Optional[int] = None,
+        flush_chars: Optional[int] = None,
+    ):
+        self.loop = loop
+        self.flush_interval = (flush_interval_ms or app_config.stream_flush_interval_ms) / 1000
+        self.flush_chars = flush_chars or app_config.stream_flush_chars
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    def on_chunk(self, chunk):
+        """Streaming callback for haystack generators, safe to call from any thread"""
+        if chunk.content:
+            self.loop.call_soon_threadsafe(self._queue.put_nowait, chunk.content)
+
+    def close(self):
+        """Signal the end of the stream, safe to call from any thread"""
+        self.loop.call_soon_threadsafe(self._queue.put_nowait, _STREAM_END)
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        """Yield deltas coalesced into windows of flush_interval or flush_chars"""
+        buffer: List[str] = []
+        buffered = 0
+        deadline = None
+
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+
+            if item is _STREAM_END:
+                break
+
+            if item is not None:
+                buffer.append(item)
+                buffered += len(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if buffer and (item is None or buffered >= self.flush_chars):
+                yield "".join(buffer)
+                buffer = []
+                buffered = 0
+                deadline = None
+
+        if buffer:
+            yield "".join(buffer)
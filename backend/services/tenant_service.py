@@ -0,0 +1,143 @@
+"""
+Tenant Service
+Per-customer system prompt, tool subset, model and sampling, selected by a
+connect parameter or the widget's Origin
+"""
+
+import json
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from app_config import app_config
+from services.prompt_service import prompt_service
+from services.tools_service import tool_service
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT = "default"
+
+
+@dataclass(frozen=True)
+class Tenant:
+    """Everything that shapes a tenant's agent; equal settings share one built agent"""
+    name: str
+    system_prompt: str
+    model: str = ""  # empty: each upstream's configured model
+    temperature: float = 0.7
+    max_tokens: int = 1024
+    top_p: float = 1.0
+    tools: Optional[Tuple[str, ...]] = None  # None: every registered tool
+    origins: Tuple[str, ...] = ()
+
+    @property
+    def sampling(self) -> dict:
+        return {"temperature": self.temperature, "max_tokens": self.max_tokens, "top_p": self.top_p}
+
+    def agent_key(self) -> tuple:
+        """Key of the agent cache; the tenant name and origins do not change the agent"""
+        return self.system_prompt, self.tools, self.model, self.temperature, self.max_tokens, self.top_p
+
+    def allows(self, origin: str) -> bool:
+        return not self.origins or _normalize_origin(origin) in self.origins
+
+
+def _normalize_origin(origin: str) -> str:
+    return origin.strip().rstrip("/").lower()
+
+
+class TenantRegistry:
+    """
+    Tenants from TENANTS_FILE, a JSON list of objects with name and optional
+    origins, system_prompt, tools, model, temperature, max_tokens and top_p.
+    Unset values fall back to the process-wide settings. Without a matching
+    tenant, clients get the default tenant, whose prompt follows
+    prompt_service.set_system_prompt.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = app_config.tenants_file if path is None else path
+        self.tenants: Dict[str, Tenant] = {}
+        self.by_origin: Dict[str, Tenant] = {}
+        self._default: Optional[Tenant] = None
+        if self.path:
+            for tenant in self._load(self.path):
+                self.add(tenant)
+            logger.info(f"Loaded {len(self.tenants)} tenants from {self.path}")
+
+    @staticmethod
+    def _load(path: str) -> List[Tenant]:
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+        known_tools = {tool.name for tool in tool_service.get_tools()}
+        tenants = []
+        for entry in entries:
+            tools = entry.get("tools")
+            if tools is not None:
+                unknown = set(tools) - known_tools
+                if unknown:
+                    raise ValueError(f"Tenant {entry['name']} uses unknown tools: {sorted(unknown)}")
+                tools = tuple(sorted(tools))
+            tenants.append(Tenant(
+                name=entry["name"],
+                system_prompt=entry.get("system_prompt") or app_config.system_prompt,
+                model=entry.get("model", ""),
+                temperature=float(entry.get("temperature", app_config.model_temperature)),
+                max_tokens=int(entry.get("max_tokens", app_config.model_max_tokens)),
+                top_p=float(entry.get("top_p", app_config.model_top_p)),
+                tools=tools,
+                origins=tuple(_normalize_origin(origin) for origin in entry.get("origins", [])),
+            ))
+        return tenants
+
+    def add(self, tenant: Tenant):
+        """Register a tenant, replacing one with the same name"""
+        if tenant.name == DEFAULT_TENANT:
+            raise ValueError(f"Tenant name {DEFAULT_TENANT!r} is reserved")
+        previous = self.tenants.get(tenant.name)
+        if previous is not None:
+            for origin in previous.origins:
+                self.by_origin.pop(origin, None)
+        self.tenants[tenant.name] = tenant
+        for origin in tenant.origins:
+            self.by_origin[origin] = tenant
+
+    def default(self) -> Tenant:
+        """The tenant for clients no other tenant claims, rebuilt when the system prompt changes"""
+        prompt = prompt_service.get_system_prompt()
+        if self._default is None or self._default.system_prompt != prompt:
+            self._default = Tenant(
+                name=DEFAULT_TENANT,
+                system_prompt=prompt,
+                temperature=app_config.model_temperature,
+                max_tokens=app_config.model_max_tokens,
+                top_p=app_config.model_top_p,
+            )
+        return self._default
+
+    def get(self, name: Optional[str]) -> Tenant:
+        """Look up a tenant resolved earlier; unknown names get the default tenant"""
+        return self.tenants.get(name) or self.default()
+
+    def resolve(self, requested: Optional[str], origin: Optional[str]) -> Tenant:
+        """
+        Pick the tenant for a client: an explicit ?tenant= wins if the tenant
+        allows the client's Origin, then the tenant registered for the Origin,
+        then the default tenant.
+        """
+        origin = origin or ""
+        if requested:
+            tenant = self.tenants.get(requested)
+            if tenant is not None and tenant.allows(origin):
+                return tenant
+            logger.info(f"Tenant {requested!r} unknown or not allowed for origin {origin!r}")
+        return self.by_origin.get(_normalize_origin(origin)) or self.default()
+
+    def get_stats(self) -> dict:
+        return {
+            'tenants': len(self.tenants),
+            'origins': len(self.by_origin),
+        }
+
+
+tenant_registry = TenantRegistry()
@@ -0,0 +1,246 @@
+"""
+Tool Runtime
+Runs tool functions for the agent: async support, per-tool timeouts, TTL result
+caching and per-tool latency statistics
+"""
+
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from haystack.tools import Tool
+
+from app_config import app_config
+from services import deadline
+from services.metrics_service import TOOL_SECONDS, errors_total, metrics
+
+logger = logging.getLogger(__name__)
+
+tool_seconds = metrics.histogram("chat_tool_seconds", "Latency of each tool, including cache hits", ["tool"])
+tool_cache_hits = metrics.counter("chat_tool_cache_hits_total", "Tool calls answered from the result cache", ["tool"])
+
+
+class ToolTimeout(Exception):
+    """Raised when a tool does not finish within its timeout; the model sees it as a tool error"""
+
+
+@dataclass
+class ToolPolicy:
+    """
+    How the runtime executes one tool.
+
+    timeout: seconds before the call is abandoned (0 runs inline with no limit).
+    cache_ttl: seconds a result is reused for the same arguments (0 disables).
+    cache_key: extra key from the tool context, e.g. the timezone; by default
+    the context's timezone and language.
+    """
+    timeout: float = 0.0
+    cache_ttl: float = 0.0
+    cache_key: Optional[Callable[[Any], Hashable]] = None
+
+
+class _ToolStats:
+    __slots__ = ("calls", "errors", "timeouts", "cache_hits", "total_seconds", "max_seconds", "lock")
+
+    def __init__(self):
+        # Calls of one step run on parallel threads
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.cache_hits = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'cache_hits': self.cache_hits,
+            'mean_ms': round(self.total_seconds / self.calls * 1000, 3) if self.calls else None,
+            'max_ms': round(self.max_seconds * 1000, 3),
+        }
+
+
+class _TTLCache:
+    """Small thread-safe LRU whose entries expire after ttl seconds"""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def _with_context_parameter(signature: inspect.Signature) -> inspect.Signature:
+    """signature plus an optional keyword-only tool_context, which the invoker fills from the agent state"""
+    parameters = list(signature.parameters.values())
+    context = inspect.Parameter("tool_context", inspect.Parameter.KEYWORD_ONLY, default=None)
+    position = len(parameters)
+    if parameters and parameters[-1].kind == inspect.Parameter.VAR_KEYWORD:
+        position -= 1
+    parameters.insert(position, context)
+    return signature.replace(parameters=parameters)
+
+
+def _default_cache_key(tool_context) -> Hashable:
+    if tool_context is None:
+        return None
+    return tool_context.timezone, tool_context.language
+
+
+class ToolRuntime:
+    """
+    Wraps tool functions so the agent's ToolInvoker (which already runs the
+    tool calls of one step in parallel threads) gets async support, timeouts,
+    caching and statistics without knowing about any of them.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, cache_max_entries: Optional[int] = None):
+        self.max_workers = max_workers or app_config.tool_max_workers
+        self.cache_max_entries = cache_max_entries or app_config.tool_cache_max_entries
+        # Sync tools with a timeout run here so the calling agent thread can stop waiting
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tool-worker")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stats: Dict[str, _ToolStats] = {}
+        self.policies: Dict[str, ToolPolicy] = {}
+
+    async def start(self):
+        """Bind the event loop that async tools run on, called from the app lifespan"""
+        self._loop = asyncio.get_running_loop()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def wrap(self, tool: Tool, policy: Optional[ToolPolicy] = None) -> Tool:
+        """
+        Install the runtime around tool.function. The wrapper keeps the
+        signature used for state injection, plus a tool_context parameter so
+        every tool call gets the turn deadline.
+        """
+        policy = policy or ToolPolicy(timeout=app_config.tool_timeout_seconds)
+        function = tool.function
+        is_async = inspect.iscoroutinefunction(function)
+        accepts_context = "tool_context" in inspect.signature(function).parameters
+        cache = _TTLCache(policy.cache_ttl, self.cache_max_entries) if policy.cache_ttl > 0 else None
+        cache_key = policy.cache_key or _default_cache_key
+        stats = self.stats.setdefault(tool.name, _ToolStats())
+        self.policies[tool.name] = policy
+        latency = tool_seconds.labels(tool=tool.name)
+        hits = tool_cache_hits.labels(tool=tool.name)
+        name = tool.name
+
+        @functools.wraps(function)
+        def run(*args, **kwargs):
+            tool_context = kwargs.get("tool_context") if accepts_context else kwargs.pop("tool_context", None)
+            # The invoker's threads lost the turn's contextvars; restore its deadline
+            with deadline.deadline_at(getattr(tool_context, "deadline", None)):
+                return invoke(args, kwargs)
+
+        def invoke(args: tuple, kwargs: dict):
+            started = time.perf_counter()
+            try:
+                key = None
+                if cache is not None:
+                    arguments = {k: v for k, v in kwargs.items() if k != "tool_context"}
+                    context_key = cache_key(kwargs.get("tool_context")) if accepts_context else None
+                    key = (json.dumps(arguments, sort_keys=True, default=str), context_key)
+                    entry = cache.get(key)
+                    if entry is not None:
+                        with stats.lock:
+                            stats.cache_hits += 1
+                        hits.inc()
+                        return entry[1]
+
+                # Tools called once the turn is out of time fail straight away
+                deadline.check()
+                # Inline tools stay inline; the others also stop waiting at the turn deadline
+                timeout = deadline.bound(policy.timeout) if policy.timeout or is_async else 0
+                result = self._call(name, function, is_async, timeout, args, kwargs, stats)
+                if cache is not None:
+                    cache.put(key, result)
+                return result
+            except Exception:
+                with stats.lock:
+                    stats.errors += 1
+                errors_total.labels(kind="tool").inc()
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                with stats.lock:
+                    stats.calls += 1
+                    stats.total_seconds += elapsed
+                    stats.max_seconds = max(stats.max_seconds, elapsed)
+                latency.observe(elapsed)
+                TOOL_SECONDS.observe(elapsed)
+
+        if not accepts_context:
+            run.__signature__ = _with_context_parameter(inspect.signature(function))
+        tool.function = run
+        return tool
+
+    def _call(self, name: str, function: Callable, is_async: bool, timeout: float,
+              args: tuple, kwargs: dict, stats: _ToolStats) -> Any:
+        if not is_async and not timeout:
+            return function(*args, **kwargs)
+
+        future = None
+        try:
+            if not is_async:
+                future = self._executor.submit(function, *args, **kwargs)
+            elif self._loop is not None and self._loop.is_running():
+                # Async tools share the server's event loop, so I/O-bound calls overlap
+                future = asyncio.run_coroutine_threadsafe(function(*args, **kwargs), self._loop)
+            else:
+                # No server loop (e.g. scripts); run the coroutine on this thread
+                coroutine = function(*args, **kwargs)
+                return asyncio.run(asyncio.wait_for(coroutine, timeout) if timeout else coroutine)
+            return future.result(timeout or None)
+        except (FutureTimeoutError, asyncio.TimeoutError):
+            # Async tools are cancelled; a sync tool's thread finishes in the background
+            if future is not None:
+                future.cancel()
+            with stats.lock:
+                stats.timeouts += 1
+            errors_total.labels(kind="tool_timeout").inc()
+            logger.warning(f"Tool {name} timed out after {timeout}s")
+            raise ToolTimeout(f"Tool {name} did not finish within {timeout}s")
+
+    def get_stats(self) -> dict:
+        """Get per-tool call, cache and latency statistics"""
+        return {
+            name: {
+                **stats.as_dict(),
+                'timeout_seconds': self.policies[name].timeout,
+                'cache_ttl_seconds': self.policies[name].cache_ttl,
+            }
+            for name, stats in self.stats.items()
+        }
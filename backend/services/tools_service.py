@@ -1,54 +1,111 @@
 from haystack.tools import Tool
+from dataclasses import dataclass, field
 from datetime import datetime
+from typing import Callable, Collection, Hashable, Optional
 import pytz
 
+from app_config import app_config
+from services.tool_runtime import ToolPolicy, ToolRuntime
+
+
+@dataclass
+class ToolContext:
+    """
+    Per-invocation data for tools.
+
+    The agent carries it in its run state, and any tool function with a
+    ``tool_context`` parameter receives it, so concurrent turns never share it.
+    It also carries the turn deadline (a monotonic time), because the agent
+    runs tools on threads that do not inherit the turn's contextvars.
+    """
+    client_id: str = ""
+    timezone: str = "UTC"
+    language: str = "en"
+    tenant: str = "default"
+    metadata: dict = field(default_factory=dict)
+    deadline: Optional[float] = None
+
 
 class ToolsService:
+    # Agent state schema that makes ToolContext available to tool functions
+    state_schema = {"tool_context": {"type": ToolContext}}
+
     def __init__(self):
-        self.current_client_timezone = "UTC"  # Default timezone
-        self.tools = [
+        # Executes every tool: async functions, timeouts, result caching and stats
+        self.runtime = ToolRuntime()
+        # Tools whose output changes over time; turns that call them are never cached
+        self.time_dependent_tools = set()
+        self.tools = []
+        self.add_tool(
             Tool(
                 name="current_datetime",
                 description="Returns the current date and time in the client's timezone.",
                 function=self._get_current_datetime,
                 parameters={},
             ),
-            # Add more tools here as needed
-        ]
-
-    def set_client_timezone(self, timezone: str):
-        """Set the client's timezone for time-related operations"""
-        self.current_client_timezone = timezone
+            time_dependent=True,
+            # Cheap and never blocks, so it runs inline; one formatted result per timezone per second
+            timeout=0,
+            cache_ttl=1.0,
+            cache_key=lambda tool_context: tool_context.timezone,
+        )
+        # Add more tools here as needed
 
-    def add_tool(self, tool: Tool):
+    def add_tool(self, tool: Tool, time_dependent: bool = False, timeout: Optional[float] = None,
+                 cache_ttl: float = 0.0, cache_key: Optional[Callable[[ToolContext], Hashable]] = None):
         """
         Adds a new tool to the service.
 
-        :param tool: An instance of Tool to be added.
+        :param tool: An instance of Tool to be added. Its function may be async.
+        :param time_dependent: Whether the tool output changes over time, which
+            keeps turns that call it out of the response cache.
+        :param timeout: Seconds before the call is abandoned and reported to the
+            model as a tool error; defaults to TOOL_TIMEOUT_SECONDS, 0 for none.
+        :param cache_ttl: Seconds to reuse a result for the same arguments; 0 disables.
+        :param cache_key: Part of the cache key taken from the ToolContext;
+            defaults to the client's timezone and language.
         """
         if not isinstance(tool, Tool):
             raise ValueError("The provided tool must be an instance of Tool.")
-        self.tools.append(tool)
+        policy = ToolPolicy(
+            timeout=app_config.tool_timeout_seconds if timeout is None else timeout,
+            cache_ttl=cache_ttl,
+            cache_key=cache_key,
+        )
+        self.tools.append(self.runtime.wrap(tool, policy))
+        if time_dependent:
+            self.time_dependent_tools.add(tool.name)
+
+    def is_time_dependent(self, tool_name: str) -> bool:
+        return tool_name in self.time_dependent_tools
+
+    def get_tools(self, names: Optional[Collection[str]] = None) -> list[Tool]:
+        """All tools, or only those named (e.g. a tenant's subset)"""
+        if names is None:
+            return self.tools
+        return [tool for tool in self.tools if tool.name in names]
 
-    def get_tools(self) -> list[Tool]:
-        return self.tools
+    def get_stats(self) -> dict:
+        """Get per-tool execution statistics"""
+        return self.runtime.get_stats()
 
     def get_tools_metadata(self) -> list[dict]:
         return [
             {"name": tool.name, "description": tool.description} for tool in self.tools
         ]
 
-    def _get_current_datetime(self):
+    def _get_current_datetime(self, tool_context: Optional[ToolContext] = None):
         try:
             # Get current UTC time
             utc_now = datetime.now(pytz.UTC)
+            client_timezone = tool_context.timezone if tool_context else "UTC"
             
             # Convert to client's timezone
-            if self.current_client_timezone != "UTC":
+            if client_timezone != "UTC":
                 try:
-                    client_tz = pytz.timezone(self.current_client_timezone)
+                    client_tz = pytz.timezone(client_timezone)
                     local_time = utc_now.astimezone(client_tz)
-                    return f"{local_time.strftime('%Y-%m-%d %H:%M:%S %Z')} (Client timezone: {self.current_client_timezone})"
+                    return f"{local_time.strftime('%Y-%m-%d %H:%M:%S %Z')} (Client timezone: {client_timezone})"
                 except:
                     # Fallback to UTC if timezone is invalid
                     pass
@@ -0,0 +1,449 @@
+"""
+Upstream Router
+Latency-aware routing, failover, retries and hedging across OpenAI-compatible endpoints
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+import httpx
+import openai
+from haystack import component
+from haystack.components.generators.chat import OpenAIChatGenerator
+from haystack.dataclasses import ChatMessage
+from haystack.utils import Secret
+
+from app_config import app_config
+from services import deadline
+from services.deadline import DeadlineExceeded
+from services.metrics_service import LLM_SECONDS, errors_total
+from services.resilience import CircuitBreaker, RetryBudget, UpstreamUnavailable, backoff_delay
+from services.upstream_service import upstream_pool
+
+logger = logging.getLogger(__name__)
+
+
+class HedgeLost(Exception):
+    """Raised inside the slower of two hedged requests to abandon it"""
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an error is the endpoint's fault: worth another attempt and counted against its health"""
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500 or error.status_code in (408, 429)
+    # Errors while reading a stream reach us from httpx unwrapped
+    return isinstance(error, (openai.APIConnectionError, httpx.TransportError))
+
+
+def _is_timeout(error: Exception) -> bool:
+    return isinstance(error, (openai.APITimeoutError, httpx.TimeoutException))
+
+
+class Upstream:
+    """One endpoint with its generator and live health statistics"""
+
+    def __init__(self, name: str, base_url: str, model: str, api_key: str, weight: float = 1.0,
+                 generation_kwargs: Optional[Dict[str, Any]] = None, breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.base_url = base_url
+        self.model = model
+        self.api_key = api_key
+        self.weight = max(weight, 0.01)
+        self.generation_kwargs = dict(generation_kwargs or {})
+        if app_config.upstream_stream_usage:
+            # Streamed responses only report token usage when asked to
+            self.generation_kwargs["stream_options"] = {"include_usage": True}
+        self.generator = upstream_pool.attach(OpenAIChatGenerator(
+            api_base_url=base_url,
+            api_key=Secret.from_token(api_key),
+            model=model,
+            generation_kwargs=self.generation_kwargs or None,
+        ))
+
+        # Health belongs to the endpoint, so routers derived for tenants share it
+        self.breaker = breaker or CircuitBreaker(name)
+
+        self.ewma_latency: Optional[float] = None  # seconds to first chunk
+        self.ewma_error = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.hedges_won = 0
+
+    def score(self) -> float:
+        """Lower is better; untried endpoints score lowest so they get probed"""
+        latency = self.ewma_latency or 0.0
+        return (latency + 0.001) * (1 + 10 * self.ewma_error) * (1 + self.in_flight) / self.weight
+
+    def get_stats(self) -> dict:
+        return {
+            'name': self.name,
+            'base_url': self.base_url,
+            'model': self.model,
+            'weight': self.weight,
+            'healthy': self.breaker.available(),
+            'circuit': self.breaker.get_stats(),
+            'ewma_latency_ms': round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            'ewma_error_rate': round(self.ewma_error, 4),
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'failures': self.failures,
+            'hedges_won': self.hedges_won,
+        }
+
+
+class _Race:
+    """Relays chunks from whichever attempt streams first and stops the others"""
+
+    def __init__(self, streaming_callback):
+        self.streaming_callback = streaming_callback
+        self.winner: Optional[Upstream] = None
+        self.first_chunk_at: Dict[str, float] = {}
+        self.callback_failed = False
+        self._lock = threading.Lock()
+
+    def relay(self, upstream: Upstream):
+        def on_chunk(chunk):
+            with self._lock:
+                if self.winner is None:
+                    self.winner = upstream
+                if upstream.name not in self.first_chunk_at:
+                    self.first_chunk_at[upstream.name] = time.monotonic()
+            if self.winner is not upstream:
+                raise HedgeLost()
+            if self.streaming_callback is not None:
+                try:
+                    self.streaming_callback(chunk)
+                except Exception:
+                    # The turn's own callback failed (e.g. cancelled); not the upstream's fault
+                    self.callback_failed = True
+                    raise
+        return on_chunk
+
+
+@component
+class UpstreamRouter:
+    """
+    Chat generator that sends each request to the best-scoring upstream.
+    Scores combine EWMA time-to-first-chunk, EWMA error rate, in-flight load
+    and weight. A request that fails before streaming anything is retried,
+    on the next upstream when there is one, while the retry budget and the
+    turn deadline allow. Endpoints failing repeatedly have their circuit
+    opened; with every circuit open, requests fail fast. With hedge_after_ms
+    set, a request with no first chunk by then is raced against the next
+    upstream and the slower one is abandoned.
+    """
+
+    def __init__(
+        self,
+        upstreams: List[Upstream],
+        hedge_after_ms: Optional[int] = None,
+        ewma_alpha: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        retry_budget: Optional[RetryBudget] = None,
+        hedge_executor: Optional[ThreadPoolExecutor] = None,
+    ):
+        if not upstreams:
+            raise ValueError("At least one upstream is required")
+        self.upstreams = upstreams
+        hedge_after_ms = app_config.upstream_hedge_after_ms if hedge_after_ms is None else hedge_after_ms
+        self.hedge_after = hedge_after_ms / 1000 if hedge_after_ms and len(upstreams) > 1 else None
+        self.ewma_alpha = ewma_alpha or app_config.upstream_ewma_alpha
+        self.max_retries = app_config.upstream_max_retries if max_retries is None else max_retries
+        self.retry_budget = retry_budget or RetryBudget()
+
+        self._lock = threading.Lock()
+        # Derived routers share their parent's pool, so threads do not grow with tenants
+        self._hedge_executor = hedge_executor
+        if self.hedge_after and hedge_executor is None:
+            self._hedge_executor = ThreadPoolExecutor(
+                max_workers=app_config.agent_max_concurrency * 2, thread_name_prefix="upstream-hedge"
+            )
+        self.failovers = 0
+        self.retries = 0
+        self.hedges = 0
+
+    @property
+    def model(self) -> str:
+        return self.upstreams[0].model
+
+    def derive(self, model: str = "", generation_kwargs: Optional[Dict[str, Any]] = None) -> "UpstreamRouter":
+        """
+        A router over the same endpoints with another model (empty keeps each
+        endpoint's) and sampling, e.g. for a tenant. Latency is tracked per
+        model; circuit breakers, the retry budget and hedging threads are shared.
+        """
+        return UpstreamRouter(
+            [
+                Upstream(
+                    upstream.name, upstream.base_url, model or upstream.model, upstream.api_key,
+                    upstream.weight, generation_kwargs, breaker=upstream.breaker,
+                )
+                for upstream in self.upstreams
+            ],
+            hedge_after_ms=int(self.hedge_after * 1000) if self.hedge_after else 0,
+            ewma_alpha=self.ewma_alpha,
+            max_retries=self.max_retries,
+            retry_budget=self.retry_budget,
+            hedge_executor=self._hedge_executor,
+        )
+
+    def close(self):
+        """Stop the hedging threads; call on the root router, as derived ones share them"""
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False, cancel_futures=True)
+
+    def rank(self) -> List[Upstream]:
+        """
+        Upstreams in the order to try them: a weighted draw first, then by
+        score. Raises UpstreamUnavailable when every circuit is open.
+        """
+        with self._lock:
+            candidates = [upstream for upstream in self.upstreams if upstream.breaker.available()]
+            if not candidates:
+                retry_after = min(upstream.breaker.retry_after() for upstream in self.upstreams)
+                raise UpstreamUnavailable(retry_after=round(retry_after, 2))
+            candidates.sort(key=Upstream.score)
+            if len(candidates) > 1:
+                # Spread load in proportion to 1/score instead of herding onto the leader
+                first = random.choices(candidates, weights=[1 / upstream.score() for upstream in candidates])[0]
+                candidates.remove(first)
+                candidates.insert(0, first)
+            return candidates
+
+    def _record(self, upstream: Upstream, latency: Optional[float], failed: bool):
+        alpha = self.ewma_alpha
+        with self._lock:
+            upstream.ewma_error = (1 - alpha) * upstream.ewma_error + alpha * (1.0 if failed else 0.0)
+            if failed:
+                upstream.failures += 1
+            if latency is not None:
+                upstream.ewma_latency = (
+                    latency if upstream.ewma_latency is None
+                    else (1 - alpha) * upstream.ewma_latency + alpha * latency
+                )
+
+    @staticmethod
+    def _with_deadline(kwargs: dict) -> dict:
+        """Cap the request's HTTP timeouts at what is left of the turn, so a hung upstream cannot outlive it"""
+        left = deadline.remaining()
+        if left is None:
+            return kwargs
+        if left == 0:
+            raise DeadlineExceeded()
+        timeout = upstream_pool.timeout
+        read = min(timeout.read, left)
+        request_timeout = httpx.Timeout(connect=min(timeout.connect, left), read=read, write=read,
+                                        pool=min(timeout.pool, left))
+        # The generator passes generation_kwargs through to the OpenAI client's create()
+        return {**kwargs, "generation_kwargs": {**(kwargs["generation_kwargs"] or {}), "timeout": request_timeout}}
+
+    def _attempt(self, upstream: Upstream, race: _Race, messages: List[ChatMessage], kwargs: dict) -> dict:
+        kwargs = self._with_deadline(kwargs)
+        ticket = upstream.breaker.acquire()
+        if ticket is None:
+            raise UpstreamUnavailable(f"Circuit for {upstream.name} is open", upstream.breaker.retry_after())
+        with self._lock:
+            upstream.in_flight += 1
+            upstream.requests += 1
+        started = time.monotonic()
+        healthy: Optional[bool] = None
+        try:
+            result = upstream.generator.run(messages=messages, streaming_callback=race.relay(upstream), **kwargs)
+        except HedgeLost:
+            # The loser still tells us how long its first chunk took
+            healthy = True
+            self._record(upstream, race.first_chunk_at[upstream.name] - started, failed=False)
+            raise
+        except Exception as e:
+            if race.callback_failed:
+                raise
+            # A rejected request (e.g. 400) says nothing about the endpoint's health
+            healthy = not is_retryable(e)
+            logger.warning(f"Upstream {upstream.name} failed: {e}")
+            errors_total.labels(kind="upstream").inc()
+            self._record(upstream, None, failed=not healthy)
+            if _is_timeout(e) and deadline.remaining() == 0:
+                raise DeadlineExceeded(f"Upstream {upstream.name} timed out at the turn deadline") from e
+            raise
+        else:
+            healthy = True
+        finally:
+            with self._lock:
+                upstream.in_flight -= 1
+            upstream.breaker.release(ticket, healthy)
+        first_chunk_at = race.first_chunk_at.get(upstream.name, time.monotonic())
+        self._record(upstream, first_chunk_at - started, failed=False)
+        return result
+
+    def _may_retry(self, attempt: int, same_upstream: bool) -> bool:
+        """
+        Whether retry number attempt may go ahead: the budget must allow it and
+        the turn must have time left after the backoff, which is slept here.
+        Failing over to another endpoint needs no backoff.
+        """
+        delay = backoff_delay(attempt) if same_upstream else 0.0
+        left = deadline.remaining()
+        if left is not None and left <= delay:
+            return False
+        if not self.retry_budget.try_spend():
+            logger.warning("Upstream retry budget exhausted, not retrying")
+            return False
+        self.retries += 1
+        if delay:
+            time.sleep(delay)
+        return True
+
+    @component.output_types(replies=List[ChatMessage])
+    def run(
+        self,
+        messages: List[ChatMessage],
+        streaming_callback: Optional[Any] = None,
+        generation_kwargs: Optional[Dict[str, Any]] = None,
+        *,
+        tools: Optional[Any] = None,
+        tools_strict: Optional[bool] = None,
+    ):
+        kwargs = {"generation_kwargs": generation_kwargs, "tools": tools, "tools_strict": tools_strict}
+        # Always stream from upstream so time-to-first-chunk can be measured and raced
+        race = _Race(streaming_callback)
+        # The agent calls the generator again after each tool step
+        deadline.check()
+        self.retry_budget.record_request()
+        started = time.perf_counter()
+        try:
+            if self.hedge_after is None:
+                return self._run_sequential(race, messages, kwargs)
+            return self._run_hedged(race, messages, kwargs)
+        finally:
+            LLM_SECONDS.observe(time.perf_counter() - started)
+
+    def _run_sequential(self, race: _Race, messages: List[ChatMessage], kwargs: dict) -> dict:
+        candidates = self.rank()
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            upstream = candidates[attempt % len(candidates)]
+            if attempt:
+                # A circuit opened by the failures so far would only refuse the retry
+                if not upstream.breaker.available() or not self._may_retry(
+                    attempt, same_upstream=len(candidates) == 1
+                ):
+                    break
+                if len(candidates) > 1:
+                    self.failovers += 1
+            try:
+                return self._attempt(upstream, race, messages, kwargs)
+            except UpstreamUnavailable as e:
+                # Its circuit opened after ranking; nothing was sent
+                last_error = e
+            except Exception as e:
+                # Once text has reached the client a retry would duplicate it
+                if race.callback_failed or race.winner is not None or not is_retryable(e):
+                    raise
+                last_error = e
+        self._raise_unavailable(last_error)
+
+    def _run_hedged(self, race: _Race, messages: List[ChatMessage], kwargs: dict) -> dict:
+        ranked = self.rank()
+        futures = {}
+        hedged = False
+        retries = 0
+        last_error: Optional[Exception] = None
+
+        def launch() -> Optional[Upstream]:
+            upstream = ranked.pop(0) if ranked else None
+            if upstream is not None:
+                # The pool's threads do not inherit contextvars; each attempt needs the turn deadline
+                attempt = functools.partial(self._attempt, upstream, race, messages, kwargs)
+                futures[self._hedge_executor.submit(contextvars.copy_context().run, attempt)] = upstream
+            return upstream
+
+        primary = launch()
+        while futures:
+            can_hedge = race.winner is None and len(futures) < 2
+            done, _ = wait(futures, timeout=self.hedge_after if can_hedge else None, return_when=FIRST_COMPLETED)
+            if not done:
+                if launch() is not None:
+                    hedged = True
+                    self.hedges += 1
+                continue
+            for future in done:
+                upstream = futures.pop(future)
+                try:
+                    result = future.result()
+                except HedgeLost:
+                    continue
+                except Exception as e:
+                    if race.callback_failed or race.winner is upstream:
+                        raise
+                    if not isinstance(e, UpstreamUnavailable) and not is_retryable(e):
+                        raise
+                    last_error = e
+                    if not futures and ranked and retries < self.max_retries and self._may_retry(retries + 1, False):
+                        retries += 1
+                        launch()
+                        self.failovers += 1
+                    continue
+                if hedged and upstream is not primary:
+                    with self._lock:
+                        upstream.hedges_won += 1
+                return result
+        self._raise_unavailable(last_error)
+
+    def _raise_unavailable(self, error: Optional[Exception]):
+        """Fail the request once the retries allowed for an upstream failure are used up"""
+        if isinstance(error, UpstreamUnavailable):
+            raise error
+        retry_after = min(upstream.breaker.retry_after() for upstream in self.upstreams)
+        raise UpstreamUnavailable(f"Upstream request failed: {error}", round(retry_after, 2) or None) from error
+
+    def get_stats(self) -> dict:
+        """Get per-upstream health and routing statistics"""
+        with self._lock:
+            return {
+                'hedge_after_ms': int(self.hedge_after * 1000) if self.hedge_after else 0,
+                'max_retries': self.max_retries,
+                'failovers': self.failovers,
+                'retries': self.retries,
+                'retry_budget': self.retry_budget.get_stats(),
+                'hedges': self.hedges,
+                'upstreams': [upstream.get_stats() for upstream in self.upstreams],
+            }
+
+
+def load_upstreams(base_url: str = "", api_key: str = "", model: str = "",
+                   generation_kwargs: Optional[Dict[str, Any]] = None) -> List[Upstream]:
+    """
+    Build upstreams from UPSTREAMS, a JSON list of objects with base_url and
+    optional model, api_key, weight and name. Without it (or when explicit
+    arguments are given) the single BASE_URL/MODEL endpoint is used.
+    """
+    api_key = api_key or app_config.api_key
+    if base_url or model or not app_config.upstreams:
+        return [Upstream(
+            "primary",
+            base_url or app_config.base_url,
+            model or app_config.model,
+            api_key,
+            generation_kwargs=generation_kwargs,
+        )]
+
+    entries = json.loads(app_config.upstreams)
+    return [
+        Upstream(
+            name=entry.get("name") or f"upstream-{index}",
+            base_url=entry["base_url"],
+            model=entry.get("model") or app_config.model,
+            api_key=entry.get("api_key") or api_key,
+            weight=float(entry.get("weight", 1.0)),
+            generation_kwargs=generation_kwargs,
+        )
+        for index, entry in enumerate(entries)
+    ]
@@ -0,0 +1,162 @@
+"""
+Upstream Client Service
+One pooled, keep-alive HTTP client shared by every chat generator and turn
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+import httpx
+from openai import OpenAI
+
+from app_config import app_config
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamClientPool:
+    """
+    Owns the httpx connection pool used for inference requests. httpx.Client
+    and OpenAI clients are thread-safe, so concurrent turns on the execution
+    pool share warm connections instead of each opening their own.
+    """
+
+    def __init__(
+        self,
+        max_connections: Optional[int] = None,
+        max_keepalive: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        pool_timeout: Optional[float] = None,
+        http2: Optional[bool] = None,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections or app_config.upstream_max_connections,
+            max_keepalive_connections=max_keepalive or app_config.upstream_max_keepalive,
+            keepalive_expiry=keepalive_expiry or app_config.upstream_keepalive_expiry_seconds,
+        )
+        read = read_timeout or app_config.upstream_read_timeout_seconds
+        self.timeout = httpx.Timeout(
+            connect=connect_timeout or app_config.upstream_connect_timeout_seconds,
+            read=read,
+            write=read,
+            pool=pool_timeout or app_config.upstream_pool_timeout_seconds,
+        )
+        self.http2 = app_config.upstream_http2 if http2 is None else http2
+
+        self._client: Optional[httpx.Client] = None
+        self._openai_clients: Dict[Tuple[str, str], OpenAI] = {}
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.warmed_up = False
+        self.warmup_error: Optional[str] = None
+
+    @property
+    def client(self) -> httpx.Client:
+        """The shared httpx client, created on first use"""
+        with self._lock:
+            if self._client is None:
+                self._client = self._build_client()
+            return self._client
+
+    def _build_client(self) -> httpx.Client:
+        http2 = self.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("UPSTREAM_HTTP2 is enabled but the h2 package is missing; using HTTP/1.1")
+                http2 = False
+        return httpx.Client(
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=http2,
+            event_hooks={"request": [self._count_request]},
+        )
+
+    def _count_request(self, request: httpx.Request):
+        self.requests += 1
+
+    def openai_client(self, base_url: str, api_key: str) -> OpenAI:
+        """An OpenAI client for one endpoint, backed by the shared connection pool"""
+        key = (base_url, api_key)
+        with self._lock:
+            cached = self._openai_clients.get(key)
+        if cached is not None:
+            return cached
+        openai_client = OpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            http_client=self.client,
+            # OpenAI passes its own timeout on every request, so it must match the pool's
+            timeout=self.timeout,
+            # The router retries instead, within the retry budget and the turn deadline
+            max_retries=0,
+        )
+        with self._lock:
+            return self._openai_clients.setdefault(key, openai_client)
+
+    def attach(self, generator):
+        """Point an OpenAIChatGenerator's sync client at the shared pool"""
+        generator.client = self.openai_client(
+            generator.api_base_url or app_config.base_url,
+            generator.api_key.resolve_value(),
+        )
+        return generator
+
+    async def warmup(self, connections: Optional[int] = None):
+        """
+        Open connections ahead of the first turn so it does not pay for DNS and
+        TLS. Each request lists models on every attached endpoint; failures are
+        logged and never block startup.
+        """
+        connections = connections or app_config.upstream_warmup_connections
+        with self._lock:
+            clients = list(self._openai_clients.values())
+        if not clients:
+            return
+
+        loop = asyncio.get_running_loop()
+        calls = [
+            # Clients never retry, so an unreachable upstream costs one connect timeout
+            loop.run_in_executor(None, openai_client.models.list)
+            for openai_client in clients
+            for _ in range(connections)
+        ]
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            self.warmup_error = str(errors[0])
+            logger.warning(f"Upstream warmup failed for {len(errors)}/{len(results)} requests: {errors[0]}")
+        self.warmed_up = len(errors) < len(results)
+        if self.warmed_up:
+            logger.info(f"Warmed up {len(results) - len(errors)} upstream connections")
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+            self._openai_clients.clear()
+
+    def get_stats(self) -> dict:
+        """Get upstream client statistics"""
+        return {
+            'max_connections': self.limits.max_connections,
+            'max_keepalive_connections': self.limits.max_keepalive_connections,
+            'keepalive_expiry': self.limits.keepalive_expiry,
+            'connect_timeout': self.timeout.connect,
+            'read_timeout': self.timeout.read,
+            'http2': self.http2,
+            'endpoints': len(self._openai_clients),
+            'requests': self.requests,
+            'warmed_up': self.warmed_up,
+            'warmup_error': self.warmup_error,
+        }
+
+
+upstream_pool = UpstreamClientPool()
@@ -3,6 +3,8 @@ WebSocket Services Package
 """
 
 from .connection_manager import ConnectionManager
+from .lifecycle import ConnectionLifecycle
 from .message_handler import WebSocketHandler
+from .session import ClientSession
 
-__all__ = ['ConnectionManager', 'WebSocketHandler']
+__all__ = ['ClientSession', 'ConnectionLifecycle', 'ConnectionManager', 'WebSocketHandler']
@@ -0,0 +1,195 @@
+"""
+Message Bus Broker
+Routes messages between uvicorn workers that each own a subset of WebSocket clients
+
+Run standalone for multi-host deployments. TCP has no transport security, so
+workers must open with the shared MESSAGE_BUS_TOKEN before they are routed to:
+    MESSAGE_BUS_TOKEN=<secret> python -m services.websocket.bus_broker --url tcp://10.0.0.5:8765
+"""
+
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+import os
+from typing import Dict, Optional, Set
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+def encode_frame(frame: dict) -> bytes:
+    return json.dumps(frame, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+async def open_bus_server(url: str, handler):
+    """Start an asyncio server for a unix:// or tcp:// bus URL"""
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        return await asyncio.start_unix_server(handler, path=parsed.path)
+    if parsed.scheme == "tcp":
+        return await asyncio.start_server(handler, host=parsed.hostname, port=parsed.port)
+    raise ValueError(f"Unsupported message bus URL: {url}")
+
+
+async def open_bus_connection(url: str):
+    """Connect to a unix:// or tcp:// bus URL"""
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        return await asyncio.open_unix_connection(path=parsed.path)
+    if parsed.scheme == "tcp":
+        return await asyncio.open_connection(host=parsed.hostname, port=parsed.port)
+    raise ValueError(f"Unsupported message bus URL: {url}")
+
+
+class BusBroker:
+    """
+    Routes frames between workers. A worker is ignored until its hello frame
+    carries the shared token; TCP brokers refuse to start without one, while a
+    unix socket is guarded by its file permissions.
+    """
+
+    def __init__(self, url: str, token: Optional[str] = None):
+        self.url = url
+        self.token = token or None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.workers: Dict[str, asyncio.StreamWriter] = {}
+        self.worker_clients: Dict[str, Set[str]] = {}
+        self.owners: Dict[str, str] = {}  # client_id -> worker_id
+        self._handlers: Set[asyncio.Task] = set()
+        self.routed = 0
+        self.undeliverable = 0
+        self.rejected = 0
+
+    async def start(self):
+        parsed = urlparse(self.url)
+        if parsed.scheme == "tcp" and self.token is None:
+            raise ValueError("A TCP message bus broker needs MESSAGE_BUS_TOKEN")
+        if parsed.scheme == "unix" and os.path.exists(parsed.path):
+            # A stale socket file from a crashed broker would make bind fail
+            os.unlink(parsed.path)
+        self.server = await open_bus_server(self.url, self._handle_worker)
+        if parsed.scheme == "unix":
+            os.chmod(parsed.path, 0o600)
+        logger.info(f"Message bus broker listening on {self.url}")
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+        for writer in list(self.workers.values()):
+            writer.close()
+        # Let handlers see EOF and exit on their own rather than cancelling them
+        if self._handlers:
+            await asyncio.wait(self._handlers, timeout=1.0)
+        if self.server:
+            await self.server.wait_closed()
+
+    async def _handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        worker_id = None
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                frame = json.loads(line)
+                op = frame.get("op")
+
+                if op == "hello":
+                    if not self._authorized(frame.get("token")):
+                        self.rejected += 1
+                        logger.warning(f"Rejected message bus worker {frame.get('worker')}: bad token")
+                        break
+                    worker_id = frame["worker"]
+                    self.workers[worker_id] = writer
+                    self.worker_clients.setdefault(worker_id, set())
+                    logger.info(f"Worker {worker_id} joined the message bus")
+                elif worker_id is None:
+                    continue
+                elif op == "register":
+                    self._register(worker_id, frame["client"])
+                elif op == "unregister":
+                    self._unregister(worker_id, frame["client"])
+                elif op == "send":
+                    self._route(frame["client"], frame["message"])
+                elif op == "stats":
+                    writer.write(encode_frame({"op": "stats", "id": frame.get("id"), "stats": self.get_stats()}))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error(f"Message bus broker error for worker {worker_id}: {e}")
+        finally:
+            if worker_id is not None and self.workers.get(worker_id) is writer:
+                self._drop_worker(worker_id)
+            writer.close()
+            self._handlers.discard(task)
+
+    def _authorized(self, token: Optional[str]) -> bool:
+        if self.token is None:
+            return True
+        return isinstance(token, str) and hmac.compare_digest(token.encode(), self.token.encode())
+
+    def _register(self, worker_id: str, client_id: str):
+        previous = self.owners.get(client_id)
+        if previous is not None and previous != worker_id:
+            # The client reconnected to another worker; the old socket must go
+            self.worker_clients.get(previous, set()).discard(client_id)
+            old_writer = self.workers.get(previous)
+            if old_writer is not None:
+                old_writer.write(encode_frame({"op": "evict", "client": client_id}))
+        self.owners[client_id] = worker_id
+        self.worker_clients[worker_id].add(client_id)
+
+    def _unregister(self, worker_id: str, client_id: str):
+        self.worker_clients.get(worker_id, set()).discard(client_id)
+        if self.owners.get(client_id) == worker_id:
+            del self.owners[client_id]
+
+    def _route(self, client_id: str, message: dict):
+        owner = self.owners.get(client_id)
+        writer = self.workers.get(owner) if owner else None
+        if writer is None:
+            self.undeliverable += 1
+            return
+        writer.write(encode_frame({"op": "deliver", "client": client_id, "message": message}))
+        self.routed += 1
+
+    def _drop_worker(self, worker_id: str):
+        for client_id in self.worker_clients.pop(worker_id, set()):
+            if self.owners.get(client_id) == worker_id:
+                del self.owners[client_id]
+        self.workers.pop(worker_id, None)
+        logger.info(f"Worker {worker_id} left the message bus")
+
+    def get_stats(self) -> dict:
+        return {
+            'workers': len(self.workers),
+            'total_connections': len(self.owners),
+            'connections_per_worker': {
+                worker_id: len(clients) for worker_id, clients in self.worker_clients.items()
+            },
+            'routed_messages': self.routed,
+            'undeliverable_messages': self.undeliverable,
+            'rejected_workers': self.rejected,
+        }
+
+
+async def _serve(url: str, token: Optional[str]):
+    broker = BusBroker(url, token)
+    await broker.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await broker.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chat assistant message bus broker")
+    parser.add_argument("--url", default=os.getenv("MESSAGE_BUS_URL", "unix:///tmp/chat-assistant-bus.sock"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_serve(args.url, os.getenv("MESSAGE_BUS_TOKEN")))
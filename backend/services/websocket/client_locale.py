@@ -0,0 +1,128 @@
+"""
+Client Locale Resolution
+Table-driven timezone and language detection from connect-time headers, cached
+so reconnect storms from the same browsers resolve without re-parsing
+"""
+
+import re
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import pytz
+
+DEFAULT_TIMEZONE = "UTC"
+DEFAULT_LANGUAGE = "en"
+
+# Distinct header combinations kept; reconnecting clients repeat a small set of them
+CACHE_SIZE = 4096
+
+# Likely timezone for a region subtag (ISO 3166-1), the most populous zone where
+# a country has several
+REGION_TIMEZONES = {
+    "ae": "Asia/Dubai", "ar": "America/Argentina/Buenos_Aires", "at": "Europe/Vienna",
+    "au": "Australia/Sydney", "bd": "Asia/Dhaka", "be": "Europe/Brussels", "bg": "Europe/Sofia",
+    "bo": "America/La_Paz", "br": "America/Sao_Paulo", "by": "Europe/Minsk", "ca": "America/Toronto",
+    "ch": "Europe/Zurich", "cl": "America/Santiago", "cn": "Asia/Shanghai", "co": "America/Bogota",
+    "cr": "America/Costa_Rica", "cz": "Europe/Prague", "de": "Europe/Berlin", "dk": "Europe/Copenhagen",
+    "do": "America/Santo_Domingo", "dz": "Africa/Algiers", "ec": "America/Guayaquil", "ee": "Europe/Tallinn",
+    "eg": "Africa/Cairo", "es": "Europe/Madrid", "et": "Africa/Addis_Ababa", "fi": "Europe/Helsinki",
+    "fr": "Europe/Paris", "gb": "Europe/London", "gh": "Africa/Accra", "gr": "Europe/Athens",
+    "gt": "America/Guatemala", "hk": "Asia/Hong_Kong", "hn": "America/Tegucigalpa", "hr": "Europe/Zagreb",
+    "hu": "Europe/Budapest", "id": "Asia/Jakarta", "ie": "Europe/Dublin", "il": "Asia/Jerusalem",
+    "in": "Asia/Kolkata", "iq": "Asia/Baghdad", "ir": "Asia/Tehran", "is": "Atlantic/Reykjavik",
+    "it": "Europe/Rome", "jo": "Asia/Amman", "jp": "Asia/Tokyo", "ke": "Africa/Nairobi",
+    "kr": "Asia/Seoul", "kw": "Asia/Kuwait", "kz": "Asia/Almaty", "lb": "Asia/Beirut",
+    "lk": "Asia/Colombo", "lt": "Europe/Vilnius", "lu": "Europe/Luxembourg", "lv": "Europe/Riga",
+    "ma": "Africa/Casablanca", "mx": "America/Mexico_City", "my": "Asia/Kuala_Lumpur", "ng": "Africa/Lagos",
+    "nl": "Europe/Amsterdam", "no": "Europe/Oslo", "np": "Asia/Kathmandu", "nz": "Pacific/Auckland",
+    "pa": "America/Panama", "pe": "America/Lima", "ph": "Asia/Manila", "pk": "Asia/Karachi",
+    "pl": "Europe/Warsaw", "pr": "America/Puerto_Rico", "pt": "Europe/Lisbon", "py": "America/Asuncion",
+    "qa": "Asia/Qatar", "ro": "Europe/Bucharest", "rs": "Europe/Belgrade", "ru": "Europe/Moscow",
+    "sa": "Asia/Riyadh", "se": "Europe/Stockholm", "sg": "Asia/Singapore", "si": "Europe/Ljubljana",
+    "sk": "Europe/Bratislava", "sv": "America/El_Salvador", "th": "Asia/Bangkok", "tn": "Africa/Tunis",
+    "tr": "Europe/Istanbul", "tw": "Asia/Taipei", "tz": "Africa/Dar_es_Salaam", "ua": "Europe/Kyiv",
+    "ug": "Africa/Kampala", "us": "America/New_York", "uy": "America/Montevideo", "ve": "America/Caracas",
+    "vn": "Asia/Ho_Chi_Minh", "za": "Africa/Johannesburg",
+}
+
+# Fallback for a bare language tag: the timezone of its most common region
+LANGUAGE_TIMEZONES = {
+    "am": "Africa/Addis_Ababa", "ar": "Asia/Riyadh", "be": "Europe/Minsk", "bg": "Europe/Sofia",
+    "bn": "Asia/Dhaka", "ca": "Europe/Madrid", "cs": "Europe/Prague", "da": "Europe/Copenhagen",
+    "de": "Europe/Berlin", "el": "Europe/Athens", "en": "America/New_York", "es": "Europe/Madrid",
+    "et": "Europe/Tallinn", "eu": "Europe/Madrid", "fa": "Asia/Tehran", "fi": "Europe/Helsinki",
+    "fil": "Asia/Manila", "fr": "Europe/Paris", "ga": "Europe/Dublin", "gl": "Europe/Madrid",
+    "gu": "Asia/Kolkata", "he": "Asia/Jerusalem", "hi": "Asia/Kolkata", "hr": "Europe/Zagreb",
+    "hu": "Europe/Budapest", "id": "Asia/Jakarta", "is": "Atlantic/Reykjavik", "it": "Europe/Rome",
+    "ja": "Asia/Tokyo", "kk": "Asia/Almaty", "kn": "Asia/Kolkata", "ko": "Asia/Seoul",
+    "lt": "Europe/Vilnius", "lv": "Europe/Riga", "ml": "Asia/Kolkata", "mr": "Asia/Kolkata",
+    "ms": "Asia/Kuala_Lumpur", "nb": "Europe/Oslo", "ne": "Asia/Kathmandu", "nl": "Europe/Amsterdam",
+    "nn": "Europe/Oslo", "no": "Europe/Oslo", "pa": "Asia/Kolkata", "pl": "Europe/Warsaw",
+    "pt": "America/Sao_Paulo", "ro": "Europe/Bucharest", "ru": "Europe/Moscow", "si": "Asia/Colombo",
+    "sk": "Europe/Bratislava", "sl": "Europe/Ljubljana", "sr": "Europe/Belgrade", "sv": "Europe/Stockholm",
+    "sw": "Africa/Nairobi", "ta": "Asia/Kolkata", "te": "Asia/Kolkata", "th": "Asia/Bangkok",
+    "tl": "Asia/Manila", "tr": "Europe/Istanbul", "uk": "Europe/Kyiv", "ur": "Asia/Karachi",
+    "vi": "Asia/Ho_Chi_Minh", "zh": "Asia/Shanghai", "zu": "Africa/Johannesburg",
+}
+
+# language[-Script][-REGION], e.g. "en", "pt-BR", "zh-Hant-TW"
+_TAG = re.compile(r"^([a-z]{2,3})(?:-[a-z]{4})?(?:-([a-z]{2}))?(?:-|$)")
+_MOBILE_AGENTS = ("android", "iphone", "ipad")
+
+
+def parse_accept_language(header: str) -> List[str]:
+    """Language tags from an Accept-Language header, most preferred first; q=0 tags are dropped"""
+    weighted = []
+    for position, part in enumerate(header.split(",")):
+        tag, _, params = part.strip().partition(";")
+        tag = tag.strip().lower()
+        if not tag or tag == "*":
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        if quality > 0:
+            # Equal weights keep header order
+            weighted.append((-quality, position, tag))
+    weighted.sort()
+    return [tag for _, _, tag in weighted]
+
+
+def _timezone_for_tag(tag: str) -> Tuple[Optional[str], Optional[str]]:
+    match = _TAG.match(tag)
+    if match is None:
+        return None, None
+    language, region = match.groups()
+    timezone = (region and REGION_TIMEZONES.get(region)) or LANGUAGE_TIMEZONES.get(language)
+    return timezone, language
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def resolve_client_locale(x_timezone: str, accept_language: str, user_agent: str) -> Tuple[str, str]:
+    """
+    Resolve (timezone, language) from raw header values. An explicit, valid
+    X-Timezone wins; otherwise the most preferred Accept-Language tag that maps
+    to a timezone; mobile user agents fall back to US Eastern as before.
+    """
+    timezone = x_timezone if x_timezone in pytz.all_timezones_set else None
+    language = None
+    for tag in parse_accept_language(accept_language):
+        tag_timezone, tag_language = _timezone_for_tag(tag)
+        language = language or tag_language
+        if tag_timezone and timezone is None:
+            timezone = tag_timezone
+        if timezone and language:
+            break
+
+    if timezone is None and any(agent in user_agent.lower() for agent in _MOBILE_AGENTS):
+        timezone = "America/New_York"
+    return timezone or DEFAULT_TIMEZONE, language or DEFAULT_LANGUAGE
+
+
+def get_cache_stats() -> dict:
+    info = resolve_client_locale.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'max_size': info.maxsize}
@@ -0,0 +1,151 @@
+"""
+Wire Codecs
+Frame encodings a WebSocket client can negotiate at connect time
+"""
+
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+from app_config import app_config
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the standard library encoder
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional: the msgpack protocol is only offered when installed
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# Subprotocols are offered as e.g. "chat.compact" in Sec-WebSocket-Protocol
+SUBPROTOCOL_PREFIX = "chat."
+
+# Short keys and type codes used by the compact and msgpack protocols
+COMPACT_KEYS = {
+    "type": "t",
+    "message": "m",
+    "timestamp": "ts",
+    "position": "p",
+    "code": "c",
+    "retry_after": "r",
+}
+COMPACT_TYPES = {
+    "user": "u",
+    "typing": "ty",
+    "queued": "q",
+    "assistant": "a",
+    "assistant_delta": "d",
+    "assistant_done": "f",
+    "cancelled": "x",
+    "error": "e",
+    "pong": "po",
+}
+
+Payload = Union[str, bytes]
+
+
+def dumps(value) -> str:
+    """Serialize to a JSON string, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value)
+
+
+def loads(raw: Payload):
+    """Parse JSON text; both parsers raise a json.JSONDecodeError subclass on bad input"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def compact_frame(frame: dict) -> dict:
+    """
+    Shorten a frame: short keys and type codes, epoch-millisecond timestamps,
+    no sender (it follows from the type) and no timestamp on deltas.
+    """
+    compact = {}
+    frame_type = frame.get("type")
+    for key, value in frame.items():
+        if key == "sender":
+            continue
+        if key == "timestamp":
+            if frame_type == "assistant_delta":
+                continue
+            value = int(datetime.fromisoformat(value).timestamp() * 1000)
+        elif key == "type":
+            value = COMPACT_TYPES.get(value, value)
+        compact[COMPACT_KEYS.get(key, key)] = value
+    return compact
+
+
+class Codec:
+    """Standard frames as JSON text, unchanged for existing clients"""
+
+    name = "json"
+    binary = False
+
+    def encode(self, frame: dict) -> Payload:
+        return dumps(frame)
+
+    def decode(self, raw: Payload) -> dict:
+        return loads(raw)
+
+
+class CompactCodec(Codec):
+    """Compact frames as JSON text"""
+
+    name = "compact"
+
+    def encode(self, frame: dict) -> Payload:
+        return dumps(compact_frame(frame))
+
+
+class MsgpackCodec(Codec):
+    """Compact frames as binary msgpack; client frames may be msgpack or JSON"""
+
+    name = "msgpack"
+    binary = True
+
+    def encode(self, frame: dict) -> Payload:
+        return msgpack.packb(compact_frame(frame))
+
+    def decode(self, raw: Payload) -> dict:
+        if isinstance(raw, bytes):
+            return msgpack.unpackb(raw)
+        return loads(raw)
+
+
+CODECS: Dict[str, Codec] = {codec.name: codec for codec in (Codec(), CompactCodec())}
+if msgpack is not None:
+    CODECS[MsgpackCodec.name] = MsgpackCodec()
+
+
+def negotiate(requested: Optional[str], subprotocols: Iterable[str]) -> Tuple[Codec, Optional[str]]:
+    """
+    Pick the codec for a connection. An explicit ?protocol= query parameter
+    wins; otherwise the first offered "chat.<name>" subprotocol we support.
+    Returns the codec and the subprotocol to accept, if any.
+    """
+    subprotocols = list(subprotocols)
+    if requested:
+        codec = CODECS.get(requested)
+        if codec is None:
+            logger.info(f"Unsupported protocol {requested!r} requested, using {app_config.ws_default_protocol}")
+    else:
+        codec = next(
+            (
+                CODECS[offered[len(SUBPROTOCOL_PREFIX):]] for offered in subprotocols
+                if offered.startswith(SUBPROTOCOL_PREFIX) and offered[len(SUBPROTOCOL_PREFIX):] in CODECS
+            ),
+            None,
+        )
+    codec = codec or CODECS.get(app_config.ws_default_protocol) or CODECS["json"]
+
+    # A client that offered subprotocols expects one of them back
+    subprotocol = SUBPROTOCOL_PREFIX + codec.name
+    return codec, subprotocol if subprotocol in subprotocols else None
@@ -3,195 +3,256 @@ WebSocket Connection Manager Service
 Handles WebSocket connections, client management, and timezone detection
 """
 
-import json
 import logging
-from typing import Dict
+import random
+import time
+from itertools import islice
+from typing import Dict, Optional
 from fastapi import WebSocket
-from datetime import datetime
-import re
+
+from app_config import app_config
+
+from services.metrics_service import connects_total, disconnects_total
+from services.tenant_service import tenant_registry
+from services.websocket.client_locale import get_cache_stats as get_locale_cache_stats, resolve_client_locale
+from services.websocket.codec import CODECS, Codec, negotiate
+from services.websocket.message_bus import MessageBus, create_message_bus
+from services.websocket.outbound import OutboundQueue, OutboundStats
+from services.websocket.session import ClientSession, shared_value_count
 
 logger = logging.getLogger(__name__)
 
+# WebSocket close code 1012 (Service Restart), sent with a retry_after hint
+SERVICE_RESTART_CLOSE_CODE = 1012
+
+
+def restart_reason() -> str:
+    """Close reason carrying a randomised reconnect delay so clients do not all return at once"""
+    spread = max(app_config.shutdown_reconnect_spread_seconds, 1.0)
+    return f"restarting; retry_after={random.uniform(1.0, spread):.1f}"
+
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-        self.client_timezones: Dict[str, str] = {}  # Store client timezone info
-        self.client_metadata: Dict[str, dict] = {}  # Store additional client info
+    def __init__(self, message_bus: Optional[MessageBus] = None):
+        self.sessions: Dict[str, ClientSession] = {}  # One record per connected client
+        self.timezone_counts: Dict[str, int] = {}  # Clients per timezone, kept in step with sessions
+        self.outbound_stats = OutboundStats()
+        # Cleared while draining for shutdown; new sockets are told to retry elsewhere
+        self.accepting = True
+        # Routes messages and ownership for clients connected to other workers
+        self.bus = message_bus or create_message_bus()
 
-    async def connect(self, websocket: WebSocket, client_id: str):
-        """Accept WebSocket connection and extract client information"""
-        await websocket.accept()
+    async def start(self):
+        """Join the message bus, called from the app lifespan"""
+        await self.bus.start(
+            deliver=self._deliver_local,
+            evict=self._evict_local,
+            local_clients=lambda: self.sessions.keys(),
+        )
+
+    async def close(self):
+        """Leave the message bus, called from the app lifespan"""
+        await self.bus.close()
+
+    async def connect(self, websocket: WebSocket, client_id: str) -> bool:
+        """Accept WebSocket connection and extract client information; False if shutting down"""
+        codec, subprotocol = negotiate(
+            websocket.query_params.get("protocol"), websocket.scope.get("subprotocols", [])
+        )
+        await websocket.accept(subprotocol=subprotocol)
+        if not self.accepting:
+            await websocket.close(code=SERVICE_RESTART_CLOSE_CODE, reason=restart_reason())
+            return False
 
         # Close existing connection for this client if it exists
-        if client_id in self.active_connections:
+        previous = self.sessions.get(client_id)
+        if previous is not None:
             try:
-                old_ws = self.active_connections[client_id]
-                if old_ws.client_state != "DISCONNECTED":
-                    await old_ws.close()
+                if previous.websocket.client_state != "DISCONNECTED":
+                    await previous.websocket.close()
             except Exception as e:
                 logger.warning(f"Error closing old connection for {client_id}: {e}")
+            self._end_session(previous)
 
-        self.active_connections[client_id] = websocket
-        
-        # Extract timezone and other metadata from headers
-        await self._extract_client_metadata(websocket, client_id)
+        session = ClientSession(
+            client_id,
+            websocket,
+            OutboundQueue(websocket, client_id, self.outbound_stats, codec=codec),
+            protocol=codec.name,
+            # ?echo=0 skips the user-message echo for clients that render their own input
+            echo=websocket.query_params.get("echo", "1") not in ("0", "false"),
+            **self._extract_client_metadata(websocket, client_id),
+        )
+        self.sessions[client_id] = session
+        self._count_timezone(session.timezone, 1)
+        session.outbound.start()
+        self.bus.register(client_id)
+        connects_total.inc()
         
         logger.info(
-            f"Client {client_id} connected. Total connections: {len(self.active_connections)}"
+            f"Client {client_id} connected ({codec.name}, timezone={session.timezone}, "
+            f"language={session.language}). Total connections: {len(self.sessions)}"
         )
+        return True
 
-    async def _extract_client_metadata(self, websocket: WebSocket, client_id: str):
-        """Extract client metadata from WebSocket headers and cookies"""
-        try:
-            headers = dict(websocket.headers)
-            
-            # Initialize metadata
-            metadata = {
-                'user_agent': headers.get('user-agent', ''),
-                'accept_language': headers.get('accept-language', ''),
-                'origin': headers.get('origin', ''),
-                'timezone': 'UTC',  # Default timezone
-                'country': None,
-                'language': 'en'
-            }
-            
-            # Extract timezone from Accept-Language header or other sources
-            timezone = self._detect_timezone_from_headers(headers)
-            metadata['timezone'] = timezone
-            
-            # Extract language preference
-            language = self._detect_language_from_headers(headers)
-            metadata['language'] = language
-            
-            # Store metadata
-            self.client_metadata[client_id] = metadata
-            self.client_timezones[client_id] = timezone
-            
-            logger.info(f"Client {client_id} metadata: timezone={timezone}, language={language}")
-            
-        except Exception as e:
-            logger.warning(f"Error extracting client metadata for {client_id}: {e}")
-            # Set defaults
-            self.client_timezones[client_id] = 'UTC'
-            self.client_metadata[client_id] = {'timezone': 'UTC', 'language': 'en'}
-
-    def _detect_timezone_from_headers(self, headers: dict) -> str:
-        """Detect timezone from various header sources"""
-        
-        # Method 1: Check for custom timezone header (if frontend sets it)
-        timezone_header = headers.get('x-timezone', '')
-        if timezone_header:
-            return timezone_header
-            
-        # Method 2: Parse Accept-Language for region hints
-        accept_language = headers.get('accept-language', '')
-        if accept_language:
-            # Extract region codes and map to likely timezones
-            timezone = self._guess_timezone_from_language(accept_language)
-            if timezone:
-                return timezone
-        
-        # Method 3: Check User-Agent for mobile/regional indicators
+    def _extract_client_metadata(self, websocket: WebSocket, client_id: str) -> dict:
+        """Extract client metadata from WebSocket headers"""
+        headers = websocket.headers
         user_agent = headers.get('user-agent', '')
-        if user_agent:
-            timezone = self._guess_timezone_from_user_agent(user_agent)
-            if timezone:
-                return timezone
-                
-        # Default to UTC if no timezone detected
-        return 'UTC'
-
-    def _guess_timezone_from_language(self, accept_language: str) -> str:
-        """Guess timezone based on language/region codes"""
-        # Common language-region to timezone mappings
-        timezone_map = {
-            'en-US': 'America/New_York',
-            'en-GB': 'Europe/London', 
-            'en-AU': 'Australia/Sydney',
-            'en-CA': 'America/Toronto',
-            'de-DE': 'Europe/Berlin',
-            'fr-FR': 'Europe/Paris',
-            'es-ES': 'Europe/Madrid',
-            'it-IT': 'Europe/Rome',
-            'ja-JP': 'Asia/Tokyo',
-            'ko-KR': 'Asia/Seoul',
-            'zh-CN': 'Asia/Shanghai',
-            'zh-TW': 'Asia/Taipei',
-            'pt-BR': 'America/Sao_Paulo',
-            'ru-RU': 'Europe/Moscow',
-            'ar-SA': 'Asia/Riyadh',
-            'hi-IN': 'Asia/Kolkata',
-            'th-TH': 'Asia/Bangkok',
-            'vi-VN': 'Asia/Ho_Chi_Minh'
+        accept_language = headers.get('accept-language', '')
+        timezone, language = resolve_client_locale(headers.get('x-timezone', ''), accept_language, user_agent)
+        origin = headers.get('origin', '')
+        return {
+            'user_agent': user_agent,
+            'accept_language': accept_language,
+            'origin': origin,
+            'timezone': timezone,
+            'language': language,
+            # Fixed for the connection so messages cannot switch to another tenant
+            'tenant': tenant_registry.resolve(websocket.query_params.get('tenant'), origin).name,
         }
-        
-        # Parse accept-language header
-        languages = accept_language.lower().split(',')
-        for lang in languages:
-            lang_code = lang.strip().split(';')[0]  # Remove quality values
-            if lang_code in timezone_map:
-                return timezone_map[lang_code]
-                
-            # Try just the language part (e.g., 'en' from 'en-US')
-            base_lang = lang_code.split('-')[0]
-            if base_lang == 'en':
-                return 'America/New_York'  # Default English to US Eastern
-            elif base_lang == 'es':
-                return 'Europe/Madrid'  # Default Spanish to Spain
-            elif base_lang == 'de':
-                return 'Europe/Berlin'
-            # Add more base language mappings as needed
-                
-        return None
-
-    def _guess_timezone_from_user_agent(self, user_agent: str) -> str:
-        """Guess timezone from User-Agent string"""
-        user_agent_lower = user_agent.lower()
-        
-        # Mobile OS timezone hints
-        if 'android' in user_agent_lower:
-            return 'America/New_York'  # Default for Android
-        elif 'iphone' in user_agent_lower or 'ipad' in user_agent_lower:
-            return 'America/New_York'  # Default for iOS
-            
-        return None
-
-    def disconnect(self, client_id: str):
+
+    def _count_timezone(self, timezone: str, delta: int):
+        remaining = self.timezone_counts.get(timezone, 0) + delta
+        if remaining > 0:
+            self.timezone_counts[timezone] = remaining
+        else:
+            self.timezone_counts.pop(timezone, None)
+
+    def _end_session(self, session: ClientSession):
+        """The single teardown path for a session: queue, bus ownership and counters"""
+        if self.sessions.get(session.client_id) is session:
+            del self.sessions[session.client_id]
+        session.outbound.close()
+        self._count_timezone(session.timezone, -1)
+
+    def disconnect(self, client_id: str, websocket: Optional[WebSocket] = None):
         """Disconnect client and clean up resources"""
-        if client_id in self.active_connections:
-            del self.active_connections[client_id]
-        if client_id in self.client_timezones:
-            del self.client_timezones[client_id]
-        if client_id in self.client_metadata:
-            del self.client_metadata[client_id]
+        session = self.sessions.get(client_id)
+        if session is None or (websocket is not None and session.websocket is not websocket):
+            # Already gone, or a newer connection for this client replaced this one
+            return
+        self._end_session(session)
+        self.bus.unregister(client_id)
+        disconnects_total.inc()
         logger.info(
-            f"Client {client_id} disconnected. Total connections: {len(self.active_connections)}"
+            f"Client {client_id} disconnected. Total connections: {len(self.sessions)}"
         )
 
+    def touch(self, client_id: str, conversation_id: Optional[str] = None):
+        """Record client activity, and the conversation it is using, for idle reaping"""
+        session = self.sessions.get(client_id)
+        if session is not None:
+            session.last_active = time.monotonic()
+            if conversation_id:
+                session.conversation_id = conversation_id
+
+    @property
+    def connection_count(self) -> int:
+        return len(self.sessions)
+
+    def get_conversation_id(self, client_id: str) -> Optional[str]:
+        """The conversation a connected client is using, or None for clients without a connection"""
+        session = self.sessions.get(client_id)
+        return session.conversation_id if session is not None else None
+
     def get_client_timezone(self, client_id: str) -> str:
         """Get client timezone, default to UTC if not set"""
-        return self.client_timezones.get(client_id, "UTC")
+        session = self.sessions.get(client_id)
+        return session.timezone if session is not None else "UTC"
 
     def get_client_metadata(self, client_id: str) -> dict:
         """Get full client metadata"""
-        return self.client_metadata.get(client_id, {
-            'timezone': 'UTC', 
-            'language': 'en',
-            'user_agent': '',
-            'origin': ''
-        })
+        session = self.sessions.get(client_id)
+        if session is None:
+            return {'timezone': 'UTC', 'language': 'en', 'user_agent': '', 'origin': ''}
+        return session.metadata()
+
+    def get_codec(self, client_id: str) -> Codec:
+        """Get the codec negotiated by a locally connected client"""
+        session = self.sessions.get(client_id)
+        return session.outbound.codec if session is not None else CODECS["json"]
 
     async def send_personal_message(self, message: dict, client_id: str):
-        """Send message to specific client"""
-        if client_id in self.active_connections:
-            websocket = self.active_connections[client_id]
-            await websocket.send_text(json.dumps(message))
+        """
+        Queue a message for a specific client, routing through the bus if another
+        worker owns it. Never waits on the socket itself; the client's writer task does.
+        """
+        session = self.sessions.get(client_id)
+        if session is not None:
+            session.outbound.put(message)
+        else:
+            await self.bus.publish(client_id, message)
+
+    async def _deliver_local(self, client_id: str, message: dict):
+        """Deliver a message routed to this worker by the bus"""
+        session = self.sessions.get(client_id)
+        if session is not None:
+            session.outbound.put(message)
+
+    async def _evict_local(self, client_id: str):
+        """Close a local socket whose client reconnected to another worker"""
+        session = self.sessions.get(client_id)
+        if session is None:
+            return
+        logger.info(f"Client {client_id} moved to another worker, closing local connection")
+        self.disconnect(client_id)
+        try:
+            await session.websocket.close()
+        except Exception as e:
+            logger.warning(f"Error closing evicted connection for {client_id}: {e}")
 
     def get_connection_stats(self) -> dict:
-        """Get connection statistics"""
+        """Get connection statistics in constant time (per-client details are in list_clients)"""
         return {
-            'total_connections': len(self.active_connections),
-            'active_clients': list(self.active_connections.keys()),
-            'timezone_distribution': dict(self.client_timezones)
+            'total_connections': len(self.sessions),
+            'timezone_distribution': dict(self.timezone_counts),
+            'shared_metadata_values': shared_value_count(),
+            'locale_cache': get_locale_cache_stats(),
         }
+
+    def list_clients(self, offset: int = 0, limit: int = 100, timezone: Optional[str] = None,
+                     language: Optional[str] = None, prefix: Optional[str] = None) -> dict:
+        """Page through connected clients, optionally filtered by timezone, language or id prefix"""
+        filtered = bool(timezone or language or prefix)
+        sessions = iter(self.sessions.values())
+        if filtered:
+            sessions = (
+                session for session in sessions
+                if (not prefix or session.client_id.startswith(prefix))
+                and (not timezone or session.timezone == timezone)
+                and (not language or session.language == language)
+            )
+            matches = list(sessions)
+            total = len(matches)
+            page = matches[offset:offset + limit]
+        else:
+            # Unfiltered pages only walk offset + limit entries
+            total = len(self.sessions)
+            page = list(islice(sessions, offset, offset + limit))
+
+        clients = []
+        for session in page:
+            clients.append({
+                'client_id': session.client_id,
+                'timezone': session.timezone,
+                'language': session.language,
+                'protocol': session.protocol,
+                'tenant': session.tenant,
+                'origin': session.origin,
+                'user_agent': session.user_agent,
+                'outbound_depth': len(session.outbound),
+            })
+        return {'total': total, 'offset': offset, 'limit': limit, 'clients': clients}
+
+    def get_outbound_stats(self) -> dict:
+        """Get outbound queue statistics"""
+        return {
+            **self.outbound_stats.as_dict(),
+            'queue_limit': app_config.outbound_queue_size,
+            'overflow_policy': app_config.outbound_overflow_policy,
+        }
+
+    async def get_cluster_stats(self) -> dict:
+        """Get connection statistics across all workers"""
+        return await self.bus.get_cluster_stats()
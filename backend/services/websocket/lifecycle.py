@@ -0,0 +1,127 @@
+"""
+Connection Lifecycle
+Reaps idle WebSocket clients and drains connections gracefully on shutdown
+"""
+
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from app_config import app_config
+from services.websocket.connection_manager import SERVICE_RESTART_CLOSE_CODE, ConnectionManager, restart_reason
+from services.websocket.message_handler import WebSocketHandler
+from services.websocket.session import ClientSession
+
+logger = logging.getLogger(__name__)
+
+# Application close code for idle clients; widgets reconnect on their next message
+IDLE_CLOSE_CODE = 4000
+
+
+class ConnectionLifecycle:
+    def __init__(
+        self,
+        manager: ConnectionManager,
+        handler: WebSocketHandler,
+        idle_timeout: Optional[float] = None,
+        drain_seconds: Optional[float] = None,
+    ):
+        self.manager = manager
+        self.handler = handler
+        self.idle_timeout = app_config.ws_idle_timeout_seconds if idle_timeout is None else idle_timeout
+        self.drain_seconds = app_config.shutdown_drain_seconds if drain_seconds is None else drain_seconds
+        self._reaper: Optional[asyncio.Task] = None
+        self._drained = False
+        self.reaped = 0
+
+    async def start(self):
+        """Start the idle reaper, called from the app lifespan"""
+        if self.idle_timeout > 0:
+            self._reaper = asyncio.create_task(self._reap_loop())
+
+    async def close(self):
+        """Stop the reaper and drain whatever is still connected, called from the app lifespan"""
+        if self._reaper:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+        await self.drain()
+
+    async def _reap_loop(self):
+        # Check often enough that a client is reaped within ~1.25x the timeout
+        interval = min(60.0, max(1.0, self.idle_timeout / 4))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reap_idle()
+            except Exception as e:
+                logger.error(f"Idle reaper failed: {e}")
+
+    async def reap_idle(self) -> int:
+        """Close clients with no messages for idle_timeout and release their state"""
+        cutoff = time.monotonic() - self.idle_timeout
+        idle = [
+            session for session in self.manager.sessions.values()
+            if session.last_active < cutoff and session.client_id not in self.handler.inflight_turns
+        ]
+        for session in idle:
+            await self._close(session, IDLE_CLOSE_CODE, "idle")
+            await self.handler.release_client(session)
+        if idle:
+            self.reaped += len(idle)
+            logger.info(f"Reaped {len(idle)} idle clients")
+        return len(idle)
+
+    async def drain(self):
+        """
+        Stop accepting connections, give in-flight turns until the drain
+        deadline to finish, then close every socket with 1012 and a jittered
+        retry_after hint.
+        """
+        if self._drained:
+            return
+        self._drained = True
+        self.manager.accepting = False
+
+        deadline = time.monotonic() + self.drain_seconds
+        if self.handler.inflight_turns:
+            logger.info(
+                f"Draining {len(self.handler.inflight_turns)} in-flight turns "
+                f"(up to {self.drain_seconds}s) before closing {len(self.manager.sessions)} connections"
+            )
+        while self.handler.inflight_turns and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for client_id in list(self.handler.inflight_turns):
+            self.handler.cancel_turn(client_id)
+
+        sessions = list(self.manager.sessions.values())
+        # Let final frames already queued reach their clients before the close
+        await asyncio.gather(
+            *(session.outbound.wait_empty(max(1.0, deadline - time.monotonic())) for session in sessions)
+        )
+        for session in sessions:
+            await self._close(session, SERVICE_RESTART_CLOSE_CODE, restart_reason())
+        if sessions:
+            logger.info(f"Closed {len(sessions)} connections for shutdown")
+
+    async def _close(self, session: ClientSession, code: int, reason: str):
+        self.manager.disconnect(session.client_id, session.websocket)
+        try:
+            await session.websocket.close(code=code, reason=reason)
+        except Exception as e:
+            logger.debug(f"Error closing connection for {session.client_id}: {e}")
+
+    @property
+    def draining(self) -> bool:
+        return self._drained
+
+    def get_stats(self) -> dict:
+        """Get idle reaping and draining statistics"""
+        return {
+            'idle_timeout_seconds': self.idle_timeout,
+            'reaped_idle_clients': self.reaped,
+            'draining': self._drained,
+        }
@@ -0,0 +1,276 @@
+"""
+Message Bus
+Pluggable cross-worker routing for WebSocket messages, client ownership and stats
+"""
+
+import asyncio
+import fcntl
+import itertools
+import json
+import logging
+import os
+import socket
+import time
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Collection, Dict, Optional
+from urllib.parse import urlparse
+
+from app_config import app_config
+from services.websocket.bus_broker import BusBroker, encode_frame, open_bus_connection
+
+logger = logging.getLogger(__name__)
+
+DeliverCallback = Callable[[str, dict], Awaitable[None]]
+EvictCallback = Callable[[str], Awaitable[None]]
+
+
+class MessageBus(ABC):
+    """Interface connecting a worker's ConnectionManager to the rest of the cluster"""
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def start(self, deliver: DeliverCallback, evict: EvictCallback,
+                    local_clients: Callable[[], Collection[str]]):
+        """
+        Connect the bus; deliver/evict are invoked for frames from other workers.
+        local_clients returns a live view of this worker's client ids (len() is O(1)).
+        """
+
+    async def close(self):
+        """Disconnect from the bus"""
+
+    @abstractmethod
+    def register(self, client_id: str):
+        """Claim ownership of a client connected to this worker"""
+
+    @abstractmethod
+    def unregister(self, client_id: str):
+        """Release ownership of a client that disconnected from this worker"""
+
+    @abstractmethod
+    async def publish(self, client_id: str, message: dict):
+        """Route a message to a client owned by another worker"""
+
+    @abstractmethod
+    async def get_cluster_stats(self) -> dict:
+        """Get connection statistics across all workers, without waiting on other workers"""
+
+
+class LocalMessageBus(MessageBus):
+    """Single-process bus: every client is owned by this worker"""
+
+    def __init__(self):
+        super().__init__()
+        self._local_clients: Callable[[], Collection[str]] = lambda: ()
+        self.undeliverable = 0
+
+    async def start(self, deliver, evict, local_clients):
+        self._local_clients = local_clients
+
+    def register(self, client_id: str):
+        pass
+
+    def unregister(self, client_id: str):
+        pass
+
+    async def publish(self, client_id: str, message: dict):
+        self.undeliverable += 1
+
+    async def get_cluster_stats(self) -> dict:
+        local = len(self._local_clients())
+        return {
+            'backend': 'local',
+            'workers': 1,
+            'total_connections': local,
+            'connections_per_worker': {self.worker_id: local},
+            'undeliverable_messages': self.undeliverable,
+        }
+
+
+class SocketMessageBus(MessageBus):
+    """
+    Bus over a unix or TCP socket to a BusBroker. With embed_broker enabled the
+    first worker to bind the address hosts the broker; the others connect to it.
+    Cluster totals are fetched from the broker every stats_interval seconds in
+    the background, so reading them never waits on the broker.
+    """
+
+    def __init__(self, url: Optional[str] = None, embed_broker: Optional[bool] = None,
+                 reconnect_delay: float = 1.0, token: Optional[str] = None,
+                 stats_interval: Optional[float] = None):
+        super().__init__()
+        self.url = url or app_config.message_bus_url
+        self.token = token or app_config.message_bus_token or None
+        self.embed_broker = app_config.message_bus_embed_broker if embed_broker is None else embed_broker
+        self.reconnect_delay = reconnect_delay
+        self.stats_interval = stats_interval or app_config.message_bus_stats_interval_seconds
+        self.broker: Optional[BusBroker] = None
+        self._lock_fd: Optional[int] = None
+
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._deliver: Optional[DeliverCallback] = None
+        self._evict: Optional[EvictCallback] = None
+        self._local_clients: Callable[[], Collection[str]] = lambda: ()
+        self._request_ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._connected = asyncio.Event()
+        self._closing = False
+        self._stats_task: Optional[asyncio.Task] = None
+        self._cluster_stats: Optional[dict] = None
+        self._cluster_stats_at = 0.0
+
+    async def start(self, deliver, evict, local_clients):
+        self._deliver = deliver
+        self._evict = evict
+        self._local_clients = local_clients
+
+        if self.embed_broker:
+            await self._try_host_broker()
+        self._reader_task = asyncio.create_task(self._connection_loop())
+        self._stats_task = asyncio.create_task(self._stats_loop())
+
+    def _acquire_host_lock(self) -> bool:
+        parsed = urlparse(self.url)
+        if parsed.scheme != "unix":
+            return True  # Binding a TCP port is already exclusive
+        # The lock dies with its process, so a crashed host frees it for the next worker
+        fd = os.open(parsed.path + ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _try_host_broker(self):
+        if not self._acquire_host_lock():
+            logger.info("Message bus broker already hosted by another worker")
+            return
+        broker = BusBroker(self.url, self.token)
+        try:
+            await broker.start()
+            self.broker = broker
+        except OSError:
+            # Another worker won the race to bind the address
+            logger.info("Message bus broker already hosted by another worker")
+
+    async def close(self):
+        self._closing = True
+        for task in (self._reader_task, self._stats_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        if self._writer:
+            self._writer.close()
+        if self.broker:
+            await self.broker.close()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+
+    def _send(self, frame: dict):
+        if self._writer is None or self._writer.is_closing():
+            return False
+        self._writer.write(encode_frame(frame))
+        return True
+
+    async def _connection_loop(self):
+        while not self._closing:
+            try:
+                reader, self._writer = await open_bus_connection(self.url)
+                # Re-announce ourselves and every local client after (re)connecting
+                self._send({"op": "hello", "worker": self.worker_id, "token": self.token})
+                for client_id in list(self._local_clients()):
+                    self._send({"op": "register", "client": client_id})
+                await self._writer.drain()
+                self._connected.set()
+                logger.info(f"Worker {self.worker_id} connected to message bus at {self.url}")
+                await self._read_frames(reader)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Message bus connection error: {e}")
+            finally:
+                self._connected.clear()
+                self._writer = None
+                for future in self._pending.values():
+                    if not future.done():
+                        future.set_exception(ConnectionError("Message bus disconnected"))
+                self._pending.clear()
+            if not self._closing:
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def _read_frames(self, reader: asyncio.StreamReader):
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            frame = json.loads(line)
+            op = frame.get("op")
+            try:
+                if op == "deliver":
+                    await self._deliver(frame["client"], frame["message"])
+                elif op == "evict":
+                    await self._evict(frame["client"])
+                elif op == "stats":
+                    future = self._pending.pop(frame.get("id"), None)
+                    if future is not None and not future.done():
+                        future.set_result(frame["stats"])
+            except Exception as e:
+                logger.error(f"Error handling message bus frame {op}: {e}")
+
+    def register(self, client_id: str):
+        self._send({"op": "register", "client": client_id})
+
+    def unregister(self, client_id: str):
+        self._send({"op": "unregister", "client": client_id})
+
+    async def publish(self, client_id: str, message: dict):
+        if self._send({"op": "send", "client": client_id, "message": message}):
+            await self._writer.drain()
+
+    async def _request_stats(self) -> Optional[dict]:
+        """Ask the broker for cluster totals; None if disconnected or it does not answer in time"""
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        if not self._send({"op": "stats", "id": request_id}):
+            self._pending.pop(request_id, None)
+            return None
+        try:
+            return await asyncio.wait_for(future, timeout=1.0)
+        except (asyncio.TimeoutError, ConnectionError):
+            self._pending.pop(request_id, None)
+            return None
+
+    async def _stats_loop(self):
+        while True:
+            await self._connected.wait()
+            stats = await self._request_stats()
+            if stats is not None:
+                self._cluster_stats = stats
+                self._cluster_stats_at = time.monotonic()
+            await asyncio.sleep(self.stats_interval)
+
+    async def get_cluster_stats(self) -> dict:
+        local = len(self._local_clients())
+        stats = {'backend': 'socket', 'worker_id': self.worker_id, 'connected': self._connected.is_set()}
+        if self._cluster_stats is None:
+            return {**stats, 'workers': 1, 'total_connections': local}
+        age = round(time.monotonic() - self._cluster_stats_at, 1)
+        return {**stats, **self._cluster_stats, 'stats_age_seconds': age}
+
+
+def create_message_bus() -> MessageBus:
+    """Build the message bus selected by MESSAGE_BUS"""
+    backend = app_config.message_bus.lower()
+    if backend == "socket":
+        return SocketMessageBus()
+    if backend != "local":
+        logger.warning(f"Unknown MESSAGE_BUS '{backend}', falling back to local")
+    return LocalMessageBus()
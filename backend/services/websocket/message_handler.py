@@ -3,74 +3,289 @@ WebSocket Message Handlers
 Handles different types of WebSocket messages and responses
 """
 
-import json
+import asyncio
+import contextvars
 import logging
+import time
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Union
+from fastapi import WebSocket
+from app_config import app_config
 from services.websocket.connection_manager import ConnectionManager
+from services.admission_service import AdmissionController, AdmissionRejected, admission_controller
+from services import deadline
 from services.agent_service import AgentService
+from services.deadline import DeadlineExceeded, turn_deadline
+from services.metrics_service import HISTORY_SECONDS, PARSE_SECONDS, QUEUE_WAIT_SECONDS, errors_total, turns_total
+from services.conversation import (
+    ConversationStore, ConversationWindow, create_conversation_store, verify_session_id
+)
+from services.resilience import UpstreamUnavailable
+from services.tenant_service import Tenant, tenant_registry
+from services.tools_service import ToolContext
+from services.websocket.session import ClientSession
 
 logger = logging.getLogger(__name__)
 
+FrameSink = Callable[[dict], Awaitable[None]]
+
+# Where the current turn's frames go when it is not answering a WebSocket (e.g. HTTP /chat)
+_frame_sink: contextvars.ContextVar[Optional[FrameSink]] = contextvars.ContextVar("frame_sink", default=None)
+
 
 class WebSocketHandler:
-    def __init__(self, connection_manager: ConnectionManager, agent_service: AgentService):
+    def __init__(self, connection_manager: ConnectionManager, agent_service: AgentService,
+                 conversation_store: Optional[ConversationStore] = None,
+                 admission: Optional[AdmissionController] = None):
         self.manager = connection_manager
         self.agent_service = agent_service
-        self.conversation_histories: Dict[str, List[dict]] = {}
+        self.admission = admission or admission_controller
+        # Histories are keyed by session_id so they outlive a single socket
+        self.conversation_store = conversation_store or create_conversation_store(
+            agent_service.new_conversation_window
+        )
+        # One in-flight turn per client, with the socket that started it
+        self.inflight_turns: Dict[str, Tuple[WebSocket, asyncio.Task]] = {}
+        self.cancelled_turns = 0
+
+    async def dispatch(self, websocket, client_id: str, raw_message: Union[str, bytes]):
+        """Start processing a message in its own task so the receive loop keeps running"""
+        message_data = await self._parse(client_id, raw_message)
+        if message_data is None:
+            return
+
+        if message_data.get("type") == "cancel":
+            if self.cancel_turn(client_id):
+                await self._send_cancelled(client_id)
+            return
+
+        # Application-level heartbeat for clients whose proxies hide protocol pings;
+        # it does not count as activity, so idle tabs are still reaped
+        if message_data.get("type") == "ping":
+            await self._deliver(client_id, {"type": "pong", "timestamp": datetime.now().isoformat()})
+            return
+
+        if not str(message_data.get("message", "")).strip():
+            return
+
+        self.manager.touch(client_id)
+
+        # Rate-limited messages are refused before they can supersede the current turn
+        if not await self._check_rate(client_id):
+            return
+
+        # A new message supersedes the turn the client was still waiting for
+        if self.cancel_turn(client_id):
+            await self._send_cancelled(client_id)
+
+        task = asyncio.create_task(self._process_turn(client_id, message_data))
+        self.inflight_turns[client_id] = (websocket, task)
+        task.add_done_callback(lambda finished: self._forget_turn(client_id, finished))
+
+    def cancel_turn(self, client_id: str, websocket: Optional[WebSocket] = None) -> bool:
+        """
+        Cancel the client's in-flight turn, aborting its upstream request.
+        With a websocket given, only a turn started from that socket is cancelled.
+        """
+        entry = self.inflight_turns.get(client_id)
+        if entry is None:
+            return False
+        owner, task = entry
+        if websocket is not None and owner is not websocket:
+            return False
+        del self.inflight_turns[client_id]
+        if task.done():
+            return False
+        task.cancel()
+        self.cancelled_turns += 1
+        logger.info(f"Cancelled in-flight turn for {client_id}")
+        return True
+
+    def _forget_turn(self, client_id: str, task: asyncio.Task):
+        entry = self.inflight_turns.get(client_id)
+        if entry is not None and entry[1] is task:
+            del self.inflight_turns[client_id]
+
+    async def handle_message(self, websocket, client_id: str, raw_message: Union[str, bytes]):
+        """Handle incoming WebSocket message and wait for the turn to finish"""
+        message_data = await self._parse(client_id, raw_message)
+        if message_data is None:
+            return
+        if await self._check_rate(client_id):
+            await self._process_turn(client_id, message_data)
+
+    async def run_turn(self, client_id: str, message_data: dict, sink: FrameSink,
+                       rate_key: Optional[str] = None):
+        """
+        Run a turn through the same pipeline as WebSocket messages, delivering
+        its frames to sink instead of a connection. rate_key selects the token
+        bucket to charge; without it the rate limit is skipped.
+        """
+        token = _frame_sink.set(sink)
+        try:
+            if rate_key is not None and not await self._check_rate(rate_key):
+                return
+            await self._process_turn(client_id, message_data)
+        finally:
+            _frame_sink.reset(token)
 
-    async def handle_message(self, websocket, client_id: str, raw_message: str):
-        """Handle incoming WebSocket message"""
+    async def _deliver(self, client_id: str, message: dict):
+        sink = _frame_sink.get()
+        if sink is not None:
+            await sink(message)
+        else:
+            await self.manager.send_personal_message(message, client_id)
+
+    async def _parse(self, client_id: str, raw_message: Union[str, bytes]) -> Optional[dict]:
+        """Decode a client frame with its negotiated codec, replying with an error if it is invalid"""
+        started = time.perf_counter()
+        try:
+            message_data = self.manager.get_codec(client_id).decode(raw_message)
+            if not isinstance(message_data, dict):
+                raise ValueError("Frame is not an object")
+            return message_data
+        except (ValueError, TypeError):
+            # JSON and msgpack decode errors are both ValueErrors
+            errors_total.labels(kind="parse").inc()
+            await self._send_error_message(client_id, "Invalid message format. Please send valid JSON.")
+            return None
+        finally:
+            PARSE_SECONDS.observe(time.perf_counter() - started)
+
+    async def _check_rate(self, client_id: str) -> bool:
+        """Apply the per-client rate limit, telling the client when it is exceeded"""
+        try:
+            self.admission.check_rate(client_id)
+            return True
+        except AdmissionRejected as e:
+            logger.info(f"Rate limited {client_id}, retry after {e.retry_after}s")
+            errors_total.labels(kind=e.code).inc()
+            await self._send_error_message(client_id, e.message, code=e.code, retry_after=e.retry_after)
+            return False
+
+    async def _process_turn(self, client_id: str, message_data: dict):
+        """Run one user turn under its deadline, from receiving the message to the response"""
+        with turn_deadline():
+            await self._handle_turn(client_id, message_data)
+
+    async def _handle_turn(self, client_id: str, message_data: dict):
+        """Run one user turn: echo, typing indicator, agent call and response"""
         try:
-            message_data = json.loads(raw_message)
             user_message = message_data.get("message", "")
 
             if not user_message.strip():
                 return
 
+            # Only server-issued ids resume a conversation; without one a connected
+            # client uses its connection's session and an HTTP turn keeps no history
+            session_id = message_data.get("session_id")
+            if session_id is not None and not verify_session_id(session_id):
+                logger.warning(f"Rejected unknown session id from {client_id}")
+                errors_total.labels(kind="invalid_session").inc()
+                turns_total.labels(outcome="rejected").inc()
+                await self._send_error_message(
+                    client_id, "This conversation could not be found. Please start a new one.",
+                    code="invalid_session",
+                )
+                return
+            session_id = session_id or self.manager.get_conversation_id(client_id)
+            if session_id is not None:
+                self.manager.touch(client_id, session_id)
+            history_id = session_id or client_id
+
+            # Clients opt in to incremental assistant_delta frames per message
+            stream = app_config.streaming_enabled and bool(message_data.get("stream", False))
+
             # Get client metadata (including timezone)
             client_metadata = self.manager.get_client_metadata(client_id)
-            client_timezone = client_metadata.get('timezone', 'UTC')
+            # A message may override what was detected at connect time (HTTP clients have no connection)
+            client_timezone = message_data.get("timezone") or client_metadata.get('timezone', 'UTC')
             
-            logger.info(f"Received from {client_id}: {user_message} (timezone: {client_timezone})")
+            # Connected clients keep the tenant resolved at connect time; HTTP turns name theirs
+            tenant = tenant_registry.get(client_metadata.get('tenant') or message_data.get("tenant"))
 
-            # Initialize conversation history if not exists
-            if client_id not in self.conversation_histories:
-                self.conversation_histories[client_id] = []
+            logger.info(f"Received from {client_id}: {user_message} (timezone: {client_timezone}, tenant: {tenant.name})")
 
-            # Echo user message back (optional, for UI confirmation)
-            await self._send_user_message_confirmation(client_id, user_message)
-
-            # Add to conversation history
-            self.conversation_histories[client_id].append({
-                "role": "user", 
-                "content": user_message
-            })
-
-            # Send typing indicator
-            await self._send_typing_indicator(client_id)
-
-            # Get AI response with client's timezone context
-            ai_response = await self._get_ai_response(
-                user_message, 
-                self.conversation_histories[client_id],
-                client_timezone,
-                client_metadata
+            # Per-turn context handed to tools, isolated from other concurrent turns
+            tool_context = ToolContext(
+                client_id=client_id,
+                timezone=client_timezone,
+                language=message_data.get("language") or client_metadata.get('language', 'en'),
+                tenant=tenant.name,
+                metadata=client_metadata
             )
 
-            # Add AI response to conversation history
-            self.conversation_histories[client_id].append({
-                "role": "assistant", 
-                "content": ai_response
-            })
+            # Load conversation history for this session (restored after reconnects)
+            started = time.perf_counter()
+            history = await self.conversation_store.load(history_id)
+            HISTORY_SECONDS.observe(time.perf_counter() - started)
+
+            # Echo user message back (optional, for UI confirmation)
+            if client_metadata.get('echo', True):
+                await self._send_user_message_confirmation(client_id, user_message)
+
+            # Wait for an in-flight slot; queued clients are told their position
+            started = time.perf_counter()
+            try:
+                await self.admission.acquire(lambda position: self._send_queued(client_id, position))
+            except AdmissionRejected as e:
+                logger.warning(f"Shed turn from {client_id}: {e.code}")
+                errors_total.labels(kind=e.code).inc()
+                turns_total.labels(outcome="rejected").inc()
+                await self._send_error_message(client_id, e.message, code=e.code, retry_after=e.retry_after)
+                return
+            QUEUE_WAIT_SECONDS.observe(time.perf_counter() - started)
 
-            # Send AI response
-            await self._send_ai_response(client_id, ai_response)
+            try:
+                # Send typing indicator
+                await self._send_typing_indicator(client_id)
 
-        except json.JSONDecodeError:
-            await self._send_error_message(client_id, "Invalid message format. Please send valid JSON.")
+                # Get AI response with client's timezone context
+                if stream:
+                    reply = self._stream_ai_response(
+                        client_id,
+                        user_message,
+                        history,
+                        tool_context,
+                        tenant,
+                        session_id
+                    )
+                else:
+                    reply = self._get_ai_response(
+                        user_message, 
+                        history,
+                        tool_context,
+                        tenant
+                    )
+                try:
+                    # Stop waiting when the turn runs out of time; the upstream request is aborted too
+                    ai_response = await asyncio.wait_for(reply, deadline.remaining())
+                except asyncio.TimeoutError:
+                    raise DeadlineExceeded()
+
+                # Add the completed turn to conversation history
+                await self.conversation_store.append_turn(history_id, user_message, ai_response)
+
+                # Send AI response (streamed turns already sent assistant_done)
+                if not stream:
+                    await self._send_ai_response(client_id, ai_response, session_id)
+                turns_total.labels(outcome="completed").inc()
+            finally:
+                self.admission.release()
+
+        except (DeadlineExceeded, UpstreamUnavailable) as e:
+            # Nothing is added to the history; the client may simply send the message again
+            logger.warning(f"Turn from {client_id} failed: {e}")
+            errors_total.labels(kind=e.code).inc()
+            turns_total.labels(outcome=e.code).inc()
+            await self._send_error_message(client_id, e.message, code=e.code, retry_after=e.retry_after)
+        except asyncio.CancelledError:
+            turns_total.labels(outcome="cancelled").inc()
+            raise
         except Exception as e:
             logger.error(f"Error handling message from {client_id}: {str(e)}")
+            errors_total.labels(kind="turn").inc()
+            turns_total.labels(outcome="error").inc()
             await self._send_error_message(client_id, f"Sorry, I encountered an error: {str(e)}")
 
     async def _send_user_message_confirmation(self, client_id: str, message: str):
@@ -81,7 +296,18 @@ class WebSocketHandler:
             "timestamp": datetime.now().isoformat(),
             "sender": "user",
         }
-        await self.manager.send_personal_message(user_msg, client_id)
+        await self._deliver(client_id, user_msg)
+
+    async def _send_queued(self, client_id: str, position: int):
+        """Tell the client its turn is waiting for a free slot"""
+        queued_msg = {
+            "type": "queued",
+            "message": "Waiting for the assistant...",
+            "position": position,
+            "timestamp": datetime.now().isoformat(),
+            "sender": "system",
+        }
+        await self._deliver(client_id, queued_msg)
 
     async def _send_typing_indicator(self, client_id: str):
         """Send typing indicator to client"""
@@ -91,23 +317,76 @@ class WebSocketHandler:
             "timestamp": datetime.now().isoformat(),
             "sender": "assistant",
         }
-        await self.manager.send_personal_message(typing_msg, client_id)
+        await self._deliver(client_id, typing_msg)
 
-    async def _get_ai_response(self, message: str, conversation_history: List[dict], 
-                              timezone: str, metadata: dict) -> str:
+    async def _get_ai_response(self, message: str, conversation_history: ConversationWindow, 
+                              tool_context: ToolContext, tenant: Optional[Tenant] = None) -> str:
         """Get AI response using agent service with client context"""
         try:
-            response = self.agent_service.run(
+            response = await self.agent_service.run_async(
                 user_message=message,
                 conversation_history=conversation_history,
-                client_timezone=timezone
+                tool_context=tool_context,
+                tenant=tenant
             )
             return response
+        except (DeadlineExceeded, UpstreamUnavailable):
+            raise
         except Exception as e:
             logger.error(f"Agent service error: {str(e)}")
+            errors_total.labels(kind="agent").inc()
             return f"Sorry, I encountered an error: {str(e)}"
 
-    async def _send_ai_response(self, client_id: str, response: str):
+    async def _stream_ai_response(self, client_id: str, message: str,
+                                  conversation_history: ConversationWindow, tool_context: ToolContext,
+                                  tenant: Optional[Tenant] = None, session_id: Optional[str] = None) -> str:
+        """Stream AI response deltas to client and return the full response"""
+        response = ""
+        try:
+            async for event, text in self.agent_service.stream(
+                user_message=message,
+                conversation_history=conversation_history,
+                tool_context=tool_context,
+                tenant=tenant
+            ):
+                if event == "delta":
+                    await self._send_ai_delta(client_id, text)
+                else:
+                    response = text
+        except (DeadlineExceeded, UpstreamUnavailable):
+            raise
+        except Exception as e:
+            logger.error(f"Agent service streaming error: {str(e)}")
+            errors_total.labels(kind="agent").inc()
+            response = f"Sorry, I encountered an error: {str(e)}"
+
+        await self._send_ai_done(client_id, response, session_id)
+        return response
+
+    async def _send_ai_delta(self, client_id: str, delta: str):
+        """Send an incremental chunk of the AI response to client"""
+        delta_msg = {
+            "type": "assistant_delta",
+            "message": delta,
+            "timestamp": datetime.now().isoformat(),
+            "sender": "assistant",
+        }
+        await self._deliver(client_id, delta_msg)
+
+    async def _send_ai_done(self, client_id: str, response: str, session_id: Optional[str] = None):
+        """Send the complete AI response, closing a streamed turn"""
+        done_msg = {
+            "type": "assistant_done",
+            "message": response,
+            "timestamp": datetime.now().isoformat(),
+            "sender": "assistant",
+        }
+        if session_id:
+            # The id to send back to resume this conversation, e.g. after reconnecting
+            done_msg["session_id"] = session_id
+        await self._deliver(client_id, done_msg)
+
+    async def _send_ai_response(self, client_id: str, response: str, session_id: Optional[str] = None):
         """Send AI response to client"""
         ai_msg = {
             "type": "assistant",
@@ -115,9 +394,22 @@ class WebSocketHandler:
             "timestamp": datetime.now().isoformat(),
             "sender": "assistant",
         }
-        await self.manager.send_personal_message(ai_msg, client_id)
+        if session_id:
+            ai_msg["session_id"] = session_id
+        await self._deliver(client_id, ai_msg)
 
-    async def _send_error_message(self, client_id: str, error_message: str):
+    async def _send_cancelled(self, client_id: str):
+        """Tell the client its pending response was cancelled"""
+        cancelled_msg = {
+            "type": "cancelled",
+            "message": "Response cancelled",
+            "timestamp": datetime.now().isoformat(),
+            "sender": "system",
+        }
+        await self._deliver(client_id, cancelled_msg)
+
+    async def _send_error_message(self, client_id: str, error_message: str,
+                                  code: Optional[str] = None, retry_after: Optional[float] = None):
         """Send error message to client"""
         error_msg = {
             "type": "error",
@@ -125,17 +417,24 @@ class WebSocketHandler:
             "timestamp": datetime.now().isoformat(),
             "sender": "system",
         }
-        await self.manager.send_personal_message(error_msg, client_id)
+        if code:
+            error_msg["code"] = code
+        if retry_after is not None:
+            error_msg["retry_after"] = retry_after
+        await self._deliver(client_id, error_msg)
 
-    def cleanup_client_history(self, client_id: str):
-        """Clean up conversation history for disconnected client"""
-        if client_id in self.conversation_histories:
-            del self.conversation_histories[client_id]
-            logger.info(f"Cleaned up conversation history for {client_id}")
+    async def release_client(self, session: ClientSession):
+        """Free what the handler holds for a client that went away for good"""
+        self.cancel_turn(session.client_id)
+        await self.conversation_store.release(session.conversation_id)
 
-    def get_conversation_stats(self) -> dict:
-        """Get conversation statistics"""
+    def get_turn_stats(self) -> dict:
+        """Get in-flight turn statistics"""
         return {
-            'active_conversations': len(self.conversation_histories),
-            'total_messages': sum(len(history) for history in self.conversation_histories.values())
+            'inflight_turns': len(self.inflight_turns),
+            'cancelled_turns': self.cancelled_turns,
         }
+
+    def get_conversation_stats(self) -> dict:
+        """Get conversation statistics"""
+        return self.conversation_store.get_stats()
@@ -0,0 +1,195 @@
+"""
+Outbound Queues
+Per-connection bounded send queues drained by a dedicated writer task
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Optional
+
+from fastapi import WebSocket
+
+from app_config import app_config
+from services.metrics_service import SEND_SECONDS, errors_total
+from services.websocket.codec import CODECS, Codec
+
+logger = logging.getLogger(__name__)
+
+# WebSocket close code 1013 (Try Again Later) for consumers that cannot keep up
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+OVERFLOW_POLICIES = ("drop_typing", "coalesce_deltas")
+
+
+class OutboundStats:
+    """Counters shared by every OutboundQueue, maintained incrementally"""
+
+    def __init__(self):
+        self.queued_frames = 0
+        self.sent_frames = 0
+        self.sent_bytes = 0
+        self.dropped_frames = 0
+        self.coalesced_frames = 0
+        self.slow_consumer_disconnects = 0
+        self.max_depth_seen = 0
+
+    def as_dict(self) -> dict:
+        return {
+            'queued_frames': self.queued_frames,
+            'sent_frames': self.sent_frames,
+            'sent_bytes': self.sent_bytes,
+            'dropped_frames': self.dropped_frames,
+            'coalesced_frames': self.coalesced_frames,
+            'slow_consumer_disconnects': self.slow_consumer_disconnects,
+            'max_depth_seen': self.max_depth_seen,
+        }
+
+
+class OutboundQueue:
+    """
+    Bounded queue of frames for one socket. When it is full, the configured
+    policies are tried in order (drop typing frames, merge assistant deltas);
+    if none frees room the client is disconnected as a slow consumer.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        client_id: str,
+        stats: OutboundStats,
+        max_size: Optional[int] = None,
+        overflow_policy: Optional[str] = None,
+        send_timeout: Optional[float] = None,
+        codec: Optional[Codec] = None,
+    ):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.stats = stats
+        self.max_size = max_size or app_config.outbound_queue_size
+        policy = overflow_policy if overflow_policy is not None else app_config.outbound_overflow_policy
+        self.policies = [name.strip() for name in policy.split(",") if name.strip() in OVERFLOW_POLICIES]
+        self.send_timeout = send_timeout or app_config.outbound_send_timeout_seconds
+        self.codec = codec or CODECS["json"]
+
+        self._frames: Deque[dict] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.closed = False
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def start(self):
+        self._task = asyncio.create_task(self._drain())
+
+    async def wait_empty(self, timeout: float):
+        """Wait up to timeout for queued frames to be sent"""
+        deadline = time.monotonic() + timeout
+        while self._frames and not self.closed and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+
+    def close(self):
+        """Stop the writer task and discard anything still queued"""
+        self.closed = True
+        self.stats.queued_frames -= len(self._frames)
+        self._frames.clear()
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    def put(self, message: dict) -> bool:
+        """Queue a frame without blocking; returns False if it was dropped"""
+        if self.closed:
+            return False
+
+        frame_type = message.get("type")
+        if frame_type == "assistant_delta" and "coalesce_deltas" in self.policies and self._merge_delta(message):
+            return True
+
+        if len(self._frames) >= self.max_size and not self._make_room(frame_type):
+            if frame_type == "typing" and "drop_typing" in self.policies:
+                self._drop()
+                return False
+            self._disconnect_slow_consumer()
+            return False
+
+        self._frames.append(message)
+        self.stats.queued_frames += 1
+        if len(self._frames) > self.stats.max_depth_seen:
+            self.stats.max_depth_seen = len(self._frames)
+        self._wakeup.set()
+        return True
+
+    def _merge_delta(self, message: dict) -> bool:
+        # Only merge into a backlog; an idle queue sends the delta straight away
+        if not self._frames:
+            return False
+        last = self._frames[-1]
+        if last.get("type") != "assistant_delta":
+            return False
+        self._frames[-1] = {**last, "message": last["message"] + message["message"]}
+        self.stats.coalesced_frames += 1
+        return True
+
+    def _make_room(self, frame_type: Optional[str]) -> bool:
+        if "drop_typing" in self.policies:
+            if frame_type == "typing":
+                return False
+            for index, frame in enumerate(self._frames):
+                if frame.get("type") == "typing":
+                    del self._frames[index]
+                    self.stats.queued_frames -= 1
+                    self._drop()
+                    return True
+        return False
+
+    def _drop(self):
+        self.dropped += 1
+        self.stats.dropped_frames += 1
+
+    def _disconnect_slow_consumer(self):
+        logger.warning(
+            f"Client {self.client_id} is not reading fast enough "
+            f"({len(self._frames)} queued frames), disconnecting"
+        )
+        self.stats.slow_consumer_disconnects += 1
+        errors_total.labels(kind="slow_consumer").inc()
+        self.stats.dropped_frames += len(self._frames) + 1
+        self.stats.queued_frames -= len(self._frames)
+        self._frames.clear()
+        self.closed = True
+        asyncio.ensure_future(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            await self.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE)
+        except Exception as e:
+            logger.debug(f"Error closing slow consumer {self.client_id}: {e}")
+
+    async def _drain(self):
+        while not self.closed:
+            if not self._frames:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            frame = self._frames.popleft()
+            self.stats.queued_frames -= 1
+            try:
+                started = time.perf_counter()
+                payload = self.codec.encode(frame)
+                send = self.websocket.send_bytes if self.codec.binary else self.websocket.send_text
+                await asyncio.wait_for(send(payload), self.send_timeout)
+                SEND_SECONDS.observe(time.perf_counter() - started)
+                self.stats.sent_frames += 1
+                # Bytes before permessage-deflate, which the server applies below us
+                self.stats.sent_bytes += len(payload)
+            except asyncio.TimeoutError:
+                self._disconnect_slow_consumer()
+            except Exception as e:
+                logger.debug(f"Outbound send to {self.client_id} failed: {e}")
+                self.closed = True
+                self.stats.queued_frames -= len(self._frames)
+                self._frames.clear()
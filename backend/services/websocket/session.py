@@ -0,0 +1,85 @@
+"""
+Client Sessions
+One slotted record per connected client, with metadata strings shared across clients
+"""
+
+import time
+from typing import Dict
+
+from fastapi import WebSocket
+
+from services.conversation.session_ids import issue_session_id
+from services.websocket.outbound import OutboundQueue
+
+# Most clients send identical user agents and languages; keep one copy of each.
+# Bounded so that clients sending unique headers cannot grow it without limit.
+MAX_SHARED_VALUES = 4096
+_shared_values: Dict[str, str] = {}
+
+
+def share(value: str) -> str:
+    """Return the shared copy of a metadata string, registering it if there is room"""
+    shared = _shared_values.get(value)
+    if shared is not None:
+        return shared
+    if len(_shared_values) < MAX_SHARED_VALUES:
+        _shared_values[value] = value
+    return value
+
+
+class ClientSession:
+    """A connected client: its socket, send queue and connect-time metadata"""
+
+    __slots__ = (
+        "client_id", "websocket", "outbound", "timezone", "language",
+        "user_agent", "accept_language", "origin", "protocol", "echo", "connected_at",
+        "last_active", "conversation_id", "tenant",
+    )
+
+    def __init__(
+        self,
+        client_id: str,
+        websocket: WebSocket,
+        outbound: OutboundQueue,
+        timezone: str = "UTC",
+        language: str = "en",
+        user_agent: str = "",
+        accept_language: str = "",
+        origin: str = "",
+        protocol: str = "json",
+        echo: bool = True,
+        tenant: str = "default",
+    ):
+        self.client_id = client_id
+        self.websocket = websocket
+        self.outbound = outbound
+        self.timezone = share(timezone)
+        self.language = share(language)
+        self.user_agent = share(user_agent)
+        self.accept_language = share(accept_language)
+        self.origin = share(origin)
+        self.protocol = protocol
+        self.echo = echo
+        self.tenant = tenant
+        self.connected_at = time.time()
+        self.last_active = time.monotonic()
+        # Conversation the client last used; a fresh server-issued one until it resumes another
+        self.conversation_id = issue_session_id()
+
+    def metadata(self) -> dict:
+        """Metadata as a plain dict, e.g. for tool context"""
+        return {
+            'user_agent': self.user_agent,
+            'accept_language': self.accept_language,
+            'origin': self.origin,
+            'timezone': self.timezone,
+            'language': self.language,
+            'protocol': self.protocol,
+            'echo': self.echo,
+            'tenant': self.tenant,
+        }
+
+
+def shared_value_count() -> int:
+    """Number of distinct shared metadata strings"""
+    return len(_shared_values)
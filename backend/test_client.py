@@ -56,8 +56,7 @@ async def test_chat_client():
                         # Send message to server
                         message_data = {
                             "message": user_input,
-                            "user_id": "test_user_123",
-                            "session_id": "test_session"
+                            "user_id": "test_user_123"
                         }
                         
                         await websocket.send(json.dumps(message_data))
@@ -58,8 +58,7 @@ async def test_codespace_chat():
                         # Send message to server
                         message_data = {
                             "message": user_input,
-                            "user_id": "codespace_test_user",
-                            "session_id": "codespace_session"
+                            "user_id": "codespace_test_user"
                         }
                         
                         await websocket.send(json.dumps(message_data))
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from services.admission_service import AdmissionController, AdmissionRejected
+from services.deadline import DeadlineExceeded, turn_deadline
+
+
+def full_controller(queue_timeout: float) -> AdmissionController:
+    controller = AdmissionController(max_in_flight=1, max_queue=4, queue_timeout=queue_timeout, rate_per_second=0)
+    controller.in_flight = 1
+    return controller
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout_is_reported_as_overload():
+    controller = full_controller(queue_timeout=0.05)
+    with pytest.raises(AdmissionRejected) as rejected:
+        await controller.acquire()
+    assert rejected.value.code == "overloaded"
+    assert controller.get_stats()['queue_timeouts'] == 1
+    assert controller.get_stats()['rejected_overloaded'] == 1
+
+
+@pytest.mark.asyncio
+async def test_turn_deadline_cutting_the_wait_short_is_not_overload():
+    controller = full_controller(queue_timeout=5)
+    with turn_deadline(0.05):
+        with pytest.raises(DeadlineExceeded) as exceeded:
+            await controller.acquire()
+    assert exceeded.value.code == "timeout"
+    stats = controller.get_stats()
+    assert stats['queue_timeouts'] == 0
+    assert stats['rejected_overloaded'] == 0
+    assert stats['deadline_exceeded'] == 1
+    assert stats['waiting'] == 0
+
+
+@pytest.mark.asyncio
+async def test_released_slot_goes_to_the_waiter():
+    controller = full_controller(queue_timeout=5)
+    waiting = asyncio.ensure_future(controller.acquire())
+    await asyncio.sleep(0)
+    controller.release()
+    await asyncio.wait_for(waiting, 1)
+    assert controller.in_flight == 1
+    assert controller.get_stats()['admitted'] == 1
+
+
+@pytest.mark.asyncio
+async def test_waiters_hear_their_new_position_as_the_queue_moves():
+    controller = AdmissionController(max_in_flight=1, max_queue=4, queue_timeout=5, rate_per_second=0,
+                                     position_interval=0.01)
+    controller.in_flight = 1
+    positions = {name: [] for name in "abc"}
+
+    def reporter(name):
+        async def on_queued(position: int):
+            positions[name].append(position)
+        return on_queued
+
+    waiting = {}
+    for name in "abc":
+        waiting[name] = asyncio.ensure_future(controller.acquire(reporter(name)))
+        await asyncio.sleep(0)
+
+    controller.release()  # a is admitted
+    await asyncio.wait_for(waiting["a"], 1)
+    waiting["b"].cancel()  # b gives up, so c moves to the front
+    await asyncio.sleep(0.05)
+
+    assert positions == {"a": [1], "b": [2], "c": [3, 1]}
+    controller.release()
+    await asyncio.wait_for(waiting["c"], 1)
+    assert controller._positions == {}
@@ -0,0 +1,37 @@
+import asyncio
+import json
+
+import pytest
+
+from services.websocket.bus_broker import BusBroker, encode_frame, open_bus_connection
+
+
+async def hello(url: str, token):
+    reader, writer = await open_bus_connection(url)
+    writer.write(encode_frame({"op": "hello", "worker": "w1", "token": token}))
+    writer.write(encode_frame({"op": "stats", "id": 1}))
+    await writer.drain()
+    line = await asyncio.wait_for(reader.readline(), timeout=1.0)
+    writer.close()
+    return json.loads(line) if line else None
+
+
+@pytest.mark.asyncio
+async def test_workers_need_the_shared_token(tmp_path):
+    url = f"unix://{tmp_path}/bus.sock"
+    broker = BusBroker(url, token="secret")
+    await broker.start()
+    try:
+        assert await hello(url, "wrong") is None
+        assert await hello(url, None) is None
+        reply = await hello(url, "secret")
+        assert reply["stats"]["workers"] == 1
+        assert reply["stats"]["rejected_workers"] == 2
+    finally:
+        await broker.close()
+
+
+@pytest.mark.asyncio
+async def test_tcp_broker_refuses_to_start_without_a_token():
+    with pytest.raises(ValueError):
+        await BusBroker("tcp://127.0.0.1:0").start()
@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+import pytest
+
+from services import cache_service
+from services.cache_service import ResponseCache
+
+SAMPLING = {"temperature": 0.2}
+
+
+@pytest.fixture
+def clock(monkeypatch) -> SimpleNamespace:
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(cache_service, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def key(cache: ResponseCache, message: str, **overrides) -> str:
+    parts = {"window": [], "system_prompt": "Be helpful", "model": "m", "sampling": SAMPLING, **overrides}
+    return cache.make_key(message, **parts)
+
+
+@pytest.mark.parametrize("variant", ["what's the time?", "  What's   the TIME ", "What's the time!?", "what's\tthe\ntime."])
+def test_trivial_variations_share_a_key(variant):
+    cache = ResponseCache(max_entries=4, ttl_seconds=60, enabled=True)
+    assert key(cache, variant) == key(cache, "What's the time")
+
+
+@pytest.mark.parametrize("overrides", [
+    {"window": [{"role": "user", "text": "hi"}]},
+    {"system_prompt": "Be terse"},
+    {"model": "other"},
+    {"sampling": {"temperature": 0.9}},
+    {"tools": ("get_time",)},
+])
+def test_anything_shaping_the_completion_changes_the_key(overrides):
+    cache = ResponseCache(max_entries=4, ttl_seconds=60, enabled=True)
+    assert key(cache, "hello", **overrides) != key(cache, "hello")
+
+
+def test_different_messages_do_not_collide():
+    cache = ResponseCache(max_entries=4, ttl_seconds=60, enabled=True)
+    assert key(cache, "what time is it") != key(cache, "what day is it")
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = ResponseCache(max_entries=4, ttl_seconds=10, enabled=True)
+    cache.set("a", "reply")
+    clock.now += 9.9
+    assert cache.get("a") == "reply"
+    clock.now += 0.1
+    assert cache.get("a") is None
+    assert cache.get_stats()['entries'] == 0
+    assert cache.get_stats()['hits'] == 1
+    assert cache.get_stats()['misses'] == 1
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = ResponseCache(max_entries=2, ttl_seconds=60, enabled=True)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"  # b is now the least recently used
+    cache.set("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ResponseCache(max_entries=2, ttl_seconds=60, enabled=False)
+    cache.set("a", "1")
+    assert cache.get("a") is None
+    assert cache.get_stats()['entries'] == 0
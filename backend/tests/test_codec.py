@@ -0,0 +1,71 @@
+from datetime import datetime
+
+import pytest
+
+from services.websocket import codec
+from services.websocket.codec import CODECS, CompactCodec, Codec, compact_frame, negotiate
+
+TIMESTAMP = "2024-05-01T12:30:00.250000"
+EPOCH_MS = int(datetime.fromisoformat(TIMESTAMP).timestamp() * 1000)
+
+DONE = {"type": "assistant_done", "message": "Hello", "timestamp": TIMESTAMP, "sender": "assistant"}
+DELTA = {"type": "assistant_delta", "message": "Hel", "timestamp": TIMESTAMP, "sender": "assistant"}
+ERROR = {"type": "error", "message": "Busy", "code": "overloaded", "retry_after": 2.5, "timestamp": TIMESTAMP}
+
+
+def test_compact_frame_uses_short_keys_and_type_codes():
+    assert compact_frame(DONE) == {"t": "f", "m": "Hello", "ts": EPOCH_MS}
+    assert compact_frame(ERROR) == {"t": "e", "m": "Busy", "c": "overloaded", "r": 2.5, "ts": EPOCH_MS}
+
+
+def test_compact_frame_drops_delta_timestamps_and_keeps_unknown_fields():
+    assert compact_frame(DELTA) == {"t": "d", "m": "Hel"}
+    assert compact_frame({"type": "custom", "extra": 1}) == {"t": "custom", "extra": 1}
+
+
+@pytest.mark.parametrize("frame", [DONE, DELTA, ERROR])
+def test_compact_codec_round_trip(frame):
+    encoded = CompactCodec().encode(frame)
+    assert isinstance(encoded, str)
+    assert CompactCodec().decode(encoded) == compact_frame(frame)
+
+
+@pytest.mark.parametrize("frame", [DONE, DELTA, ERROR])
+def test_json_codec_round_trip(frame):
+    assert Codec().decode(Codec().encode(frame)) == frame
+
+
+@pytest.mark.parametrize("frame", [DONE, DELTA, ERROR])
+def test_msgpack_codec_round_trip(frame):
+    pytest.importorskip("msgpack")
+    msgpack_codec = codec.MsgpackCodec()
+    encoded = msgpack_codec.encode(frame)
+    assert isinstance(encoded, bytes)
+    assert len(encoded) < len(CompactCodec().encode(frame))
+    assert msgpack_codec.decode(encoded) == compact_frame(frame)
+
+
+def test_msgpack_codec_accepts_json_text_from_clients():
+    pytest.importorskip("msgpack")
+    assert codec.MsgpackCodec().decode('{"type": "ping"}') == {"type": "ping"}
+
+
+def test_negotiate_prefers_the_query_parameter(monkeypatch):
+    monkeypatch.setattr(codec.app_config, "ws_default_protocol", "json")
+    chosen, subprotocol = negotiate("compact", ["chat.json"])
+    assert chosen.name == "compact"
+    assert subprotocol is None
+
+
+def test_negotiate_picks_the_first_supported_subprotocol(monkeypatch):
+    monkeypatch.setattr(codec.app_config, "ws_default_protocol", "json")
+    chosen, subprotocol = negotiate(None, ["chat.unknown", "chat.compact", "chat.json"])
+    assert chosen is CODECS["compact"]
+    assert subprotocol == "chat.compact"
+
+
+def test_negotiate_falls_back_to_the_default(monkeypatch):
+    monkeypatch.setattr(codec.app_config, "ws_default_protocol", "json")
+    chosen, subprotocol = negotiate("unknown", [])
+    assert chosen.name == "json"
+    assert subprotocol is None
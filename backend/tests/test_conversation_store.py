@@ -0,0 +1,79 @@
+import pytest
+
+from services.conversation import ConversationWindow
+from services.conversation.store import InMemoryConversationStore
+
+
+def make_store(max_sessions: int = 3) -> InMemoryConversationStore:
+    return InMemoryConversationStore(lambda: ConversationWindow(token_budget=100, max_messages=6), max_sessions)
+
+
+def counted(store: InMemoryConversationStore) -> int:
+    return sum(len(window) for window in store._sessions.values())
+
+
+def test_reserving_tokens_leaves_the_window_intact():
+    window = ConversationWindow(token_budget=100)
+    for i in range(5):
+        window.append("user", f"question {i}")
+        window.append("assistant", f"answer {i}")
+    size = len(window)
+
+    assert window.messages(reserve_tokens=90) != window.messages()
+    assert len(window.messages(reserve_tokens=1000)) == 0
+    assert len(window) == size
+    assert len(window.messages()) == size
+
+
+@pytest.mark.asyncio
+async def test_message_count_matches_windows_after_trims_evictions_and_deletes():
+    store = make_store()
+    for turn in range(5):
+        await store.append_turn("a", f"question {turn} " + "x" * 80, f"answer {turn}")
+        window = await store.load("a")
+        window.messages(reserve_tokens=90)
+        assert store.total_messages == counted(store)
+
+    for session in ("b", "c", "d", "e"):
+        await store.append_turn(session, "hello", "hi")
+        assert store.total_messages == counted(store)
+    assert store.evictions == 2
+
+    for session in ("c", "d", "e", "missing"):
+        await store.delete(session)
+    assert store.total_messages == counted(store) == 0
+    assert store.get_stats()['active_conversations'] == 0
+
+
+def roles(messages) -> list:
+    return [message.role.value for message in messages]
+
+
+def test_windows_never_start_with_a_reply_whose_prompt_was_trimmed():
+    window = ConversationWindow(token_budget=1000, max_messages=5)
+    for i in range(4):
+        window.append("user", f"question {i}")
+        window.append("assistant", f"answer {i}")
+    assert roles(window.messages())[0] == "user"
+    assert len(window) == 4
+
+    # Budget trimming can cut inside a turn too
+    window = ConversationWindow(token_budget=40)
+    window.append("user", "q" * 40)
+    window.append("assistant", "a" * 100)
+    window.append("user", "short")
+    window.append("assistant", "ok")
+    assert roles(window.messages()) == ["user", "assistant"]
+
+
+def test_reserving_tokens_leaves_out_whole_turns():
+    window = ConversationWindow(token_budget=1000)
+    window.append("user", "q" * 40)
+    window.append("assistant", "a" * 400)
+    window.append("user", "q" * 40)
+    window.append("assistant", "a" * 40)
+
+    view = window.messages(reserve_tokens=1000 - 120)
+    assert roles(view) == ["user", "assistant"]
+    assert view[0].text == "q" * 40
+    assert len(window) == 4
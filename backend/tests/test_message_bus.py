@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+import pytest
+
+from services.websocket.message_bus import LocalMessageBus, SocketMessageBus
+
+
+async def ignore(*args):
+    pass
+
+
+@pytest.mark.asyncio
+async def test_local_bus_counts_the_live_view():
+    clients = {"a": 1, "b": 2}
+    bus = LocalMessageBus()
+    await bus.start(ignore, ignore, clients.keys)
+    clients["c"] = 3
+    assert (await bus.get_cluster_stats())['total_connections'] == 3
+
+
+@pytest.mark.asyncio
+async def test_socket_bus_serves_cluster_stats_from_the_background_refresh(tmp_path):
+    clients = {"a": 1}
+    bus = SocketMessageBus(url=f"unix://{tmp_path}/bus.sock", embed_broker=True, token="t", stats_interval=0.05)
+    await bus.start(ignore, ignore, clients.keys)
+    try:
+        bus.register("a")
+        for _ in range(100):
+            stats = await bus.get_cluster_stats()
+            if stats.get('total_connections') == 1 and 'stats_age_seconds' in stats:
+                break
+            await asyncio.sleep(0.02)
+        assert stats['workers'] == 1
+        assert stats['total_connections'] == 1
+        assert stats['connected']
+    finally:
+        await bus.close()
+
+
+@pytest.mark.asyncio
+async def test_socket_bus_stats_never_wait_for_an_unreachable_broker(tmp_path):
+    bus = SocketMessageBus(url=f"unix://{tmp_path}/missing.sock", embed_broker=False, reconnect_delay=10)
+    await bus.start(ignore, ignore, {"a": 1}.keys)
+    try:
+        started = time.perf_counter()
+        stats = await bus.get_cluster_stats()
+        assert time.perf_counter() - started < 0.1
+        assert stats == {
+            'backend': 'socket', 'worker_id': bus.worker_id, 'connected': False, 'workers': 1, 'total_connections': 1,
+        }
+    finally:
+        await bus.close()
@@ -0,0 +1,112 @@
+from types import SimpleNamespace
+
+import pytest
+
+from services import resilience
+from services.resilience import CircuitBreaker, RetryBudget, backoff_delay
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(resilience, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def fail(breaker: CircuitBreaker):
+    breaker.release(breaker.acquire(), success=False)
+
+
+def test_circuit_opens_probes_and_closes(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, open_seconds=10, half_open_probes=1)
+
+    fail(breaker)
+    fail(breaker)
+    assert breaker.state == CircuitBreaker.CLOSED
+    fail(breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.acquire() is None
+    assert breaker.retry_after() == 10
+
+    clock.now += 10
+    ticket = breaker.acquire()
+    assert ticket == CircuitBreaker.HALF_OPEN
+    assert breaker.acquire() is None  # Only one probe at a time
+
+    breaker.release(ticket, success=True)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.acquire() == CircuitBreaker.CLOSED
+    assert breaker.get_stats() == {'state': 'closed', 'consecutive_failures': 0, 'opens': 1, 'rejected': 2}
+
+
+def test_failed_probe_reopens_the_circuit(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, open_seconds=5, half_open_probes=1)
+    fail(breaker)
+    clock.now += 5
+    assert breaker.available()
+
+    fail(breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.get_stats()['opens'] == 2
+    assert not breaker.available()
+
+
+def test_abandoned_probe_frees_its_slot_without_a_verdict(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, open_seconds=5, half_open_probes=1)
+    fail(breaker)
+    clock.now += 5
+
+    breaker.release(breaker.acquire(), success=None)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.acquire() == CircuitBreaker.HALF_OPEN
+
+
+def test_success_resets_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, open_seconds=5)
+    fail(breaker)
+    breaker.release(breaker.acquire(), success=True)
+    fail(breaker)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_retry_budget_runs_out_and_refills(clock):
+    budget = RetryBudget(ratio=0.5, min_per_second=1, capacity=2)
+
+    assert budget.try_spend()
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    assert budget.get_stats() == {'tokens': 0, 'retries': 2, 'exhausted': 1}
+
+    budget.record_request()
+    budget.record_request()
+    assert budget.try_spend()
+
+    clock.now += 1
+    assert budget.try_spend()
+    assert not budget.try_spend()
+
+
+def test_retry_budget_never_exceeds_capacity(clock):
+    budget = RetryBudget(ratio=1, min_per_second=1, capacity=3)
+    for _ in range(10):
+        budget.record_request()
+    clock.now += 60
+    assert budget.get_stats()['tokens'] == 3
+
+
+def test_backoff_delay_grows_and_is_capped():
+    for attempt in range(1, 8):
+        for _ in range(50):
+            assert 0 <= backoff_delay(attempt, base=0.1, cap=1.0) <= min(1.0, 0.1 * 2 ** (attempt - 1))
+
+
+def test_backoff_delay_is_jittered():
+    assert len({backoff_delay(3, base=0.1, cap=1.0) for _ in range(20)}) > 1
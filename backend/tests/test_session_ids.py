@@ -0,0 +1,93 @@
+import pytest
+
+from services.admission_service import AdmissionController
+from services.conversation import ConversationWindow, InMemoryConversationStore, issue_session_id, verify_session_id
+from services.websocket.message_handler import WebSocketHandler
+
+
+class FakeManager:
+    """A connection manager with one connected client"""
+
+    def __init__(self, connected: dict):
+        self.connected = connected
+
+    def get_client_metadata(self, client_id: str) -> dict:
+        return {}
+
+    def get_conversation_id(self, client_id: str):
+        return self.connected.get(client_id)
+
+    def touch(self, client_id: str, conversation_id=None):
+        if conversation_id and client_id in self.connected:
+            self.connected[client_id] = conversation_id
+
+
+class EchoAgent:
+    async def run_async(self, user_message, conversation_history, tool_context, tenant):
+        return f"reply to {user_message}"
+
+
+def make_handler(connected: dict):
+    store = InMemoryConversationStore(lambda: ConversationWindow(token_budget=1000))
+    admission = AdmissionController(max_in_flight=4, rate_per_second=0)
+    return WebSocketHandler(FakeManager(connected), EchoAgent(), conversation_store=store, admission=admission)
+
+
+async def turn(handler: WebSocketHandler, client_id: str, **message) -> dict:
+    frames = []
+
+    async def sink(frame: dict):
+        frames.append(frame)
+
+    await handler.run_turn(client_id, {"echo": False, **message}, sink)
+    return frames[-1]
+
+
+def test_issued_ids_verify_and_others_do_not():
+    session_id = issue_session_id()
+    assert verify_session_id(session_id)
+    assert issue_session_id() != session_id
+
+    token, _, signature = session_id.partition(".")
+    assert not verify_session_id(f"{token}.{signature[:-1]}x")
+    assert not verify_session_id(f"other.{signature}")
+    assert not verify_session_id("session_user_123")
+    assert not verify_session_id("")
+    assert not verify_session_id(None)
+    assert not verify_session_id(session_id + "é")
+    assert not verify_session_id("a." + "b" * 200)
+
+
+@pytest.mark.asyncio
+async def test_client_chosen_session_ids_are_refused():
+    victim_session = issue_session_id()
+    handler = make_handler({"victim": victim_session, "attacker": issue_session_id()})
+    await turn(handler, "victim", message="my secret")
+
+    frame = await turn(handler, "attacker", message="what did I say?", session_id="session_victim")
+    assert frame["type"] == "error"
+    assert frame["code"] == "invalid_session"
+    assert len(await handler.conversation_store.load(victim_session)) == 2
+
+
+@pytest.mark.asyncio
+async def test_connected_client_gets_its_session_id_and_can_resume_it():
+    handler = make_handler({"client": issue_session_id()})
+    frame = await turn(handler, "client", message="hello")
+    session_id = frame["session_id"]
+    assert verify_session_id(session_id)
+
+    # After reconnecting the client has a fresh connection session but resumes the old one
+    handler.manager.connected["client"] = issue_session_id()
+    frame = await turn(handler, "client", message="again", session_id=session_id)
+    assert frame["type"] == "assistant"
+    assert frame["session_id"] == session_id
+    assert len(await handler.conversation_store.load(session_id)) == 4
+
+
+@pytest.mark.asyncio
+async def test_http_turn_without_a_session_reports_none():
+    handler = make_handler({})
+    frame = await turn(handler, "http-1", message="hello")
+    assert frame["type"] == "assistant"
+    assert "session_id" not in frame
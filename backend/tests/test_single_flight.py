@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from services import deadline
+from services.single_flight import Flight, SingleFlight
+
+
+async def collect(single_flight: SingleFlight, key: str, call) -> list:
+    return [event async for event in single_flight.stream(key, call)]
+
+
+@pytest.mark.asyncio
+async def test_identical_turns_share_one_call():
+    single_flight = SingleFlight(enabled=True)
+    calls = 0
+    release = asyncio.Event()
+
+    async def call(flight: Flight) -> str:
+        nonlocal calls
+        calls += 1
+        flight.publish("Hel")
+        await release.wait()
+        flight.publish("lo")
+        return "Hello"
+
+    waiters = [asyncio.ensure_future(collect(single_flight, "key", call)) for _ in range(5)]
+    await asyncio.sleep(0.01)
+    release.set()
+    results = await asyncio.gather(*waiters)
+
+    assert calls == 1
+    assert all(events == [("delta", "Hel"), ("delta", "lo"), ("done", "Hello")] for events in results)
+    assert single_flight.get_stats()['coalesced_turns'] == 4
+    assert single_flight.get_stats()['in_flight'] == 0
+
+
+@pytest.mark.asyncio
+async def test_last_waiter_leaving_cancels_the_call():
+    single_flight = SingleFlight(enabled=True)
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def call(flight: Flight) -> str:
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return "never"
+
+    waiters = [asyncio.ensure_future(collect(single_flight, "key", call)) for _ in range(3)]
+    await started.wait()
+    waiters[0].cancel()
+    waiters[1].cancel()
+    await asyncio.sleep(0.01)
+    assert not cancelled.is_set()
+
+    waiters[2].cancel()
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert single_flight.get_stats()['abandoned_calls'] == 1
+    assert single_flight.get_stats()['in_flight'] == 0
+
+
+@pytest.mark.asyncio
+async def test_call_does_not_inherit_the_first_callers_deadline():
+    single_flight = SingleFlight(enabled=True)
+    seen = []
+
+    async def call(flight: Flight) -> str:
+        seen.append(deadline.remaining())
+        return "ok"
+
+    with deadline.turn_deadline(0.5):
+        await collect(single_flight, "key", call)
+
+    assert seen[0] is None or seen[0] > 0.5
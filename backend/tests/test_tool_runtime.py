@@ -0,0 +1,52 @@
+import time
+
+from haystack.components.agents.state import State
+from haystack.components.tools import ToolInvoker
+from haystack.dataclasses import ChatMessage, ToolCall
+from haystack.tools import Tool
+
+from services.deadline import turn_deadline, current
+from services.tool_runtime import ToolPolicy, ToolRuntime
+from services.tools_service import ToolContext, ToolsService
+
+
+def slow_lookup(query: str) -> str:
+    time.sleep(1)
+    return f"found {query}"
+
+
+def invoke(runtime: ToolRuntime, tool_context: ToolContext) -> ChatMessage:
+    tool = runtime.wrap(
+        Tool(name="slow_lookup", description="Slow lookup", function=slow_lookup,
+             parameters={"type": "object", "properties": {"query": {"type": "string"}}}),
+        ToolPolicy(timeout=10),
+    )
+    # As in the agent, failures reach the model as error results
+    invoker = ToolInvoker(tools=[tool], raise_on_failure=False)
+    state = State(ToolsService.state_schema, {"tool_context": tool_context})
+    call = ToolCall(tool_name="slow_lookup", arguments={"query": "x"})
+    result = invoker.run(messages=[ChatMessage.from_assistant(tool_calls=[call])], state=state)
+    return result["tool_messages"][0]
+
+
+def test_slow_tool_stops_at_the_turn_deadline():
+    runtime = ToolRuntime()
+    started = time.monotonic()
+    with turn_deadline(0.3):
+        # The invoker runs the tool on its own thread, which only sees the deadline through the context
+        message = invoke(runtime, ToolContext(deadline=current()))
+    elapsed = time.monotonic() - started
+
+    assert message.tool_call_result.error
+    assert elapsed < 0.9
+    assert runtime.get_stats()["slow_lookup"]["timeouts"] == 1
+    runtime.close()
+
+
+def test_tool_without_deadline_keeps_its_own_timeout():
+    runtime = ToolRuntime()
+    message = invoke(runtime, ToolContext())
+
+    assert not message.tool_call_result.error
+    assert message.tool_call_result.result == "found x"
+    runtime.close()
@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+from services import deadline
+from services.deadline import turn_deadline
+from services.resilience import CircuitBreaker, RetryBudget, UpstreamUnavailable
+from services.upstream_router import Upstream, UpstreamRouter
+
+from haystack.dataclasses import ChatMessage
+
+
+def dead_upstream(name: str) -> Upstream:
+    # Nothing listens on port 1, so every request fails at connect
+    return Upstream(name, "http://127.0.0.1:1/v1", "mock-model", "key",
+                    breaker=CircuitBreaker(name, failure_threshold=100, open_seconds=1))
+
+
+def test_hedged_attempts_see_the_turn_deadline(monkeypatch):
+    seen = []
+    with_deadline = UpstreamRouter._with_deadline
+
+    def spy(kwargs):
+        seen.append(deadline.current())
+        return with_deadline(kwargs)
+
+    monkeypatch.setattr(UpstreamRouter, "_with_deadline", staticmethod(spy))
+    router = UpstreamRouter([dead_upstream("a"), dead_upstream("b")], hedge_after_ms=50, max_retries=1,
+                            retry_budget=RetryBudget(ratio=1, min_per_second=1))
+
+    with turn_deadline(5) as turn:
+        with pytest.raises(UpstreamUnavailable):
+            router.run(messages=[ChatMessage.from_user("hi")])
+
+    assert seen and all(when == turn for when in seen)
+
+
+def test_attempts_stop_at_the_turn_deadline():
+    router = UpstreamRouter([dead_upstream("a")], max_retries=50, retry_budget=RetryBudget(ratio=1))
+    started = time.monotonic()
+    with turn_deadline(0.5):
+        with pytest.raises(UpstreamUnavailable):
+            router.run(messages=[ChatMessage.from_user("hi")])
+    assert time.monotonic() - started < 1.5
+
+
+def test_derived_routers_share_one_hedge_pool():
+    router = UpstreamRouter([dead_upstream("a"), dead_upstream("b")], hedge_after_ms=50)
+    derived = [router.derive(f"model-{index}", {"temperature": index / 10}) for index in range(5)]
+
+    assert all(child._hedge_executor is router._hedge_executor for child in derived)
+    router.close()
+    assert router._hedge_executor._shutdown
@@ -5,6 +5,55 @@ const WS_BASE_URL = import.meta.env.PROD
   ? 'wss://abubasith86-chat-agent-plugin.hf.space/ws/' 
   : 'ws://localhost:8000/ws/';
 
+// Compact frames (short keys, no echo of our own messages); see backend codec.py
+const WS_QUERY = '?protocol=compact&echo=0';
+
+const COMPACT_KEYS: Record<string, string> = {
+  t: 'type', m: 'message', ts: 'timestamp', p: 'position', c: 'code', r: 'retry_after'
+};
+const COMPACT_TYPES: Record<string, string> = {
+  u: 'user', ty: 'typing', q: 'queued', a: 'assistant', d: 'assistant_delta',
+  f: 'assistant_done', x: 'cancelled', e: 'error', po: 'pong'
+};
+
+interface WireFrame {
+  type: string;
+  message: string;
+  timestamp?: string | number;
+  position?: number;
+  code?: string;
+  retry_after?: number;
+  session_id?: string;
+}
+
+// Close codes from the server: 4000 idle (reconnect on the next message), 1012 restarting
+const IDLE_CLOSE_CODE = 4000;
+const RESTART_CLOSE_CODE = 1012;
+
+// Reconnect delay in ms: the server's retry_after hint, else a jittered default
+const reconnectDelay = (event: CloseEvent) => {
+  const hint = /retry_after=([\d.]+)/.exec(event.reason || '');
+  if (hint) {
+    return parseFloat(hint[1]) * 1000;
+  }
+  const base = event.code === RESTART_CLOSE_CODE ? 1000 : 3000;
+  return base + Math.random() * 5000;
+};
+
+// Expand a compact frame to the standard shape; standard frames pass through
+const decodeFrame = (raw: string): WireFrame => {
+  const frame = JSON.parse(raw);
+  if (frame.type !== undefined) {
+    return frame as WireFrame;
+  }
+  const expanded: Record<string, unknown> = {};
+  for (const key of Object.keys(frame)) {
+    expanded[COMPACT_KEYS[key] ?? key] = frame[key];
+  }
+  expanded.type = COMPACT_TYPES[frame.t] ?? frame.t;
+  return expanded as unknown as WireFrame;
+};
+
 // Configuration interface
 export interface ChatWidgetConfig {
   // Position
@@ -41,6 +90,7 @@ export interface ChatWidgetConfig {
   // Behavior
   defaultOpen?: boolean;
   useWebSocket?: boolean; // New option to enable WebSocket
+  tenant?: string; // Server-side tenant (prompt, tools, model) to chat with
 }
 
 interface Message {
@@ -111,7 +161,13 @@ const ChatWidget: React.FC<ChatWidgetProps> = ({ config = {} }) => {
   // Refs
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const wsRef = useRef<WebSocket | null>(null);
+  const streamingIdRef = useRef<number | null>(null);
+  // Set while the socket is closed for idleness; the next message reconnects and is sent on open
+  const reconnectRef = useRef<(() => void) | null>(null);
+  const pendingMessageRef = useRef<string | null>(null);
   const clientId = useRef(`user_${Date.now()}_${Math.random().toString(36).substr(2, 9)}`);
+  // Conversation id issued by the server in its replies; sent back to resume after reconnecting
+  const sessionIdRef = useRef<string | undefined>(undefined);
 
   // Cleanup function
   const cleanup = useCallback(() => {
@@ -128,6 +184,7 @@ const ChatWidget: React.FC<ChatWidgetProps> = ({ config = {} }) => {
     setMessages([welcomeMessage]);
     
     // Reset states
+    streamingIdRef.current = null;
     setIsTyping(false);
     setIsConnected(false);
     
@@ -155,7 +212,8 @@ const ChatWidget: React.FC<ChatWidgetProps> = ({ config = {} }) => {
         }
         
         try {
-          const wsUrl = `${WS_BASE_URL}${clientId.current}`;
+          const tenantQuery = finalConfig.tenant ? `&tenant=${encodeURIComponent(finalConfig.tenant)}` : '';
+          const wsUrl = `${WS_BASE_URL}${clientId.current}${WS_QUERY}${tenantQuery}`;
           console.log('Connecting to:', wsUrl);
           
           wsRef.current = new WebSocket(wsUrl);
@@ -163,26 +221,85 @@ const ChatWidget: React.FC<ChatWidgetProps> = ({ config = {} }) => {
           wsRef.current.onopen = () => {
             console.log('WebSocket connected');
             setIsConnected(true);
+            reconnectRef.current = null;
+            if (pendingMessageRef.current !== null) {
+              wsRef.current?.send(pendingMessageRef.current);
+              pendingMessageRef.current = null;
+            }
           };
           
           wsRef.current.onmessage = (event) => {
             try {
-              const data = JSON.parse(event.data);
+              const data = decodeFrame(event.data);
               console.log('Received message:', data);
               
               // Handle different message types
-              if (data.type === 'typing') {
+              if (data.type === 'pong') {
+                // Heartbeat reply; nothing to show
+                return;
+              }
+              
+              if (data.type === 'typing' || data.type === 'queued') {
                 setIsTyping(true);
                 return;
               }
               
+              if (data.type === 'error') {
+                // Rate limited, overloaded or failed turns
+                setIsTyping(false);
+                if (data.code === 'invalid_session') {
+                  // The server no longer knows our conversation; the next message starts a new one
+                  sessionIdRef.current = undefined;
+                }
+                streamingIdRef.current = null;
+                setMessages(prev => [...prev, {
+                  id: Date.now(),
+                  text: data.message,
+                  sender: 'bot',
+                  timestamp: new Date(data.timestamp || Date.now()),
+                  type: 'error'
+                }]);
+                return;
+              }
+              
               if (data.type === 'user') {
                 // Skip echoed user messages as we already added them locally
                 return;
               }
               
-              if (data.type === 'assistant' || data.type === 'system') {
+              if (data.type === 'cancelled') {
+                // Keep whatever was streamed so far and stop waiting for the rest
+                setIsTyping(false);
+                streamingIdRef.current = null;
+                return;
+              }
+              
+              if (data.type === 'assistant_delta') {
                 setIsTyping(false);
+                const streamingId = streamingIdRef.current;
+                if (streamingId === null) {
+                  const id = Date.now();
+                  streamingIdRef.current = id;
+                  setMessages(prev => [...prev, {
+                    id,
+                    text: data.message,
+                    sender: 'bot',
+                    timestamp: new Date(data.timestamp || Date.now()),
+                    type: 'message'
+                  }]);
+                } else {
+                  setMessages(prev => prev.map(msg =>
+                    msg.id === streamingId ? { ...msg, text: msg.text + data.message } : msg
+                  ));
+                }
+                return;
+              }
+              
+              if (data.type === 'assistant' || data.type === 'assistant_done' || data.type === 'system') {
+                setIsTyping(false);
+                if (data.session_id) {
+                  sessionIdRef.current = data.session_id;
+                }
                 // Clean markdown formatting from AI response
                 const cleanMessage = data.message
                   .replace(/\*\*(.*?)\*\*/g, '$1') // Remove **bold**
@@ -191,6 +308,16 @@ const ChatWidget: React.FC<ChatWidgetProps> = ({ config = {} }) => {
                   .replace(/#{1,6}\s/g, '')        // Remove headers
                   .trim();
                 
+                // A streamed turn ends by replacing the partial text with the full response
+                const streamingId = streamingIdRef.current;
+                streamingIdRef.current = null;
+                if (data.type === 'assistant_done' && streamingId !== null) {
+                  setMessages(prev => prev.map(msg =>
+                    msg.id === streamingId ? { ...msg, text: cleanMessage } : msg
+                  ));
+                  return;
+                }
+                
                 const newMessage: Message = {
                   id: Date.now(),
                   text: cleanMessage,
@@ -206,12 +333,17 @@ const ChatWidget: React.FC<ChatWidgetProps> = ({ config = {} }) => {
             }
           };
           
-          wsRef.current.onclose = () => {
-            console.log('WebSocket disconnected');
+          wsRef.current.onclose = (event) => {
+            console.log('WebSocket disconnected', event.code, event.reason);
             setIsConnected(false);
+            if (event.code === IDLE_CLOSE_CODE) {
+              // Closed for idleness: stay closed until the user sends something
+              reconnectRef.current = connectWebSocket;
+              return;
+            }
             // Only attempt to reconnect if the widget is still open
             if (isOpen) {
-              setTimeout(connectWebSocket, 3000);
+              setTimeout(connectWebSocket, reconnectDelay(event));
             }
           };
           
@@ -287,14 +419,26 @@ const ChatWidget: React.FC<ChatWidgetProps> = ({ config = {} }) => {
       // Show typing indicator immediately after sending
       setIsTyping(true);
       
-      // Send via WebSocket if connected
-      if (finalConfig.useWebSocket && wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
+      const reconnect = reconnectRef.current;
+      if (finalConfig.useWebSocket && reconnect) {
+        // The server closed an idle connection; reopen it and send once connected
+        pendingMessageRef.current = JSON.stringify({
+          message: inputValue,
+          user_id: clientId.current,
+          session_id: sessionIdRef.current,
+          timezone: Intl.DateTimeFormat().resolvedOptions().timeZone,
+          stream: true
+        });
+        reconnect();
+      } else if (finalConfig.useWebSocket && wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
+        // Send via WebSocket if connected
         try {
           const wsMessage = {
             message: inputValue,
             user_id: clientId.current,
-            session_id: `session_${clientId.current}`,
-            timezone: Intl.DateTimeFormat().resolvedOptions().timeZone
+            session_id: sessionIdRef.current,
+            timezone: Intl.DateTimeFormat().resolvedOptions().timeZone,
+            stream: true
           };
           
           wsRef.current.send(JSON.stringify(wsMessage));
@@ -53,6 +53,8 @@
         wsUrl: window.location.hostname === 'localhost' || window.location.hostname === '127.0.0.1'
             ? 'ws://localhost:8000/ws/'
             : 'wss://abubasith86-chat-agent-plugin.hf.space/ws/',
+        // Server-side tenant (prompt, tools, model); empty uses the one for this origin
+        tenant: '',
         
         // Behavior
         defaultOpen: false
@@ -72,7 +74,10 @@
             this.ws = null;
             this.isConnected = false;
             this.isTyping = false;
+            this.streamingMessage = null;
             this.clientId = `user_${Date.now()}_${Math.random().toString(36).substr(2, 9)}`;
+            // Conversation id issued by the server in its replies; sent back to resume after reconnecting
+            this.sessionId = undefined;
             
             this.element = null;
             this.panel = null;
@@ -273,14 +278,25 @@
             // Show typing indicator immediately after sending
             this.showTypingIndicator();
 
-            // Send via WebSocket if connected
-            if (this.config.useWebSocket && this.ws && this.ws.readyState === WebSocket.OPEN) {
+            if (this.config.useWebSocket && this.idleClosed) {
+                // The server closed an idle connection; reopen it and send once connected
+                this.pendingMessage = JSON.stringify({
+                    message: text,
+                    user_id: this.clientId,
+                    session_id: this.sessionId,
+                    timezone: Intl.DateTimeFormat().resolvedOptions().timeZone,
+                    stream: true
+                });
+                this.initWebSocket();
+            } else if (this.config.useWebSocket && this.ws && this.ws.readyState === WebSocket.OPEN) {
+                // Send via WebSocket if connected
                 try {
                     const wsMessage = {
                         message: text,
                         user_id: this.clientId,
-                        session_id: `session_${this.clientId}`,
-                        timezone: Intl.DateTimeFormat().resolvedOptions().timeZone
+                        session_id: this.sessionId,
+                        timezone: Intl.DateTimeFormat().resolvedOptions().timeZone,
+                        stream: true
                     };
                     
                     this.ws.send(JSON.stringify(wsMessage));
@@ -323,6 +339,25 @@
         }
 
         // WebSocket methods
+        decodeFrame(raw) {
+            // Expand a compact frame (short keys, see backend codec.py); standard frames pass through
+            const frame = JSON.parse(raw);
+            if (frame.type !== undefined) {
+                return frame;
+            }
+            const keys = { t: 'type', m: 'message', ts: 'timestamp', p: 'position', c: 'code', r: 'retry_after' };
+            const types = {
+                u: 'user', ty: 'typing', q: 'queued', a: 'assistant', d: 'assistant_delta',
+                f: 'assistant_done', x: 'cancelled', e: 'error', po: 'pong'
+            };
+            const expanded = {};
+            Object.keys(frame).forEach((key) => {
+                expanded[keys[key] || key] = frame[key];
+            });
+            expanded.type = types[frame.t] || frame.t;
+            return expanded;
+        }
+
         initWebSocket() {
             if (!this.config.wsUrl) {
                 console.warn('WebSocket URL not provided');
@@ -337,7 +372,9 @@
             }
 
             try {
-                const wsUrl = `${this.config.wsUrl}${this.clientId}`;
+                // Compact frames, and no echo of messages we already render locally
+                const tenantQuery = this.config.tenant ? `&tenant=${encodeURIComponent(this.config.tenant)}` : '';
+                const wsUrl = `${this.config.wsUrl}${this.clientId}?protocol=compact&echo=0${tenantQuery}`;
                 console.log('Connecting to WebSocket:', wsUrl);
                 
                 this.ws = new WebSocket(wsUrl);
@@ -345,26 +382,69 @@
                 this.ws.onopen = () => {
                     console.log('WebSocket connected');
                     this.isConnected = true;
+                    this.idleClosed = false;
                     this.updateConnectionStatus();
+                    if (this.pendingMessage) {
+                        this.ws.send(this.pendingMessage);
+                        this.pendingMessage = null;
+                    }
                 };
                 
                 this.ws.onmessage = (event) => {
                     try {
-                        const data = JSON.parse(event.data);
+                        const data = this.decodeFrame(event.data);
                         console.log('Received WebSocket message:', data);
                         
-                        if (data.type === 'typing') {
+                        if (data.type === 'pong') {
+                            // Heartbeat reply; nothing to show
+                            return;
+                        }
+                        
+                        if (data.type === 'typing' || data.type === 'queued') {
                             this.showTypingIndicator();
                             return;
                         }
                         
+                        if (data.type === 'error') {
+                            // Rate limited, overloaded or failed turns
+                            this.streamingMessage = null;
+                            if (data.code === 'invalid_session') {
+                                // The server no longer knows our conversation; the next message starts a new one
+                                this.sessionId = undefined;
+                            }
+                            this.hideTypingIndicator();
+                            this.addMessage(data.message, 'bot', 'error');
+                            this.renderMessages();
+                            return;
+                        }
+                        
                         if (data.type === 'user') {
                             // Skip echoed user messages as we already added them locally
                             return;
                         }
                         
-                        if (data.type === 'assistant' || data.type === 'system') {
+                        if (data.type === 'cancelled') {
+                            // Keep whatever was streamed so far and stop waiting for the rest
+                            this.streamingMessage = null;
+                            this.hideTypingIndicator();
+                            return;
+                        }
+                        
+                        if (data.type === 'assistant_delta') {
+                            this.isTyping = false;
+                            if (!this.streamingMessage) {
+                                this.streamingMessage = this.addMessage('', 'bot');
+                            }
+                            this.streamingMessage.text += data.message;
+                            this.renderMessages();
+                            return;
+                        }
+                        
+                        if (data.type === 'assistant' || data.type === 'assistant_done' || data.type === 'system') {
                             this.hideTypingIndicator();
+                            if (data.session_id) {
+                                this.sessionId = data.session_id;
+                            }
                             // Clean markdown formatting from AI response
                             const cleanMessage = data.message
                                 .replace(/\*\*(.*?)\*\*/g, '$1') // Remove **bold**
@@ -372,7 +452,14 @@
                                 .replace(/`(.*?)`/g, '$1')       // Remove `code`
                                 .replace(/#{1,6}\s/g, '')        // Remove headers
                                 .trim();
-                            this.addMessage(cleanMessage, 'bot', data.type);
+                            
+                            // A streamed turn ends by replacing the partial text with the full response
+                            if (data.type === 'assistant_done' && this.streamingMessage) {
+                                this.streamingMessage.text = cleanMessage;
+                            } else {
+                                this.addMessage(cleanMessage, 'bot', data.type);
+                            }
+                            this.streamingMessage = null;
                             this.renderMessages();
                         }
                     } catch (error) {
@@ -380,13 +467,22 @@
                     }
                 };
                 
-                this.ws.onclose = () => {
-                    console.log('WebSocket disconnected');
+                this.ws.onclose = (event) => {
+                    console.log('WebSocket disconnected', event.code, event.reason);
                     this.isConnected = false;
                     this.updateConnectionStatus();
                     
-                    // Attempt to reconnect after 3 seconds
-                    setTimeout(() => this.initWebSocket(), 3000);
+                    if (event.code === 4000) {
+                        // Closed for idleness: reconnect when the user next sends a message
+                        this.idleClosed = true;
+                        return;
+                    }
+                    // Honour the server's retry_after hint (sent on restart), else a jittered delay
+                    const hint = /retry_after=([\d.]+)/.exec(event.reason || '');
+                    const delay = hint
+                        ? parseFloat(hint[1]) * 1000
+                        : (event.code === 1012 ? 1000 : 3000) + Math.random() * 5000;
+                    setTimeout(() => this.initWebSocket(), delay);
                 };
                 
                 this.ws.onerror = (error) => {
@@ -504,6 +600,7 @@
             
             // Reset states
             this.isTyping = false;
+            this.streamingMessage = null;
             this.isConnected = false;
             this.updateConnectionStatus();
             this.renderMessages();
@@ -44,10 +44,36 @@
         title: 'Chat Assistant',
         placeholder: 'Type your message...',
         
+        // Backend, e.g. 'wss://example.com/ws/'; empty shows sample responses instead
+        wsUrl: '',
+        // Server-side tenant (prompt, tools, model); empty uses the one for this origin
+        tenant: '',
+        
         // Behavior
         defaultOpen: false
     };
 
+    // Compact frames (short keys, see backend codec.py)
+    const COMPACT_KEYS = { t: 'type', m: 'message', ts: 'timestamp', p: 'position', c: 'code', r: 'retry_after' };
+    const COMPACT_TYPES = {
+        u: 'user', ty: 'typing', q: 'queued', a: 'assistant', d: 'assistant_delta',
+        f: 'assistant_done', x: 'cancelled', e: 'error', po: 'pong'
+    };
+
+    function decodeFrame(raw) {
+        // Expand a compact frame; standard frames pass through
+        const frame = JSON.parse(raw);
+        if (frame.type !== undefined) {
+            return frame;
+        }
+        const expanded = {};
+        Object.keys(frame).forEach((key) => {
+            expanded[COMPACT_KEYS[key] || key] = frame[key];
+        });
+        expanded.type = COMPACT_TYPES[frame.t] || frame.t;
+        return expanded;
+    }
+
     /**
      * ChatWidget Class
      */
@@ -55,7 +81,14 @@
         constructor(config = {}) {
             this.config = { ...DEFAULT_CONFIG, ...config };
             this.isOpen = this.config.defaultOpen;
-            this.messages = [...SAMPLE_MESSAGES];
+            this.messages = this.config.wsUrl ? [] : [...SAMPLE_MESSAGES];
+            this.ws = null;
+            this.pendingMessage = null;
+            this.streamingMessage = null;
+            this.streamingEl = null;
+            this.clientId = `user_${Date.now()}_${Math.random().toString(36).substr(2, 9)}`;
+            // Conversation id issued by the server in its replies; sent back to resume after reconnecting
+            this.sessionId = undefined;
             this.container = null;
             this.panel = null;
             this.toggleBtn = null;
@@ -287,6 +320,11 @@
             // Show typing indicator
             this.showTypingIndicator();
 
+            if (this.config.wsUrl) {
+                this.sendToServer(message);
+                return;
+            }
+
             // Simulate bot response
             setTimeout(() => {
                 this.hideTypingIndicator();
@@ -304,6 +342,108 @@
             }, 1000 + Math.random() * 1000);
         }
 
+        /**
+         * Send a message to the backend, connecting first if needed
+         */
+        sendToServer(text) {
+            const payload = JSON.stringify({
+                message: text,
+                session_id: this.sessionId,
+                timezone: Intl.DateTimeFormat().resolvedOptions().timeZone,
+                stream: true
+            });
+            if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+                this.ws.send(payload);
+                return;
+            }
+            this.pendingMessage = payload;
+            if (!this.ws || this.ws.readyState === WebSocket.CLOSED) {
+                this.connect();
+            }
+        }
+
+        /**
+         * Open the WebSocket (compact frames, no echo of messages we render locally)
+         */
+        connect() {
+            const tenantQuery = this.config.tenant ? `&tenant=${encodeURIComponent(this.config.tenant)}` : '';
+            this.ws = new WebSocket(`${this.config.wsUrl}${this.clientId}?protocol=compact&echo=0${tenantQuery}`);
+
+            this.ws.onopen = () => {
+                if (this.pendingMessage) {
+                    this.ws.send(this.pendingMessage);
+                    this.pendingMessage = null;
+                }
+            };
+
+            this.ws.onmessage = (event) => {
+                try {
+                    this.handleFrame(decodeFrame(event.data));
+                } catch (e) {
+                    console.error('ChatWidget: could not handle message', e);
+                }
+            };
+
+            this.ws.onclose = () => {
+                // Reconnect on the next message; an unanswered turn is over
+                this.ws = null;
+                this.streamingMessage = null;
+                this.hideTypingIndicator();
+            };
+        }
+
+        /**
+         * Apply one frame from the server
+         */
+        handleFrame(data) {
+            if (data.type === 'pong' || data.type === 'user') {
+                return;
+            }
+            if (data.type === 'typing' || data.type === 'queued') {
+                if (!this.messagesContainer.querySelector('.typing-indicator')) {
+                    this.showTypingIndicator();
+                }
+                return;
+            }
+            if (data.type === 'cancelled') {
+                this.streamingMessage = null;
+                this.hideTypingIndicator();
+                return;
+            }
+            if (data.type === 'error' && data.code === 'invalid_session') {
+                // The server no longer knows our conversation; the next message starts a new one
+                this.sessionId = undefined;
+            }
+            if (data.session_id) {
+                this.sessionId = data.session_id;
+            }
+
+            this.hideTypingIndicator();
+            if (data.type === 'assistant_delta' || (data.type === 'assistant_done' && this.streamingMessage)) {
+                if (!this.streamingMessage) {
+                    this.streamingMessage = { id: Date.now(), text: '', sender: 'bot', timestamp: new Date() };
+                    this.messages.push(this.streamingMessage);
+                    this.streamingEl = this.renderMessage(this.streamingMessage);
+                }
+                // Deltas append; assistant_done replaces the partial text with the full response
+                this.streamingMessage.text = data.type === 'assistant_delta'
+                    ? this.streamingMessage.text + data.message
+                    : data.message;
+                this.streamingEl.querySelector('p').textContent = this.streamingMessage.text;
+                if (data.type === 'assistant_done') {
+                    this.streamingMessage = null;
+                }
+                this.scrollToBottom();
+                return;
+            }
+
+            this.streamingMessage = null;
+            const botMessage = { id: Date.now(), text: data.message, sender: 'bot', timestamp: new Date() };
+            this.messages.push(botMessage);
+            this.renderMessage(botMessage);
+            this.scrollToBottom();
+        }
+
         /**
          * Render all messages
          */
@@ -339,6 +479,7 @@
             
             messageEl.appendChild(bubbleEl);
             this.messagesContainer.appendChild(messageEl);
+            return messageEl;
         }
 
         /**
@@ -403,6 +544,9 @@
          * Destroy the widget
          */
         destroy() {
+            if (this.ws) {
+                this.ws.close();
+            }
             if (this.container && this.container.parentNode) {
                 this.container.parentNode.removeChild(this.container);
             }